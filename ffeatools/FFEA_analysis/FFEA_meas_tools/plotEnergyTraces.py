@@ -37,9 +37,12 @@ except(ImportError):
 parser = _argparse.ArgumentParser(description="Test KE of blob against classical equipartition theorem")
 parser.add_argument("script", action="store", help="Input script file (.ffea).")
 
+def running_average(y):
+    return np.cumsum(y) / np.arange(1, len(y) + 1)
+
 def plotEnergyTraces(script):
 
-    meas = FFEA_measurement.FFEA_measurement(script.params.measurement_out_fname)
+    meas = FFEA_measurement.FFEA_measurement(script.params.measurement_out_fname, cache = True)
     top = [script.load_topology(i) for i in range(script.params.num_blobs)]
     
     # We need to plot a global measurement graph, and a graph for every blob
@@ -66,12 +69,9 @@ def plotEnergyTraces(script):
 	    fig, ax = plt.subplots()
 	    
 	    # And y axis data (all energies)
-	    ys = []
-	    yk = []
-	    for i in range(num_steps):
-		ys.append(np.mean(cmeas["StrainEnergy"][0:i + 1]) / kT)
-		if cmeas["KineticEnergy"] != None:
-		    yk.append(np.mean(cmeas["KineticEnergy"][0:i + 1]) / kT)
+	    ys = running_average(cmeas["StrainEnergy"]) / kT
+	    if cmeas["KineticEnergy"] is not None:
+		yk = running_average(cmeas["KineticEnergy"]) / kT
 	    
 	    print "\nGlobal System:\n"
 	    
@@ -81,7 +81,7 @@ def plotEnergyTraces(script):
 	    
 	    yserr = (np.fabs(ys[-1] - ysEXP[-1]) / ysEXP[-1]) * 100.0
 	    print "\tTheoretical strain energy = %f; Simulation strain energy = %f; Error is %f%%" % (ysEXP[-1], ys[-1], yserr) 
-	    if cmeas["KineticEnergy"] != None:
+	    if cmeas["KineticEnergy"] is not None:
 		ykEXP = [(3 * total_num_mass_nodes) / 2.0 for i in range(num_steps)]
 		ykh, = plt.loglog(x, yk, label='ykh')
 		ykEXPh, = plt.loglog(x, ykEXP, "-", label='ykEXPh')
@@ -100,7 +100,7 @@ def plotEnergyTraces(script):
 	    ax.set_title("Global Energy - Running Average")
 	    
 	    # Put details on the graph
-	    if cmeas["KineticEnergy"] != None:
+	    if cmeas["KineticEnergy"] is not None:
 		plt.legend([ysh, ysEXPh, ykh, ykEXPh], ['Global Strain Energy - Sim', 'Global Strain Energy - Theory', 'Global Kinetic Energy - Sim', 'Global Kinetic Energy - Theory'], loc = 4)
 	    else:
 		plt.legend([ysh, ysEXPh], ['Global Strain Energy - Sim', 'Global Strain Energy - Theory'], loc = 4)
@@ -147,12 +147,9 @@ def plotEnergyTraces(script):
         # Already got the x axis
     
         # And y axis data (all energies)
-        ys = []
-        yk = []
-        for j in range(num_steps):
-            ys.append(np.mean(cmeas["StrainEnergy"][0:j + 1]) / kT)
-            if cmeas["KineticEnergy"] != None:
-                yk.append(np.mean(cmeas["KineticEnergy"][0:j + 1]) / kT)
+        ys = running_average(cmeas["StrainEnergy"]) / kT
+        if cmeas["KineticEnergy"] is not None:
+            yk = running_average(cmeas["KineticEnergy"]) / kT
     
         print "\nBlob %d:\n" % (i)
         ysEXP = [(3 * num_nodes - 6) / 2.0 for j in range(num_steps)]
@@ -161,7 +158,7 @@ def plotEnergyTraces(script):
     
         yserr = (np.fabs(ys[-1] - ysEXP[-1]) / ysEXP[-1]) * 100.0
         print "\tTheoretical strain energy = %f; Simulation strain energy = %f; Error is %f%%" % (ysEXP[-1], ys[-1], yserr) 
-        if cmeas["KineticEnergy"] != None:
+        if cmeas["KineticEnergy"] is not None:
             ykEXP = [(3 * num_nodes) / 2.0 for j in range(num_steps)]
             ykh, = ax.loglog(x, yk, label='ykh')
             ykEXPh, = ax.loglog(x, ykEXP, "-", label='ykEXPh')
@@ -178,7 +175,7 @@ def plotEnergyTraces(script):
         ax.set_title("Blob %d Energy - Running Average" % (i))
     
         # Put details on the graph
-        if cmeas["KineticEnergy"] != None:
+        if cmeas["KineticEnergy"] is not None:
             ax.legend([ysh, ysEXPh, ykh, ykEXPh], ['Blob %d Strain Energy - Sim' % (i), 'Blob %d Strain Energy - Theory' % (i), 'Blob %d Kinetic Energy - Sim' % (i), 'Blob %d Kinetic Energy - Theory' % (i)], loc = 4)
         else:
             ax.legend([ysh, ysEXPh], ['Blob %d Strain Energy - Sim' % (i), 'Blob %d Strain Energy - Theory' % (i)], loc = 4)
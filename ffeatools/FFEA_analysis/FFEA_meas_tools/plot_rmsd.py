@@ -38,7 +38,7 @@ parser.add_argument("script", action="store", help="Input script file (.ffea).")
 
 def plot_rmsd(script):
 
-    meas = script.load_measurement()
+    meas = script.load_measurement(cache = True)
     top = [script.load_topology(i) for i in range(script.params.num_blobs)]
     
     # We need to plot a global measurement graph, and a graph for every blob
@@ -56,7 +56,7 @@ def plot_rmsd(script):
 	    plt.figure(0)
 	    
 	    # And y axis data (all energies)
-	    rmsd = global_meas["RMSD"] * 1e10
+	    rmsd = cmeas["RMSD"] * 1e10
 	    
 	    print "\nGlobal System:\n"
 	    
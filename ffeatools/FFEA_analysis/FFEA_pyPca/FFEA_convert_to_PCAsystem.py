@@ -45,32 +45,33 @@ def FFEA_convert_to_PCAsystem(infile, outfile, frames, bindex):
 			print("Default output file '" + outfile + "' already exists.\n")
 			raise IOError
 
-	# Get an input file
+	# Get an input file. Only the header is read, frames are streamed later
 	try:
 		if ext == ".ffea":
 			script = FFEA_script.FFEA_script(infile)
-			if frames == None:
-				traj = script.load_trajectory()
-			else:
-				traj = script.load_trajectory(int(frames))
-
-		elif ext == ".ftj":
-			if frames == None:
-				traj = FFEA_trajectory.FFEA_trajectory(infile)
-			else:
-				traj = FFEA_trajectory.FFEA_trajectory(infile, num_frames_to_read = int(frames))
+			traj = FFEA_trajectory.FFEA_trajectory(script.params.trajectory_out_fname, load_all = 0)
+
+		else:
+			traj = FFEA_trajectory.FFEA_trajectory(infile, load_all = 0)
 	except:
 		print("Could not read from input file.")
 		raise IOError
+
+	if frames != None:
+		frames = int(frames)
 	
-	# Make traj into a single blob traj
+	# Work with a single blob
 	while(True):
 		try:
-			if traj.blob[int(bindex)][0].motion_state != "DYNAMIC":
+			bindex = int(bindex)
+			if bindex < 0 or bindex >= traj.num_blobs:
+				raise IndexError
+
+			first = traj.get_frame(0, onlyNodes = True, blobs = [bindex])[0]
+			if first == None:
 				print("Selected a STATIC blob. Unable to process.")
 				raise IndexError
 
-			traj.set_single_blob(int(bindex))
 			break
 
 		except(IndexError):
@@ -81,17 +82,36 @@ def FFEA_convert_to_PCAsystem(infile, outfile, frames, bindex):
 				print("Could not read blob index")
 				raise IndexError
 
-	# Make the thing into a pdb
+	# Make the first frame into a pdb
+	single = FFEA_trajectory.FFEA_trajectory()
+	single.set_header(1, [1], [[first.num_nodes]])
+	single.blob[0][0].set_frame(first)
+	single.num_frames = 1
+
 	pdb = FFEA_pdb.FFEA_pdb("")
-	pdb.build_from_traj(traj)
+	pdb.build_from_traj(single)
 
 	# Write first frame to a file (for a PCA topology file)
 	base, ext = os.path.splitext(outfile)
 	outfilef0 = base + "_frame0" + ext
 	pdb.write_to_file(outfilef0, frames = [0,1])
 
-	# Now write whole lot to a file
-	pdb.write_to_file(outfile)
+	# Now write whole lot to a file, a frame at a time
+	print("Writing to " + outfile + "...")
+	fout = open(outfile, "w")
+	model = 0
+	for f in traj.iter_frames(stop = frames, blobs = [bindex], only_nodes = True):
+		if f[0] == None or f[0].conformation != 0:
+			continue
+
+		model += 1
+		f[0].pos = f[0].pos * 1e10
+		pdb.chain[0].frame[0] = f[0]
+		fout.write(pdb.write_model_to_text(0, model = model))
+
+	fout.write("END\n")
+	fout.close()
+	print("...done")
 
 	base, ext = os.path.splitext(infile)
 	if ext == ".ffea":
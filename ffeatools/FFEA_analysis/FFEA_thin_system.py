@@ -41,7 +41,9 @@ def thin_system(script_fname, frames_to_read, thin_percent):
     frames_to_read: the number of frames to read,
     thin_percent: percentage of the file to keep
     Retruns:
-    an FFEA trajectory object.
+    the script, an FFEA trajectory object holding only the header, an
+    iterator over the frames to keep (see FFEA_trajectory.iter_frames)
+    and the measurement object.
     """
     
     if thin_percent < 0 or thin_percent > 100:
@@ -58,16 +60,18 @@ def thin_system(script_fname, frames_to_read, thin_percent):
     script = FFEA_script.FFEA_script(script_fname)
     script.params.check *= frame_rate
 
-    traj = FFEA_trajectory.FFEA_trajectory(script.params.trajectory_out_fname, frame_rate = frame_rate, num_frames_to_read = frames_to_read)
+    # Frames are streamed, rather than all held in memory
+    traj = FFEA_trajectory.FFEA_trajectory(script.params.trajectory_out_fname, load_all = 0)
+    frames = traj.iter_frames(0, frames_to_read, frame_rate)
     meas = FFEA_measurement.FFEA_measurement(script.params.measurement_out_fname, frame_rate = frame_rate, num_frames_to_read = frames_to_read)
-    return script, traj, meas
+    return script, traj, frames, meas
     
 if sys.stdin.isatty() and hasattr(__builtin__, 'FFEA_API_mode') == False:
     args = parser.parse_args()
     # Get args and build objects
     if not os.path.exists(args.script_fname):
         raise IOError("Script file specified doesn't exist.")
-    out_script, out_traj, out_meas = thin_system(args.script_fname, args.frames_to_read, args.thin_percent, )
+    out_script, out_traj, out_frames, out_meas = thin_system(args.script_fname, args.frames_to_read, args.thin_percent, )
 
     # Get output_fnames and write out
     out_bfname = os.path.splitext(args.out_fname)[0]
@@ -90,7 +94,7 @@ if sys.stdin.isatty() and hasattr(__builtin__, 'FFEA_API_mode') == False:
 	out_tfname = out_bfname + "_" + str(index) + ".ftj"
 	index += 1
 
-    out_traj.write_to_file(out_tfname)
+    out_traj.write_frames_to_file(out_tfname, out_frames)
     out_meas.write_to_file(out_mfname)
 
     out_script.params.measurement_out_fname = out_mfname
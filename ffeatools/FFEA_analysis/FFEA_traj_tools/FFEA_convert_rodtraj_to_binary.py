@@ -0,0 +1,65 @@
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+
+import sys, os
+import FFEA_rod
+import argparse as _argparse
+import __builtin__
+
+# Set up argparse
+parser = _argparse.ArgumentParser(description="Convert an FFEA rod trajectory between the text (.rodtraj) and binary (.rodtrajb) formats")
+parser.add_argument("i", help="Input rod trajectory file (.rodtraj or .rodtrajb)")
+parser.add_argument("-o", action="store", nargs='?', help="Output filename")
+
+def FFEA_convert_rodtraj_to_binary(infile, outfile):
+
+	base, ext = os.path.splitext(infile)
+
+	if FFEA_rod.is_binary_rod_trajectory(infile):
+		if outfile == None:
+			outfile = base + ".rodtraj"
+
+		FFEA_rod.convert_binary_to_rodtraj(infile, outfile)
+
+	# Text to binary is streamed, one frame at a time
+	else:
+		if outfile == None:
+			outfile = base + ".rodtrajb"
+
+		FFEA_rod.convert_rodtraj_to_binary(infile, outfile)
+
+if sys.stdin.isatty() and hasattr(__builtin__, 'FFEA_API_mode') == False:
+	try:
+		args = parser.parse_args()
+	except:
+		somehelp = parser.format_help().split("\n", 1)[1]
+		print(somehelp)
+		sys.exit()
+
+	try:
+		FFEA_convert_rodtraj_to_binary(args.i, args.o)
+	except IOError:
+		parser.print_help()
+	except ValueError:
+		parser.print_help()
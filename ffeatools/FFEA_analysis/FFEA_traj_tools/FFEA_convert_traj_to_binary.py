@@ -0,0 +1,67 @@
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+import sys, os
+import FFEA_trajectory
+import argparse as _argparse
+import __builtin__
+
+# Set up argparse
+parser = _argparse.ArgumentParser(description="Convert an FFEA trajectory between the text (.ftj) and binary (.ftjb) formats")
+parser.add_argument("i", help="Input trajectory file (.ftj or .ftjb)")
+parser.add_argument("-o", action="store", nargs='?', help="Output filename")
+parser.add_argument("-p", action="store", default="double", choices=["double", "single"], help="Precision of the binary node data (default double, which is lossless)")
+
+def FFEA_convert_traj_to_binary(infile, outfile, precision="double"):
+
+	base, ext = os.path.splitext(infile)
+
+	# Binary back to text goes through a (memory mapped) trajectory object
+	if FFEA_trajectory.is_binary_trajectory(infile):
+		if outfile == None:
+			outfile = base + ".ftj"
+
+		traj = FFEA_trajectory.FFEA_trajectory(infile)
+		traj.write_to_file(outfile)
+	
+	# Text to binary is streamed, one frame at a time
+	else:
+		if outfile == None:
+			outfile = base + ".ftjb"
+
+		FFEA_trajectory.convert_ftj_to_binary(infile, outfile, precision=precision)
+
+if sys.stdin.isatty() and hasattr(__builtin__, 'FFEA_API_mode') == False:
+	try:
+		args = parser.parse_args()
+	except:
+		somehelp = parser.format_help().split("\n", 1)[1]
+		print(somehelp)
+		sys.exit()
+
+	try:
+		FFEA_convert_traj_to_binary(args.i, args.o, args.p)
+	except IOError:
+		parser.print_help()
+	except ValueError:
+		parser.print_help()
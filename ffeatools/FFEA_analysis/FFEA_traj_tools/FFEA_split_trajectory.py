@@ -50,19 +50,20 @@ def FFEA_split_trajectory(infile, outfile, start, end):
 		print("Error: start value greater than end value. Please reenter.")
 		raise ValueError
 
-	# Read only the amount of trajectory that we were asked for
+	# Read only the header. Frames are streamed straight to the new file
 	try:
-		traj = FFEA_trajectory.FFEA_trajectory(infile, num_frames_to_read = end - start, start = start)
+		traj = FFEA_trajectory.FFEA_trajectory(infile, load_all = 0)
 	except:
 		raise
 
-	if end - start != traj.num_frames:
+	num_frames = max(0, min(end, traj.get_num_frames_in_file()) - start)
+	if end - start != num_frames:
 		if sys.version_info[0] < 3:
 			inputter = raw_input
 		else:
 			inputter = input
 
-		ans = inputter("Number of frames within trajectory, %d, less than specified range, %d - %d. Is this ok (y/n)?: " % (traj.num_frames, start, end))
+		ans = inputter("Number of frames within trajectory, %d, less than specified range, %d - %d. Is this ok (y/n)?: " % (num_frames, start, end))
 	
 		try:
 			if str(ans).lower() == "n":
@@ -71,12 +72,12 @@ def FFEA_split_trajectory(infile, outfile, start, end):
 				raise ValueError
 		except:
 			print("Assuming 'y' was entered. Get ready for a new trajectory file!")
-			end = start + traj.num_frames
+			end = start + num_frames
 
 	if outfile == None:
 		outfile = base + "_extracted" + str(start) + "-" + str(end) + ".ftj"
 
-	traj.write_to_file(outfile)
+	traj.write_frames_to_file(outfile, traj.iter_frames(start, end))
 
 if sys.stdin.isatty() and hasattr(__builtin__, 'FFEA_API_mode') == False:
 	try:
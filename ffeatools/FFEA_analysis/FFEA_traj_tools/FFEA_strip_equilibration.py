@@ -31,7 +31,7 @@ def strip_equilibration(fname, limit, split=True):
 	# Args and load objects
 	script = FFEA_script.FFEA_script(fname)
 	eqlimit = float(limit) / 100.0
-	meas = script.load_measurement()
+	meas = script.load_measurement(cache = True)
 
 	print "FFEA_strip_trajectory.py"
 	print "\n\tScript that will calculate when you energies equilibrated (within the given limit) and split your simulation into the two phases"
@@ -125,8 +125,10 @@ def strip_equilibration(fname, limit, split=True):
 	# Meas (get a new one to write out the equilibration stuff too)
 	#
 	eqmeas = FFEA_measurement.FFEA_measurement()
-	eqmeas.time = meas.time
-	eqmeas.date = meas.date
+	eqmeas.detail_string = meas.detail_string
+	eqmeas.param_string = meas.param_string
+	eqmeas.num_frames = eqat
+	meas.num_frames = new_num_frames
 	eqmeas.simtype = "Equilibration"
 
 	for i in range(script.params.num_blobs):
@@ -22,50 +22,54 @@
 #
 
 import sys, os
-import FFEA_script
+import argparse
+import FFEA_script, FFEA_node, FFEA_kinetic_map
 
-if len(sys.argv) != 6:
-	sys.exit("Usage: python FFEA_generate_kinetic_maps.py [INPUT .ffea file] [Blob index 1] [Conformation Index 1] [Blob index 2] [Conformation Index 2]\n")
+parser = argparse.ArgumentParser(description = "Make the kinetic maps, both ways, between two conformations in an FFEA script")
+parser.add_argument("infname", help = "Input .ffea file")
+parser.add_argument("bindex1", type = int, help = "Blob index 1")
+parser.add_argument("cindex1", type = int, help = "Conformation index 1")
+parser.add_argument("bindex2", type = int, help = "Blob index 2")
+parser.add_argument("cindex2", type = int, help = "Conformation index 2")
+parser.add_argument("--overlap", action = "store_true", help = "Overlap the structures interactively (FFEA_make_structures_overlap.py) before mapping")
+parser.add_argument("--no_centre", action = "store_true", help = "Map the structures where they are, rather than with both centroids at the origin")
+parser.add_argument("--limit", type = float, default = 1e-5, help = "Leave out weights whose absolute value is no more than this (default 1e-5)")
+parser.add_argument("--procs", type = int, default = 2, help = "Number of processes; the two directions run in parallel if this is 2 (default)")
+parser.add_argument("--binary", action = "store_true", help = "Write binary sparse maps (.mapb). FFEA itself reads only text maps")
+
+args = parser.parse_args()
 
 # Get args
-infname = sys.argv[1]
-bindex = [int(sys.argv[2]), int(sys.argv[4])]
-cindex = [int(sys.argv[3]), int(sys.argv[5])]
+infname = args.infname
+bindex = [args.bindex1, args.bindex2]
+cindex = [args.cindex1, args.cindex2]
 
 scriptdir = os.path.dirname(os.path.abspath(sys.argv[0]))
-ffeadir = os.path.dirname(os.path.abspath(infname))
 
 # Get a script and the needed files from it
 script = FFEA_script.FFEA_script(infname)
+node = [script.load_node(bindex[i], cindex[i]) for i in range(2)]
+top = [script.load_topology(bindex[i], cindex[i]) for i in range(2)]
 
-# Make the structures overlap
-os.system("python " + scriptdir + "/FFEA_make_structures_overlap.py " + infname + " " + str(bindex[0]) + " " + str(cindex[0]) + " " + str(bindex[1]) + " " + str(cindex[1]))
-
-# Make the maps!
-basenode = ffeadir + "/blob0_overlap.node"
-targetnode = ffeadir + "/blob1_overlap.node"
-basenode = "blob0_overlap.node"
-targetnode = "blob1_overlap.node"
-basetop = script.blob[bindex[0]].conformation[cindex[0]].topology
-targettop = script.blob[bindex[1]].conformation[cindex[1]].topology
-
-basetotargetmap = infname.split(".")[0] + "_b" + str(bindex[0]) + "c" + str(cindex[0]) + "to" + "b" + str(bindex[1]) + "c" + str(cindex[1]) + ".map"
-targettobasemap = infname.split(".")[0] + "_b" + str(bindex[1]) + "c" + str(cindex[1]) + "to" + "b" + str(bindex[0]) + "c" + str(cindex[0]) + ".map"
-
-#basetotargetsparsemap = basetotargetmap.split(".")[0] + "_sparse.map"
-#targettobasesparsemap = targettobasemap.split(".")[0] + "_sparse.map"
+# Make the structures overlap. That script writes its results to the working directory
+if args.overlap:
+	os.system("python " + scriptdir + "/FFEA_make_structures_overlap.py " + infname + " " + str(bindex[0]) + " " + str(cindex[0]) + " " + str(bindex[1]) + " " + str(cindex[1]))
+	node = [FFEA_node.FFEA_node("blob0_overlap.node"), FFEA_node.FFEA_node("blob1_overlap.node")]
 
-os.system(scriptdir + "/make_structure_map -i " + basenode + " -t " + basetop + " -o " + targetnode + " -m " + basetotargetmap)
-os.system(scriptdir + "/make_structure_map -i " + targetnode + " -t " + targettop + " -o " + basenode + " -m " + targettobasemap)
+# As make_structure_map did, map with both centroids at the origin
+pos = [n.pos for n in node]
+if not args.no_centre:
+	pos = [p - p.mean(axis = 0) for p in pos]
 
-# Make them sparse
-#os.system("python " + scriptdir + "/FFEA_convert_kinetic_map_to_sparse.py " + basetotargetmap + " " + basetotargetsparsemap)
-#os.system("python " + scriptdir + "/FFEA_convert_kinetic_map_to_sparse.py " + targettobasemap + " " + targettobasesparsemap)
+# Make the maps!
+ext = ".mapb" if args.binary else ".map"
+basetotargetmap = infname.split(".")[0] + "_b" + str(bindex[0]) + "c" + str(cindex[0]) + "to" + "b" + str(bindex[1]) + "c" + str(cindex[1]) + ext
+targettobasemap = infname.split(".")[0] + "_b" + str(bindex[1]) + "c" + str(cindex[1]) + "to" + "b" + str(bindex[0]) + "c" + str(cindex[0]) + ext
 
-# Remove the unneeded stuff
-#os.system("rm " + basenode + " " + targetnode + " " + basetotargetmap + " " + targettobasemap)
-#os.system("rm " + basetotargetmap + " " + targettobasemap)
-#os.system("rm " + basenode + " " + targetnode)
+print("Building maps...")
+basetotarget, targettobase = FFEA_kinetic_map.build_kinetic_maps(pos[0], top[0], pos[1], top[1], limit = args.limit, num_procs = args.procs)
+basetotarget.write_to_file(basetotargetmap)
+targettobase.write_to_file(targettobasemap)
 
 # Finalise
 print("Maps created:")
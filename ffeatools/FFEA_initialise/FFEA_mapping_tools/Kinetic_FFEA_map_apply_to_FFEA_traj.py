@@ -23,10 +23,10 @@
 
 import sys, os, copy
 import numpy as np
-import FFEA_trajectory, FFEA_kinetic_map, FFEA_pdb
+import FFEA_trajectory, FFEA_kinetic_map, FFEA_pdb, FFEA_frame
 
 if len(sys.argv) < 4:
-	sys.exit("Usage: python " + os.path.basename(os.path.abspath(sys.argv[0])) + " [INPUT traj fname (.ftj)] [OUTPUT traj fname (.ftj/.pdb)] [INPUT ffea .map fname] [INPUT topology .pdb]\n")
+	sys.exit("Usage: python " + os.path.basename(os.path.abspath(sys.argv[0])) + " [INPUT traj fname (.ftj)] [OUTPUT traj fname (.ftj/.pdb)] [INPUT ffea .map fname] [INPUT topology .pdb] [NUM frames to read] [NUM frames per batch]\n")
 
 # Get args
 intraj = sys.argv[1]
@@ -41,6 +41,11 @@ num_frames_to_read = 100000
 if len(sys.argv) > 5:
 	num_frames_to_read = int(sys.argv[5])
 
+# Frames are read, and mapped, this many at a time
+batch_size = 100
+if len(sys.argv) > 6:
+	batch_size = int(sys.argv[6])
+
 # Test files
 base, ext = os.path.splitext(outtraj)
 if ext == ".pdb":
@@ -51,8 +56,8 @@ if ext == ".pdb":
 		
 	pdbtop = FFEA_pdb.FFEA_pdb(intop)
 
-# Get nodes
-traj = FFEA_trajectory.FFEA_trajectory(intraj, num_frames_to_read = num_frames_to_read)
+# Get nodes. Only the header is read, frames are streamed through the map
+traj = FFEA_trajectory.FFEA_trajectory(intraj, load_all = 0)
 
 # Get map
 kinetic_map = FFEA_kinetic_map.FFEA_kinetic_map(inmap)
@@ -62,58 +67,30 @@ if intop != "":
 	if kinetic_map.num_rows != sum(pdbtop.num_atoms):
 		sys.exit("Error. Provided topology has %d atoms. Map expects %d target atoms." % (pdbtop.chain[0].num_atoms, kinetic_map.num_rows))
 
-	#if kinetic_map.num_rows != pdbtop.blob[0].num_atoms and kinetic_map.num_rows != sum(pdbtop.num_atoms):
-	#	sys.exit("Error. Provided topology has %d atoms. Map expects %d target atoms." % (pdbtop.blob[0].num_atoms, kinetic_map.num_rows))
-
 # Apply matrix to all possible blobs!
-output_nodes = []   # output_nodes[blob][frame][pos]
-for b in traj.blob:
-	if b[0].num_nodes == kinetic_map.num_columns:
-	
-		print("Applying to blob " + str(traj.blob.index(b)))
-		output_nodes.append([])
-		count = 0
-		for f in b[0].frame:
-		
-			output_nodes[-1].append(kinetic_map.apply_sparse(f))
-			count += 1
-			sys.stdout.write("\r\t%d frames made out of %d" % (count, len(b[0].frame)))
-			sys.stdout.flush()
-		print("\n")
+blobs = [i for i in range(traj.num_blobs) if traj.num_nodes[i][0] == kinetic_map.num_columns]
+for i in blobs:
+	print("Applying to blob " + str(i))
+
+def map_frames():
+	"""
+	Map the trajectory a batch of frames at a time, each blob's batch in
+	a single sparse x dense product.
+	Yields a list of mapped frames, one per mapped blob (None for a blob
+	that is STATIC in that frame).
+	"""
+	count = 0
+	for batch in traj.iter_frames(stop = num_frames_to_read, blobs = blobs, only_nodes = True, batch_size = batch_size):
+		mapped = [kinetic_map.apply_to_frames([frames[i] for frames in batch]) for i in range(len(blobs))]
+		for j in range(len(batch)):
+			yield [m[j] for m in mapped]
+
+		count += len(batch)
+		sys.stdout.write("\r\t%d frames made" % (count))
+		sys.stdout.flush()
+	print("\n")
 			
 # Print to file
-
-#if ext == ".pdb":
-#
-#	# We'll have to use the original pdb as a template. Make as many pdb blobs as necessary
-#	outpdb = FFEA_pdb.FFEA_pdb("")
-#	
-#	bindex = -1
-#	for bnodes in output_nodes:
-#	
-#		bindex += 1
-#
-#		# Add new blob
-#		outpdb.add_empty_blob()
-#		
-#		# Populate with atoms
-#		#for blob in pdbtop.blob:
-#			#outpdb.blob[-1].atom = outpdb.blob[-1].atom + blob.atom #smush any sub-regions of PDBs together
-#		outpdb.blob[bindex].atom = pdbtop.blob[bindex].atom
-#		#print blob.atom.chain, outpdb.blob[-1].atom.chain
-#
-#		outpdb.blob[bindex].num_atoms = len(outpdb.blob[bindex].atom)
-#
-#		# Now add frames
-#		for f in bnodes:
-#			outpdb.blob[bindex].frame.append(FFEA_pdb.FFEA_pdb_frame())
-#			outpdb.blob[bindex].frame[-1].pos = f * 1e10
-#			#print outpdb.blob[-1].frame[-1].pos
-#			outpdb.blob[bindex].num_frames += 1
-#	
-#	outpdb.num_frames = outpdb.blob[-1].num_frames
-#	outpdb.write_to_file(outtraj)
-
 if ext == ".pdb":
 	
 	# We'll have to use the original pdb as a template. Make as many pdb blobs as necessary
@@ -121,73 +98,40 @@ if ext == ".pdb":
 	outpdb.clear_position_data()
 
 	# We need a copy for every blob in FFEA_traj
-	num_blobs = len(output_nodes)
+	num_blobs = len(blobs)
 	outpdb.num_chains *= num_blobs
 	outpdb.num_atoms.extend(copy.copy(outpdb.num_atoms))
 	outpdb.chain.extend(copy.deepcopy(outpdb.chain))
+	outpdb.add_empty_frame()
+
+	print("Writing to " + outtraj + "...")
+	fout = open(outtraj, "w")
+	findex = 0
+	for mapped in map_frames():
+		for i in range(num_blobs):
+
+			# A STATIC frame has no positions, so the blob's chains keep their last ones
+			if mapped[i] == None:
+				continue
+
+			startchain = i * (outpdb.num_chains / num_blobs)
+			endchain = (i + 1) * (outpdb.num_chains / num_blobs)
 
-#	for bnodes in output_nodes:
-#
-#		findex = -1
-#		for f in bnodes:
-#			findex += 1
-#			end = 0
-#			for i in range(outpdb.num_chains):
-#				start = end
-#				end = start + outpdb.num_atoms[i]
-#				outpdb.chain[i].add_empty_frame()
-#				outpdb.chain[i].frame[findex].pos = f[start:end] * 1e10
-
-
-	for i in range(num_blobs):
-		bnodes = output_nodes[i]
-		startchain = i * (outpdb.num_chains / num_blobs)
-		endchain = (i + 1) * (outpdb.num_chains / num_blobs)
-
-		findex = 0
-		for f in bnodes:
 			endatom = 0
 			for j in range(startchain, endchain):
 				startatom = endatom
 				endatom = startatom + outpdb.num_atoms[j]
-				outpdb.chain[j].add_empty_frame()
-				outpdb.chain[j].frame[findex].pos = f[startatom:endatom] * 1e10
-			findex += 1
+				outpdb.chain[j].frame[0].pos = mapped[i].pos[startatom:endatom] * 1e10
 
-	#for i in range(outpdb.num_chains):
-#		for bnodes in output_nodes:
-			
-	outpdb.num_frames = outpdb.chain[i].num_frames
-	outpdb.write_to_file(outtraj)
-
-	# Now simply change the positions using the new mapped ones
-	#bindex = -1
-	#for bnodes in output_nodes:
-	#	bindex += 1
-	#	for f in bnodes:
-
-	#		end = 0
-	#		for pdbb in outpdb.blob:
-	#			start = end
-	#			end = start + pdbb.num_atoms
-	#			pdbb.frame.append(FFEA_pdb.FFEA_pdb_frame())
-	#			pdbb.frame[-1].pos = f[start:end] * 1e10
-	
-	#outpdb.num_frames = len(bnodes[0])
-	#outpdb.write_to_file(outtraj)
+		findex += 1
+		fout.write(outpdb.write_model_to_text(0, model = findex))
+
+	fout.write("END\n")
+	fout.close()
 		
 elif ext == ".ftj":
 		
-	# Build a trajectory object with some blobs and the right number of nodes and what not
-	# Input trajectory is spot on except for the number of nodes on each blob. Lets fix that
-	num_frames = len(output_nodes[0])
-	traj.num_frames = num_frames
-	for i in range(traj.num_blobs):
-		traj.num_nodes[i][0] = len(output_nodes[i])
-		traj.blob[i][0].num_nodes = len(output_nodes[i])
-
-		traj.blob[i][0].frame = traj.blob[i][0].frame[:num_frames]
-		for j in range(num_frames):
-			traj.blob[i][0].frame[j].pos = np.array(output_nodes[i][j])
-
-	traj.write_to_file(outtraj)
+	# The output has the mapped blobs only, each with the number of nodes of the target structure
+	outtrajobj = FFEA_trajectory.FFEA_trajectory()
+	outtrajobj.set_header(len(blobs), [1 for i in blobs], [[kinetic_map.num_rows] for i in blobs])
+	outtrajobj.write_frames_to_file(outtraj, map_frames())
@@ -58,10 +58,10 @@ if os.path.splitext(out_traj)[1] == ".out":
 	fout.write("*\n")
 
 	for i in range(num_frames):
-		f = output_nodes[i] * scale
+		f = np.zeros([num_nodes, 10])
+		f[:,0:3] = output_nodes[i] * scale
 		fout.write("Blob 0, Conformation 0, step %d\nDYNAMIC\n" % (i))
-		for j in range(num_nodes):
-			fout.write("%8.6e %8.6e %8.6e %8.6e %8.6e %8.6e %8.6e %8.6e %8.6e %8.6e\n" % (f[j][0], f[j][1], f[j][2], 0, 0, 0, 0, 0, 0, 0))
+		np.savetxt(fout, f, fmt = "%8.6e")
 		fout.write("*\n")
 		fout.write("Conformation Changes:\nBlob 0: Conformation 0 -> Conformation 0\n*\n")
 
@@ -70,8 +70,10 @@ elif os.path.splitext(out_traj)[1] == ".pdb":
 	#for i in range(num_frames):
 	#	fout.write("MODEL      %d" % ())
 	for i in range(num_frames):
-		for j in range(num_nodes):
-			input_atoms.blob[0].frame[i].pos[j] = output_nodes[i][j]
+		start = 0
+		for c in input_atoms.chain:
+			c.frame[i].pos = output_nodes[i][start:start + c.num_atoms]
+			start += c.num_atoms
 			
 	input_atoms.write_to_file(out_traj)
 fout.close()
\ No newline at end of file
@@ -15,7 +15,7 @@ limitations under the License.
 """
 
 import numpy as np
-from scipy.spatial.distance import cdist
+from scipy.spatial import cKDTree
 
 def best_fit_transform(A, B):
     '''
@@ -57,23 +57,70 @@ def best_fit_transform(A, B):
 
     return T, R, t
 
-def nearest_neighbor(src, dst):
+def best_fit_transform_batch(A, B):
+    '''
+    Same as best_fit_transform, for a stack of point sets at once
+    Input:
+      A: CxNx3 numpy array of corresponding 3D points
+      B: CxNx3 numpy array of corresponding 3D points
+    Returns:
+      R: Cx3x3 rotation matrices
+      t: Cx3 translations
+    '''
+
+    centroid_A = np.mean(A, axis=1)
+    centroid_B = np.mean(B, axis=1)
+    H = np.einsum('cni,cnj->cij', A - centroid_A[:,np.newaxis], B - centroid_B[:,np.newaxis])
+    U, S, Vt = np.linalg.svd(H)
+
+    # special reflection case
+    V = np.swapaxes(Vt, 1, 2)
+    Ut = np.swapaxes(U, 1, 2)
+    V[:,:,2] *= np.sign(np.linalg.det(np.matmul(V, Ut)))[:,np.newaxis]
+    R = np.matmul(V, Ut)
+
+    t = centroid_B - np.einsum('cij,cj->ci', R, centroid_A)
+    return R, t
+
+def build_tree(points):
+    '''
+    Build a spatial index (a k-d tree) over a fixed set of points. Build it
+    once and pass it to icp / icp_multi, and every iteration of every run
+    searches it without rebuilding anything.
+    Input:
+        points: Nx3 array of points
+    Output:
+        the tree
+    '''
+    return cKDTree(points)
+
+def query_tree(tree, points, num_threads=1):
+    '''
+    Find the nearest point in the tree to each of the points, using
+    num_threads threads (-1 for all of them).
+    '''
+    try:
+        return tree.query(points, workers=num_threads)
+    except TypeError:
+        # scipy < 1.6
+        return tree.query(points, n_jobs=num_threads)
+
+def nearest_neighbor(src, dst, num_threads=1):
     '''
     Find the nearest (Euclidean) neighbor in dst for each point in src
     Input:
         src: Nx3 array of points
-        dst: Nx3 array of points
+        dst: Nx3 array of points, or a tree from build_tree
     Output:
         distances: Euclidean distances of the nearest neighbor
         indices: dst indices of the nearest neighbor
     '''
 
-    all_dists = cdist(src, dst, 'euclidean')
-    indices = all_dists.argmin(axis=1)
-    distances = all_dists[np.arange(all_dists.shape[0]), indices]
-    return distances, indices
+    if not isinstance(dst, cKDTree):
+        dst = build_tree(dst)
+    return query_tree(dst, src, num_threads)
 
-def icp(A, B, init_pose=None, max_iterations=20, tolerance=0.001):
+def icp(A, B, init_pose=None, max_iterations=20, tolerance=0.001, tree=None, target_error=None, num_threads=1):
     '''
     The Iterative Closest Point method
     Input:
@@ -82,40 +129,74 @@ def icp(A, B, init_pose=None, max_iterations=20, tolerance=0.001):
         init_pose: 4x4 homogeneous transformation
         max_iterations: exit algorithm after max_iterations
         tolerance: convergence criteria
+        tree: a tree built over B by build_tree, to save building it again
+        target_error: also exit as soon as the mean error is this small
+        num_threads: threads for the nearest neighbour search
     Output:
         T: final homogeneous transformation
         distances: Euclidean distances (errors) of the nearest neighbor
     '''
 
-    # make points homogeneous, copy them so as to maintain the originals
-    src = np.ones((4,A.shape[0]))
-    dst = np.ones((4,B.shape[0]))
-    src[0:3,:] = np.copy(A.T)
-    dst[0:3,:] = np.copy(B.T)
+    T, distances = icp_multi(A, B, [init_pose if init_pose is not None else np.identity(4)], max_iterations=max_iterations, tolerance=tolerance, tree=tree, target_error=target_error, num_threads=num_threads)
+    return T[0], distances[0]
 
-    # apply the initial pose estimation
-    if init_pose is not None:
-        src = np.dot(init_pose, src)
+def icp_multi(A, B, init_poses, max_iterations=20, tolerance=0.001, tree=None, target_error=None, num_threads=1):
+    '''
+    The Iterative Closest Point method, run from several starting poses at
+    once. Every iteration searches for the nearest neighbours of all the runs
+    still going in one query, and runs drop out as they converge.
+    Input:
+        A: Nx3 numpy array of source 3D points
+        B: Nx3 numpy array of destination 3D point
+        init_poses: list of 4x4 homogeneous transformations, one for each run
+        (everything else is the same as icp)
+    Output:
+        T: list of final homogeneous transformations, one for each run
+        distances: Euclidean distances (errors) of the nearest neighbor, for
+        each run
+    '''
 
-    prev_error = 0
+    A = np.asarray(A, dtype=float)
+    B = np.asarray(B, dtype=float)
+    init_poses = np.asarray(init_poses, dtype=float)
+    if tree is None:
+        tree = build_tree(B)
+
+    # apply the initial pose estimations
+    src = np.einsum('cij,nj->cni', init_poses[:,0:3,0:3], A) + init_poses[:,np.newaxis,0:3,3]
+
+    num_runs, num_points = src.shape[0], src.shape[1]
+    distances = np.zeros([num_runs, num_points])
+    prev_error = np.zeros(num_runs)
+    running = np.arange(num_runs)
 
     for i in range(max_iterations):
-        # find the nearest neighbours between the current source and destination points
-        distances, indices = nearest_neighbor(src[0:3,:].T, dst[0:3,:].T)
+        if len(running) == 0:
+            break
 
-        # compute the transformation between the current source and nearest destination points
-        T,_,_ = best_fit_transform(src[0:3,:].T, dst[0:3,indices].T)
+        # find the nearest neighbours between the current source and destination points
+        dist, indices = query_tree(tree, src[running].reshape(-1, 3), num_threads)
+        dist = dist.reshape(len(running), num_points)
+        distances[running] = dist
 
-        # update the current source
-        src = np.dot(T, src)
+        # compute the transformation between the current source and nearest destination points,
+        # and update the current source
+        R, t = best_fit_transform_batch(src[running], B[indices.reshape(len(running), num_points)])
+        src[running] = np.einsum('cij,cnj->cni', R, src[running]) + t[:,np.newaxis]
 
         # check error
-        mean_error = np.sum(distances) / distances.size
-        if abs(prev_error-mean_error) < tolerance:
-            break
-        prev_error = mean_error
-
-    # calculate final transformation
-    T,_,_ = best_fit_transform(A, src[0:3,:].T)
+        mean_error = np.mean(dist, axis=1)
+        converged = np.abs(prev_error[running] - mean_error) < tolerance
+        if target_error is not None:
+            converged |= mean_error <= target_error
+        prev_error[running] = mean_error
+        running = running[~converged]
+
+    # calculate final transformations
+    R, t = best_fit_transform_batch(np.broadcast_to(A, src.shape), src)
+    T = np.zeros([num_runs, 4, 4])
+    T[:,0:3,0:3] = R
+    T[:,0:3,3] = t
+    T[:,3,3] = 1
 
     return T, distances
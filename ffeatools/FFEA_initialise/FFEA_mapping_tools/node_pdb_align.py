@@ -33,6 +33,11 @@ parser.add_argument("pdb", action="store", type=str, help="PDB file to align the
 parser.add_argument("--node", dest='node', action="store_true", default=False, help="Add this flag to load and align a node file (for alignment before you run your simulation).") #args.o
 parser.add_argument("--traj", dest='traj', action="store_true", default=False, help="Add this flag to load and align a trajectory file (for if you've already run the simulation).") #args.o
 parser.add_argument("--no_save", action="store_true", dest='no_save', default=False, help="Do not modify the FFEA files. This will only print the rotation matrix.")
+parser.add_argument("--threads", action="store", dest='threads', type=int, default=1, help="Number of threads to search for the nearest atoms with (-1 to use all of them). The default is 1.")
+parser.add_argument("--procs", action="store", dest='procs', type=int, default=1, help="Number of processes to run the candidates in. The default is 1.")
+parser.add_argument("--seed", action="store", dest='seed', type=int, default=None, help="Seed for the random starting rotations, to make the alignment reproducible.")
+parser.add_argument("--target_rmsd", action="store", dest='target_rmsd', type=float, default=None, help="Stop as soon as a candidate gets an RMSD this low, instead of running all of them.")
+parser.add_argument("--top", action="store", dest='top', type=int, default=1, help="Print this many of the best candidates. The best one is always the one applied.")
 
 def rot_euler(v, xyz):
     ''' Rotate vector v (or array of vectors) by the euler angles xyz '''
@@ -41,6 +46,16 @@ def rot_euler(v, xyz):
         v = np.dot(np.array(v), expm(np.cross(np.eye(3), axis*-theta)))
     return v
 
+def euler_to_4x4(xyz, centre=np.zeros(3)):
+    """
+    Get the 4x4 transformation matrix that rotates points about centre by the
+    euler angles xyz, the same way rot_euler does.
+    """
+    T = np.identity(4)
+    T[0:3,0:3] = rot_euler(np.identity(3), xyz).T
+    T[0:3,3] = centre - np.dot(T[0:3,0:3], centre)
+    return T
+
 def align_centroid(node_object, pdb_object):
     """
     Extract the positional daat from the two objects. Create a centroid for the
@@ -98,24 +113,84 @@ def align_traj_frame(traj_frame, node_centroid, T):
     traj_frame.pos = apply_transformation_4x4(traj_frame.pos, T)
     traj_frame.pos = traj_frame.pos/scale_factor
     
-def fit_from_candidates(node_array, pdb_array, max_iterations, req_tolerance, num_candidates):
+def get_candidate_rotations(num_candidates, seed=None):
+    """
+    Get the random euler angles that each candidate starts from. The same
+    seed always gives the same rotations.
+    """
+    return np.random.RandomState(seed).uniform(0, 2*np.pi, size=[num_candidates, 3])
+
+def init_candidate_worker(node_array, pdb_array, max_iterations, req_tolerance, target_rmsd, num_threads):
+    """
+    Set up a process to run candidates in. The k-d tree over the PDB atoms is
+    built once per process and reused for every candidate it runs.
+    """
+    global candidate_worker
+    candidate_worker = dict(node_array=node_array, pdb_array=pdb_array, tree=icp.build_tree(pdb_array), centroid=np.mean(node_array, axis=0), max_iterations=max_iterations, req_tolerance=req_tolerance, target_rmsd=target_rmsd, num_threads=num_threads)
+
+def run_candidates(candidates):
+    """
+    Run ICP from a batch of candidates, all at once.
+    In: a list of (index, euler angles) pairs.
+    Out: a list of (rmsd, index, transformation, euler angles), where the
+    rmsd is the mean distance from each node to the nearest atom.
+    """
+    w = candidate_worker
+    init_poses = [euler_to_4x4(XYZ, w["centroid"]) for index, XYZ in candidates]
+    T, distances = icp.icp_multi(w["node_array"], w["pdb_array"], init_poses, max_iterations=w["max_iterations"], tolerance=w["req_tolerance"], tree=w["tree"], target_error=w["target_rmsd"], num_threads=w["num_threads"])
+    return [(np.average(distances[i]), index, T[i], list(XYZ)) for i, (index, XYZ) in enumerate(candidates)]
+
+def find_candidates(node_array, pdb_array, max_iterations, req_tolerance, num_candidates, num_threads=1, num_procs=1, seed=None, target_rmsd=None, top_k=1, batch_size=None):
     """
     This program uses an ICP (iterative closest point) algorithm to get a
     transformation matrix that will align the FFEA structure to a PDB. However,
     this algorithm tends to get stuck in local minima. This function will
-    randomly rotate the FFEA structure and run the algorithm, and output
-    the rotation and the following translation for the result with the lowest
-    RMSD.
+    randomly rotate the FFEA structure (about its centroid) and run the
+    algorithm from each rotation. The transformations found include the
+    rotation, so they can be applied to the FFEA structure on their own.
+    The candidates are run in batches (which search the k-d tree over the PDB
+    atoms together), and the batches are spread over num_procs processes.
+    Progress is printed as each batch finishes. Once a candidate gets within
+    target_rmsd, no more batches are started.
+    Returns: the best top_k results, lowest RMSD first, as a list of
+    (rmsd, [transformation, euler angles]).
     """
-    candidates= {}
-    for candidate in range(num_candidates):
-        print_progress_bar("Finding optimal alignment", num_candidates, candidate)
-        temp_node_array = copy.copy(node_array)
-        XYZ = [random.random()*2*np.pi, random.random()*2*np.pi, random.random()*2*np.pi]
-        rot_euler(temp_node_array, XYZ)
-        T, distances = icp.icp(temp_node_array, pdb_array, max_iterations=max_iterations, tolerance=req_tolerance)
-        candidates[np.average(distances)] = [T, XYZ]
-    return min(candidates.items())
+    rotations = get_candidate_rotations(num_candidates, seed)
+    if batch_size is None:
+        batch_size = max(1, int(np.ceil(num_candidates/(4.0*num_procs))))
+    batches = [list(zip(range(start, min(start+batch_size, num_candidates)), rotations[start:start+batch_size])) for start in range(0, num_candidates, batch_size)]
+    init_args = (node_array, pdb_array, max_iterations, req_tolerance, target_rmsd, num_threads)
+
+    if num_procs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(num_procs, init_candidate_worker, init_args)
+        batch_results = pool.imap_unordered(run_candidates, batches)
+    else:
+        init_candidate_worker(*init_args)
+        batch_results = (run_candidates(batch) for batch in batches)
+
+    results = []
+    try:
+        for batch_result in batch_results:
+            results += batch_result
+            print_progress_bar("Finding optimal alignment", num_candidates, len(results))
+            if target_rmsd is not None and min(results)[0] <= target_rmsd:
+                print("\nFound a candidate within the target RMSD, stopping early.")
+                break
+    finally:
+        if num_procs > 1:
+            pool.terminate()
+            pool.join()
+
+    # Sorting on the index too keeps equal RMSDs in a fixed order
+    results.sort(key=lambda result: (result[0], result[1]))
+    return [(rmsd, [T, XYZ]) for rmsd, index, T, XYZ in results[:top_k]]
+
+def fit_from_candidates(node_array, pdb_array, max_iterations, req_tolerance, num_candidates, num_threads=1, num_procs=1, seed=None, target_rmsd=None):
+    """
+    Same as find_candidates, but only returns the best result.
+    """
+    return find_candidates(node_array, pdb_array, max_iterations, req_tolerance, num_candidates, num_threads=num_threads, num_procs=num_procs, seed=seed, target_rmsd=target_rmsd)[0]
 
 def print_progress_bar(start_text, num_iterations, num_done):
     """
@@ -125,31 +200,48 @@ def print_progress_bar(start_text, num_iterations, num_done):
         rows, cols = os.popen('stty size', 'r').read().split()
         cols = int(cols)
     except ValueError:
-        cols = 80, 80
+        cols = 80
+    
+    def text_len(text):
+        try:
+            return len(text.decode('utf-8'))
+        except AttributeError:
+            return len(text) # python 3 strings are already unicode
         
     ratio_done = float(num_done)/float(num_iterations)
     str_done = str(num_done)+"/"+str(num_iterations)+" "
     textstr = start_text+" ["
-    bar_length= cols-len(textstr.decode('utf-8')+"]")-len(str_done.decode('utf-8'))
+    bar_length= cols-text_len(textstr+"]")-text_len(str_done)
     blank_chars = "▒"*int((bar_length*(1-ratio_done)))
     filled_chars = "█"*int((bar_length*(ratio_done)))
     spacer = ""
     str_to_write = "\r"+textstr+filled_chars+blank_chars+"] "+str_done
     
-    if len(str_to_write.decode('utf-8')) > cols:
-        blank_char_num_new = int((bar_length*(1-ratio_done)))-(len(str_to_write.decode('utf-8'))-cols)
+    if text_len(str_to_write) > cols:
+        blank_char_num_new = int((bar_length*(1-ratio_done)))-(text_len(str_to_write)-cols)
         blank_chars = "▒"*blank_char_num_new
         str_to_write = "\r"+textstr+filled_chars+blank_chars+"] "+str_done
         
-    if len(str_to_write.decode('utf-8')) < cols:
-        spacer = " "*(cols-len(str_to_write.decode('utf-8')))
+    if text_len(str_to_write) < cols:
+        spacer = " "*(cols-text_len(str_to_write))
         
-    if len(str_to_write.decode('utf-8')) != cols:
+    if text_len(str_to_write+spacer) != cols:
         return
 
     sys.stdout.write(str_to_write+spacer)
+    sys.stdout.flush()
+
+def print_candidates(results):
+    """
+    Print the RMSD and starting rotation of each of the best candidates.
+    """
+    if len(results) < 2:
+        return
+    print("Best "+str(len(results))+" candidates:")
+    for rank, (rmsd, (T, XYZ)) in enumerate(results):
+        print(str(rank+1)+": RMSD "+str(rmsd)+", starting rotation "+str(XYZ))
 
-def main(script_file, pdb_file, num_iterations=2000, req_tolerance=0.00001, no_save=False, bindex=0, conf=0, node=False, traj=False, num_candidates=100):
+def main(script_file, pdb_file, num_iterations=2000, req_tolerance=0.00001, no_save=False, bindex=0, conf=0, node=False, traj=False, num_candidates=100, num_threads=1, num_procs=1, seed=None, target_rmsd=None, top_k=1):
     """
     Align an FFEA script file to a PDB file.
     Parameters:
@@ -161,6 +253,12 @@ def main(script_file, pdb_file, num_iterations=2000, req_tolerance=0.00001, no_s
         - bindex - index of the blob to align
         - cindex - index of the conformation to align
         - node\traj- which object to apply the transformation to
+        - num_candidates - number of random starting rotations to try
+        - num_threads - threads to search for the nearest atoms with
+        - num_procs - processes to run the candidates in
+        - seed - seed for the random starting rotations
+        - target_rmsd - stop once a candidate gets this close
+        - top_k - number of the best candidates to print
     Returns
         - Translation vector, euler rotation, transformation matrix, RMSD
     """
@@ -188,8 +286,10 @@ def main(script_file, pdb_file, num_iterations=2000, req_tolerance=0.00001, no_s
         pdb_array = create_atom_array(pdb)
         #print("Finding optimal alignment...")
     
-        results = fit_from_candidates(node_array, pdb_array, num_iterations, req_tolerance, num_candidates)
+        all_results = find_candidates(node_array, pdb_array, num_iterations, req_tolerance, num_candidates, num_threads=num_threads, num_procs=num_procs, seed=seed, target_rmsd=target_rmsd, top_k=top_k)
         print(" ")
+        print_candidates(all_results)
+        results = all_results[0]
         rmsd = results[0]
         T = results[1][0]
         XYZ = results[1][1]
@@ -204,9 +304,6 @@ def main(script_file, pdb_file, num_iterations=2000, req_tolerance=0.00001, no_s
             print("Done! (didn't save anything)")
             return diff, XYZ, T, rmsd
         
-        print("Applying rotation...")
-        rot_euler(node.pos, XYZ)
-        
         print("Applying transformation...")
         node.pos = apply_transformation_4x4(node.pos, T)
         
@@ -242,8 +339,10 @@ def main(script_file, pdb_file, num_iterations=2000, req_tolerance=0.00001, no_s
         pdb_array = create_atom_array(pdb)
         node_array = traj.blob[bindex][conf].frame[0].pos
         
-        results = fit_from_candidates(node_array, pdb_array, num_iterations, req_tolerance, num_candidates)
+        all_results = find_candidates(node_array, pdb_array, num_iterations, req_tolerance, num_candidates, num_threads=num_threads, num_procs=num_procs, seed=seed, target_rmsd=target_rmsd, top_k=top_k)
         print(" ")
+        print_candidates(all_results)
+        results = all_results[0]
         rmsd = results[0]
         T = results[1][0]
         XYZ = results[1][1]
@@ -258,11 +357,6 @@ def main(script_file, pdb_file, num_iterations=2000, req_tolerance=0.00001, no_s
             print("Done! (didn't save anything)")
             return diff, XYZ, T, rmsd
         
-        print("Applying rotation...")
-        
-        for frame in traj.blob[bindex][conf].frame:
-            rot_euler(frame.pos, XYZ)
-        
         print("Applying transformation...")
         
         for frame in traj.blob[bindex][conf].frame:
@@ -287,4 +381,4 @@ def main(script_file, pdb_file, num_iterations=2000, req_tolerance=0.00001, no_s
         
 if __name__ == "__main__" and hasattr(__builtin__, 'FFEA_API_mode') == False and sys.stdin.isatty():
     args = parser.parse_args()
-    main(args.script, args.pdb, num_iterations=args.iterations, req_tolerance=args.tolerance, no_save=args.no_save, bindex=args.bindex, conf=args.cindex, node=args.node, traj=args.traj, num_candidates=args.candidates)
\ No newline at end of file
+    main(args.script, args.pdb, num_iterations=args.iterations, req_tolerance=args.tolerance, no_save=args.no_save, bindex=args.bindex, conf=args.cindex, node=args.node, traj=args.traj, num_candidates=args.candidates, num_threads=args.threads, num_procs=args.procs, seed=args.seed, target_rmsd=args.target_rmsd, top_k=args.top)
\ No newline at end of file
@@ -45,6 +45,8 @@ ffea_tools = 	{
       "cullvol": "FFEA_initialise/FFEA_volume_tools/cull_small_interior_elements.py",
 		"makekineticmaps": "FFEA_initialise/FFEA_mapping_tools/FFEA_generate_kinetic_maps.py",
 		"split": "FFEA_analysis/FFEA_traj_tools/FFEA_split_trajectory.py",
+      "trajtobinary": "FFEA_analysis/FFEA_traj_tools/FFEA_convert_traj_to_binary.py",
+      "rodtobinary": "FFEA_analysis/FFEA_traj_tools/FFEA_convert_rodtraj_to_binary.py",
 		"thin": "FFEA_analysis/FFEA_thin_system.py",
       "nodesFromTraj": "FFEA_analysis/FFEA_traj_tools/FFEA_get_snapshots_in_nodes.py",
       "tettonet": "FFEA_initialise/FFEA_volume_tools/convert_tet_to_net.py",
@@ -118,7 +118,7 @@ class FFEA_beads:
 					if len(beads_assignment) > 0:
 						work = False
 						for ba in beads_assignment:
-							if e.n.count(ba):
+							if ba in e.n:
 								work = True
 								break
 					if (work == False): continue
@@ -0,0 +1,304 @@
+#
+#  This file is part of the FFEA simulation package
+#
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file.
+#
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  To help us fund FFEA development, we humbly ask that you cite
+#  the research papers on the package.
+#
+
+import os
+from os import path
+import sys
+import time
+import numpy as np
+import FFEA_trajectory
+import FFEA_measurement
+
+class FFEA_follower:
+	"""
+	Follow the output files of a simulation while it is still running, like
+	'tail -f' does. Every call to update() reads only what has been written
+	since the last one: new frames are appended to an FFEA_trajectory object
+	(packed, by default, so that blob.pos grows with them) and new rows of
+	the .fm / .fdm files are appended to arrays. Half written frames and rows
+	are left on disk until the simulation finishes them.
+	Functions registered with add_callback are called as
+	func(follower, start, stop) with the range of new frames / rows.
+	"""
+
+	def __init__(self, traj_fname = None, meas_fname = None, onlyNodes = True, packed = True):
+
+		self.reset()
+
+		self.traj_fname = traj_fname
+		self.onlyNodes = onlyNodes
+		self.packed = packed
+
+		# The detailed measurements are found the same way FFEA_measurement finds them
+		if meas_fname != None:
+			self.global_tail = FFEA_measurement_tail(meas_fname)
+			self.detailed_tail = FFEA_measurement_tail(path.splitext(meas_fname)[0] + ".fdm")
+
+	def add_callback(self, func, source = "trajectory"):
+		"""
+		Register a function to call when new data arrives.
+		In: self, the function, and the source it is interested in:
+		'trajectory', 'global' (.fm) or 'detailed' (.fdm).
+		"""
+		if source not in self.callbacks:
+			raise KeyError("Error. Source must be one of " + str(list(self.callbacks.keys())) + ", not '" + str(source) + "'.")
+
+		self.callbacks[source].append(func)
+
+	def remove_callback(self, func):
+		for source in self.callbacks:
+			if func in self.callbacks[source]:
+				self.callbacks[source].remove(func)
+
+	def update(self):
+		"""
+		Read whatever has been written since the last update, and call the
+		registered callbacks for each file that grew.
+		Out: the number of new trajectory frames.
+		"""
+		num_new_frames = 0
+		if self.traj_fname != None:
+			start = self.traj.num_frames
+			num_new_frames = self.update_trajectory()
+			if num_new_frames > 0:
+				for func in self.callbacks["trajectory"]:
+					func(self, start, start + num_new_frames)
+
+		for source, tail in [("global", self.global_tail), ("detailed", self.detailed_tail)]:
+			if tail == None:
+				continue
+
+			start = tail.num_rows
+			if tail.update() > 0:
+				for func in self.callbacks[source]:
+					func(self, start, tail.num_rows)
+
+		return num_new_frames
+
+	def update_trajectory(self):
+
+		# Nothing new has been written, so nothing to read
+		try:
+			size = os.stat(self.traj_fname).st_size
+		except(OSError):
+			return 0
+
+		if size == self.traj_size:
+			return 0
+
+		# The file got smaller. The simulation must have been started again over the top of it
+		if size < self.traj_size:
+			self.reset_trajectory()
+
+		self.traj_size = size
+
+		# We can't build the blobs until the whole header is there
+		if self.traj.traj == None:
+			if not trajectory_header_written(self.traj_fname):
+				self.traj_size = 0
+				return 0
+
+			self.traj.packed = self.packed
+			self.traj.load_header(self.traj_fname)
+			self.traj.valid = True
+			self.traj.empty = False
+			self.scan_offset = self.traj.fpos
+
+		# Each complete frame closes two '*' lines, the node blocks and the conformation changes.
+		# Counting them in the new bytes only means a half written frame is not parsed over and over
+		fin = open(self.traj_fname, "rb")
+		fin.seek(self.scan_offset - 2)
+		self.num_asterisks += fin.read(size - self.scan_offset + 2).count(b"\n*\n")
+		fin.close()
+		self.scan_offset = size
+
+		# load_frame leaves a half written frame where it is, ready for next time
+		num_new_frames = 0
+		while(self.num_asterisks >= 2 and self.traj.load_frame(onlyNodes = self.onlyNodes) == 0):
+			self.num_asterisks -= 2
+			num_new_frames += 1
+
+		return num_new_frames
+
+	def follow(self, interval = 1.0, timeout = None):
+		"""
+		Keep updating until nothing has been written for a while.
+		In: self, the number of seconds to wait between polls, and how many
+		seconds without new data to wait before giving up (forever, if None).
+		The loop can always be stopped with Ctrl-C.
+		Out: the total number of trajectory frames read.
+		"""
+		last_change = time.time()
+		try:
+			while(True):
+				sizes = self.get_num_rows()
+				self.update()
+				if self.get_num_rows() != sizes:
+					last_change = time.time()
+				elif timeout != None and time.time() - last_change >= timeout:
+					break
+
+				time.sleep(interval)
+
+		except(KeyboardInterrupt):
+			pass
+
+		return self.traj.num_frames
+
+	def get_num_rows(self):
+		return [self.traj.num_frames] + [tail.num_rows for tail in [self.global_tail, self.detailed_tail] if tail != None]
+
+	def get_global_meas(self):
+		"""
+		Get the global measurements read so far.
+		Out: a dictionary from column title to an array (a view, not a copy).
+		"""
+		if self.global_tail == None:
+			return {}
+		return self.global_tail.get_meas()
+
+	def get_detailed_meas(self):
+		if self.detailed_tail == None:
+			return {}
+		return self.detailed_tail.get_meas()
+
+	def reset_trajectory(self):
+
+		if self.traj.traj != None:
+			self.traj.traj.close()
+		self.traj = FFEA_trajectory.FFEA_trajectory()
+		self.traj_size = 0
+		self.scan_offset = 0
+		self.num_asterisks = 0
+
+	def reset(self):
+
+		self.traj_fname = None
+		self.traj = FFEA_trajectory.FFEA_trajectory()
+		self.traj_size = 0
+		self.scan_offset = 0
+		self.num_asterisks = 0
+		self.onlyNodes = True
+		self.packed = True
+		self.global_tail = None
+		self.detailed_tail = None
+		self.callbacks = {"trajectory": [], "global": [], "detailed": []}
+
+class FFEA_measurement_tail:
+	"""
+	The rows of one measurement file, read a bit at a time as it grows.
+	"""
+
+	def __init__(self, fname):
+
+		self.reset()
+		self.fname = fname
+
+	def update(self):
+		"""
+		Read the rows written since the last update. Only complete lines are
+		parsed; a partial last line is read again next time.
+		Out: the number of new rows.
+		"""
+		try:
+			size = os.stat(self.fname).st_size
+		except(OSError):
+			return 0
+
+		if size == self.size:
+			return 0
+
+		if size < self.size:
+			self.reset(fname = self.fname)
+
+		if self.titles == None:
+			self.titles, self.offset = FFEA_measurement.read_measurement_header(self.fname)
+			if self.titles == None:
+				return 0
+
+		self.size = size
+
+		# Everything up to the last newline
+		fin = open(self.fname, "rb")
+		fin.seek(self.offset)
+		text = fin.read(size - self.offset)
+		fin.close()
+
+		end = text.rfind(b"\n") + 1
+		if end == 0:
+			return 0
+
+		self.offset += end
+		rows, restarts = FFEA_measurement.parse_measurement_block(text[:end].decode(), len(self.titles))
+		if len(rows) == 0:
+			return 0
+
+		self.append_rows(rows)
+		return len(rows)
+
+	def append_rows(self, rows):
+
+		# Grow geometrically, so that appending is amortised O(1)
+		if self.data is None or self.num_rows + len(rows) > len(self.data):
+			data = np.empty([max(16, 2 * (self.num_rows + len(rows))), len(self.titles)])
+			if self.data is not None:
+				data[:self.num_rows] = self.data[:self.num_rows]
+			self.data = data
+
+		self.data[self.num_rows:self.num_rows + len(rows)] = rows
+		self.num_rows += len(rows)
+
+	def get_meas(self):
+		if self.data is None:
+			return {}
+		return dict([(self.titles[i], self.data[:self.num_rows,i]) for i in range(len(self.titles))])
+
+	def reset(self, fname = None):
+
+		self.fname = fname
+		self.titles = None
+		self.offset = None
+		self.size = 0
+		self.data = None
+		self.num_rows = 0
+
+def trajectory_header_written(fname):
+	"""
+	Check whether the whole header of a trajectory, up to and including the
+	'*' that closes it, has been written yet.
+	"""
+	try:
+		fin = open(fname, "r")
+	except(IOError):
+		return False
+
+	written = False
+	line = fin.readline()
+	while(line != ""):
+		if line.strip() == "*" and line[-1] == "\n":
+			written = True
+			break
+		line = fin.readline()
+
+	fin.close()
+	return written
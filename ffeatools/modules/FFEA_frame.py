@@ -62,68 +62,37 @@ class FFEA_frame(FFEA_node.FFEA_node):
 		
 		return 0
 		
-	# Load only positions, knowing the number of nodes, 
-   #      from file object already open
+	# Load positions and velocities, knowing the number of nodes,
+	#      from file object already open
 	def load_from_traj_faster(self, fo):
 
 		if self.num_nodes == 0:
 			self.load_from_traj(fo)
 			return 0
-		
-		start = fo.tell()
-		
-		self.pos = np.empty([self.num_nodes, 3])
-		self.vel = np.empty([self.num_nodes, 3])
-		cnt = 0 
-		while(True):
-			prev = fo.tell()
-			line = fo.readline().split()
-			try:
-				for i in range(3):
-					self.pos[cnt,i] = float(line[i])
-					self.vel[cnt,i] = float(line[i+3])
-				cnt += 1
-			except(IndexError):
-			
-				# EOF
-				fo.seek(start)
-				return 1
 
-			except(ValueError):
-				if line[0] == "*" or line[0] == "Blob":
-				
-					# Ready for next frame
-					fo.seek(prev)
-					break
-				else:
-					# Halfway through a written frame
-					fo.seek(start)
-					return 1
-					
+		data = read_node_block(fo, self.num_nodes)
+		if data is None:
+			return 1
+
+		# No velocities in a block of positions only
+		self.pos = np.array(data[:,0:3])
+		self.vel = np.array(data[:,3:6]) if data.shape[1] >= 6 else None
 		self.num_surface_nodes = self.num_nodes
 		return 0
 		
 	# Load only positions, knowing the number of nodes, 
-   #      from file object already open
+	#      from file object already open
 	def load_from_traj_onlynodes_faster(self, fo):
 
 		if self.num_nodes == 0:
 			self.load_from_traj(fo)
 			return 0
-		
-		start = fo.tell()
-		
-		self.pos = np.empty([self.num_nodes, 3])
-		cnt = 0 
-		try:
-		   #read fixed sized lines
-		   # text = fo.read(line_length*self.num_nodes).split("\n")
-		   for ln in range(self.num_nodes):
-		      self.pos[ln] = np.fromstring(fo.readline(), dtype=float, sep=" ", count=3)
-		except:
-		   fo.seek(start)
-		   return 1
 
+		data = read_node_block(fo, self.num_nodes)
+		if data is None:
+			return 1
+
+		self.pos = np.array(data[:,0:3])
 		self.num_surface_nodes = self.num_nodes
 		return 0
 		
@@ -160,6 +129,39 @@ class FFEA_frame(FFEA_node.FFEA_node):
 		self.num_surface_nodes = 0
 		self.num_interior_nodes = 0
 		self.step = 0
+		self.conformation = 0
 		self.pos = []
 		self.vel = []
 		self.normal = []
+
+def read_node_block(fo, num_nodes):
+	"""
+	Read the node block of a single blob from a trajectory in one go. All
+	num_nodes lines are read at once and parsed with a single numpy call,
+	rather than converting one value at a time.
+	In: a file object positioned at the first node line, and the number
+	of nodes in the block.
+	Out: a (num_nodes, columns) array. If the block is incomplete (eof, or
+	a frame that is only partly written), returns None and rewinds fo to
+	where it started.
+	"""
+	start = fo.tell()
+	lines = [fo.readline() for i in range(num_nodes)]
+
+	data = None
+	if num_nodes > 0 and lines[-1].endswith("\n"):
+		num_columns = len(lines[0].split())
+		try:
+			data = np.fromstring("".join(lines), dtype=float, sep=" ")
+		except(ValueError):
+			data = None
+
+		# Older numpy stops at unmatched data rather than raising
+		if data is not None and (num_columns == 0 or data.size != num_nodes * num_columns):
+			data = None
+
+	if data is None:
+		fo.seek(start)
+		return None
+
+	return data.reshape(num_nodes, num_columns)
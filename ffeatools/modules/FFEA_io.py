@@ -0,0 +1,121 @@
+#
+#  This file is part of the FFEA simulation package
+#
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file.
+#
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  To help us fund FFEA development, we humbly ask that you cite
+#  the research papers on the package.
+#
+
+
+"""
+Reading and writing the blocks of numbers that make up most of the FFEA
+input files (.node, .top, .surf, .mat, .stokes, .pin) in bulk. A block is
+parsed with a single call to np.fromstring, and written with a single
+string format, rather than a line, or a number, at a time. The loaders
+only parse a block a line at a time when it is badly formatted, to find
+the line at fault.
+"""
+
+import numpy as np
+from FFEA_exceptions import *
+
+def read_lines(fin, num_lines = None):
+	"""
+	Read the lines of a block.
+	In: an open file, and the number of lines in the block. If that is
+	None, the block is every line up to the first blank one (or the end of
+	the file), and the rest of the file is read.
+	Out: a list of lines, without their newlines. Lines past the end of the
+	file are empty.
+	"""
+	if num_lines is None:
+		lines = fin.read().splitlines()
+		for i in range(len(lines)):
+			if lines[i].strip() == "":
+				return lines[:i]
+		return lines
+
+	return [fin.readline().rstrip("\n") for i in range(num_lines)]
+
+def parse_lines(lines, dtype = float):
+	"""
+	Parse a block of lines all at once.
+	In: a list of lines, and the type of the numbers in them.
+	Out: a (lines x columns) array, where columns is the number of numbers
+	on the first line, or None if the block is not made of numbers or its
+	lines do not all have that many.
+	"""
+	if len(lines) == 0:
+		return np.zeros([0, 0], dtype = dtype)
+
+	# Lines with too few and too many numbers can add up to the right total, so count them on every line
+	num_columns = len(lines[0].split())
+	if num_columns == 0 or any(len(line.split()) != num_columns for line in lines):
+		return None
+
+	try:
+		data = np.fromstring("\n".join(lines), dtype = dtype, sep = " ")
+	except(ValueError):
+		return None
+
+	if data.size != num_columns * len(lines):
+		return None
+
+	return data.reshape(len(lines), num_columns)
+
+def parse_block(lines, num_columns, dtype = float, first_column = 0, lin = 1, lstr = ""):
+	"""
+	Parse a block of lines of numbers into an array, taking num_columns of
+	them from each line, starting at first_column. Any other columns are
+	ignored, as they always have been by the loaders.
+	In: a list of lines, the number of columns, the type of the numbers,
+	the first column, the line number of lines[0] in the file and how a
+	line should be formatted, for the error.
+	Out: a (lines x num_columns) array.
+	Raises FFEAFormatError, at the first line without enough numbers.
+	"""
+	data = parse_lines(lines, dtype = dtype)
+	if data is not None and data.shape[1] >= first_column + num_columns:
+		return data[:,first_column:first_column + num_columns]
+
+	# Something is wrong, so find out which line it is
+	data = np.empty([len(lines), num_columns], dtype = dtype)
+	for i in range(len(lines)):
+		try:
+			sline = lines[i].split()[first_column:first_column + num_columns]
+			if len(sline) != num_columns:
+				raise ValueError
+			data[i] = [dtype(s) for s in sline]
+
+		except(ValueError):
+			raise FFEAFormatError(lin = lin + i, lstr = lstr)
+
+	return data
+
+def write_block(fout, data, fmt):
+	"""
+	Write a block of numbers, one row of data per line, in one go.
+	In: an open file, a (rows x columns) array (or list of rows, or a flat
+	list of numbers, one per row) and the format of a whole row, e.g.
+	"%d %d %d\\n".
+	"""
+	data = np.asarray(data)
+	if data.size == 0:
+		return
+
+	fout.write((fmt * len(data)) % tuple(data.ravel().tolist()))
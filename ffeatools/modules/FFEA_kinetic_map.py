@@ -22,16 +22,49 @@
 #
 
 import numpy as np
+import scipy.sparse
 import sys, os
-import FFEA_pdb, FFEA_node, FFEA_trajectory
+import struct
+import shutil
+import tempfile
+import multiprocessing
+from itertools import islice
+from scipy.spatial import cKDTree
+import FFEA_pdb, FFEA_node, FFEA_frame, FFEA_trajectory
+
+# Binary sparse map (.mapb) layout. Everything is little-endian.
+#
+#	char[8]	magic, "FFEAMAPB"
+#	uint32	version
+#	uint32	header size in bytes (the arrays start here)
+#	uint32	num_columns (num_nodes_from)
+#	uint32	num_rows (num_nodes_to)
+#	uint64	num_entries
+#	double	entries[num_entries]
+#	int64	key[num_rows + 1]
+#	int64	columns[num_entries]
+#
+# These are the same three CSR arrays, in the same order, as the text (Sparse) format.
+BINARY_MAP_MAGIC = b"FFEAMAPB"
+BINARY_MAP_VERSION = 1
+BINARY_MAP_HEADER_SIZE = 32
 
 class FFEA_kinetic_map:
+	"""
+	A map from the nodes of one structure (the columns) to the nodes of
+	another (the rows). The map is held as a scipy.sparse CSR matrix;
+	entry, key and col are its data, indptr and indices arrays, as they
+	appear in the (Sparse) map file.
+	"""
 
-	def __init__(self, fname):
+	def __init__(self, fname = None):
 		
 		# Initialise stuff
 		self.reset()
 
+		if fname == None:
+			return
+
 		# Start reading
 		try:
 			fin = open(fname, "r")
@@ -40,120 +73,551 @@ class FFEA_kinetic_map:
 			print("Error. Map File " + fname  + " not found.")
 			return
 
+		fin.close()
+		if is_binary_map(fname):
+			num_rows, num_columns, entry, key, col = read_binary_map(fname)
+			self.set_matrix(scipy.sparse.csr_matrix((entry, col, key), shape = (num_rows, num_columns)))
+			print("Map reading completed. Ready for application.")
+			return
+
 		# Header
 		# Do we need to convert the file?
+		fin = open(fname, "r")
 		line = fin.readline()
+		fin.close()
 		if "Dense" in line:
 	
-			# Convert map to sparse first
-			scriptdir = os.path.dirname(os.path.realpath(__file__))
+			# Convert map to sparse first, keeping the sparse version alongside for next time
 			print("Converting dense map to sparse...")
 			base, ext = os.path.splitext(os.path.abspath(fname))
-			os.system("python " + scriptdir + "/../../FFEA_initialise/FFEA_mapping_tools/Kinetic_FFEA_map_convert_to_sparse.py " + fname + " " + base + "_sparse" + ext)
+			convert_dense_to_sparse(fname, base + "_sparse" + ext)
 			fname = base + "_sparse" + ext
 			print("done!")
 
 		elif "Sparse" not in line:
 			sys.exit("Error. This may not be an FFEA kinetic map. Expected '(Dense)' or '(Sparse)' in first line of file.")
 
-		fin.close()
 		fin = open(fname, "r")
 		if fin.readline().strip() != "FFEA Kinetic Conformation Mapping File (Sparse)":
 			self.reset()
 			print("Error. Incorret header layout.")
 			return
  
-		self.num_columns = int(fin.readline().split()[1])
-		self.num_rows = int(fin.readline().split()[1])
-		self.num_entries = int(fin.readline().split()[1])
-
-		self.entry = [0.0 for i in range(self.num_entries)]
-		self.key = [0 for i in range(self.num_rows + 1)]
-		self.col = [0 for i in range(self.num_entries)]
+		num_columns = int(fin.readline().split()[1])
+		num_rows = int(fin.readline().split()[1])
+		num_entries = int(fin.readline().split()[1])
 
 		if fin.readline().strip() != "map:":
 			self.reset()
 			print("Error. Incorret header layout.")
 			return
 
-		# Read entries
-		print("Reading entries...")
-		i = -1
-		for entry in fin.readline().split()[2:]:
-			i += 1
-			self.entry[i] = float(entry)
-		print("done!")
-
-		# Read key
-		print("Reading key...")
-		i = -1
-		for entry in fin.readline().split()[2:]:
-			i += 1
-			self.key[i] = int(entry)
-		print("done!")
-
-		# Read columns
-		i = -1
-		print("Reading columns...")
-		for entry in fin.readline().split()[2:]:
-			i += 1
-			self.col[i] = int(entry)
-		print("done!")
+		# Each array is a single line, "name - a b c ..."
+		print("Reading entries, key and columns...")
+		entry = np.array(fin.readline().split()[2:], dtype=float)
+		key = np.array(fin.readline().split()[2:], dtype=np.int64)
+		col = np.array(fin.readline().split()[2:], dtype=np.int64)
+		fin.close()
+
+		if len(entry) != num_entries or len(col) != num_entries or len(key) != num_rows + 1:
+			self.reset()
+			print("Error. Expected %d entries and %d keys, but found %d entries, %d columns and %d keys." % (num_entries, num_rows + 1, len(entry), len(col), len(key)))
+			return
+
+		self.set_matrix(scipy.sparse.csr_matrix((entry, col, key), shape = (num_rows, num_columns)))
 		print("Map reading completed. Ready for application.")
 		return
 
+	def set_matrix(self, matrix):
+		"""
+		Make this map from a matrix of [row][column].
+		In: self, and any scipy.sparse matrix or dense array.
+		"""
+		self.matrix = scipy.sparse.csr_matrix(matrix)
+		self.num_rows, self.num_columns = self.matrix.shape
+		self.num_entries = self.matrix.nnz
+
+		# The CSR arrays, as named in the map file
+		self.entry = self.matrix.data
+		self.key = self.matrix.indptr
+		self.col = self.matrix.indices
+
+	def apply(self, pos):
+		"""
+		Map node positions, any number of frames at once. All the frames
+		are mapped by a single sparse x dense product, the map times a
+		(columns x 3 * frames) matrix of positions.
+		In: self, and an array of [column][x,y,z] or [frame][column][x,y,z].
+		Out: an array of [row][x,y,z] or [frame][row][x,y,z].
+		"""
+		pos = np.asarray(pos, dtype=float)
+		if pos.shape[-2] != self.num_columns:
+			raise ValueError("Error. Map expects " + str(self.num_columns) + " nodes, but found " + str(pos.shape[-2]))
+
+		if pos.ndim == 2:
+			return self.matrix.dot(pos)
+
+		num_frames = pos.shape[0]
+		block = np.ascontiguousarray(pos.transpose(1, 0, 2)).reshape(self.num_columns, num_frames * 3)
+		return self.matrix.dot(block).reshape(self.num_rows, num_frames, 3).transpose(1, 0, 2)
+
+	def apply_to_frames(self, frames):
+		"""
+		Map a list of frames (e.g. a batch from FFEA_trajectory.iter_frames).
+		In: self, and a list of objects with a pos array. None (a STATIC
+		blob's frame) is allowed.
+		Out: a list of new FFEA_frame objects, with the step of the originals,
+		and None where the originals were None.
+		"""
+		mapped = [None for f in frames]
+		dynamic = [i for i in range(len(frames)) if frames[i] != None]
+		if len(dynamic) == 0:
+			return mapped
+
+		new_pos = self.apply([frames[i].pos for i in dynamic])
+		for i, pos in zip(dynamic, new_pos):
+			f = frames[i]
+			mf = FFEA_frame.FFEA_frame()
+			mf.pos = pos
+			mf.num_nodes = self.num_rows
+			mf.set_step(getattr(f, "step", 0))
+			mapped[i] = mf
+
+		return mapped
+
 	def apply_sparse(self, base):
 		
 		# Get base type and apply appropriately
 		if isinstance(base, FFEA_pdb.FFEA_pdb):
-			basetype = "pdb"
-			if self.num_columns != len(base.blob[0].frame[0].pos):
-				print("Error. Map expects " + str(self.num_columns) + " nodes, but found " + str(len(base.blob[0].frame[0].pos)))
-				return
-			else:
-				total_new_nodes = []
-				count = 0
-				for f in base.blob[0].frame:
-					count += 1
-					new_nodes = np.array([[0.0,0.0,0.0] for i in range(self.num_rows)])
-					for i in range(self.num_rows):
-						for j in range(self.key[i], self.key[i + 1]):
-							new_nodes[i] += self.entry[j] * f.pos[self.col[j]]
-							
-					print(str(count) + " frames calculated")
-					total_new_nodes.append(new_nodes)
-						
-			return total_new_nodes
-
-		elif isinstance(base, FFEA_node.FFEA_node) or isinstance(base, FFEA_frame.FFEA_frame):
-			basetype = "FFEA_node"
-			if self.num_columns != len(base.pos):
-				print("Error. Map expects " + str(self.num_columns) + " nodes, but found " + str(len(base.pos)))
+
+			# The columns are the atoms of all the chains, in order
+			pos = [np.concatenate([c.frame[i].pos for c in base.chain]) for i in range(base.num_frames)]
+			if len(pos) > 0 and len(pos[0]) != self.num_columns:
+				print("Error. Map expects " + str(self.num_columns) + " nodes, but found " + str(len(pos[0])))
 				return
-			else:
-				new_nodes = np.array([[0.0,0.0,0.0] for i in range(self.num_rows)])
-				for i in range(self.num_rows):
-					for j in range(self.key[i], self.key[i + 1]):
-						new_nodes[i] += self.entry[j] * base.pos[self.col[j]]
-			return new_nodes
-
-		elif isinstance(base, FFEA_trajectory.FFEA_traj_blob_frame):
-			basetype = "FFEA_traj_blob_frame"
+			return [new_nodes for new_nodes in self.apply(np.array(pos).reshape(-1, self.num_columns, 3))]
+
+		elif isinstance(base, FFEA_node.FFEA_node):
 			if self.num_columns != len(base.pos):
 				print("Error. Map expects " + str(self.num_columns) + " nodes, but found " + str(len(base.pos)))
 				return
-			else:
-				new_nodes = np.array([[0.0,0.0,0.0] for i in range(self.num_rows)])
-				for i in range(self.num_rows):
-					for j in range(self.key[i], self.key[i + 1]):
-						new_nodes[i] += self.entry[j] * base.pos[self.col[j]]
-			
-		return new_nodes
+			return self.apply(base.pos)
+
+		return self.apply(base)
+
+	def apply_to_map(self, other):
+		"""
+		Combine this map with another.
+		In: self, and a map from some structure to the columns of this one.
+		Out: a new map, equivalent to applying other and then self.
+		"""
+		if self.num_columns != other.num_rows:
+			raise ValueError("Error. Map expects " + str(self.num_columns) + " nodes, but the other map makes " + str(other.num_rows))
+
+		kmap = FFEA_kinetic_map()
+		kmap.set_matrix(self.matrix.dot(other.matrix))
+		return kmap
+
+	def write_to_file(self, fname, binary = None):
+		"""
+		Write the map in the (Sparse) format.
+		In: self, the filename, and whether to write the binary format
+		instead of text (by default, only if the extension is .mapb).
+		"""
+		if binary == None:
+			binary = os.path.splitext(fname)[1] == ".mapb"
+
+		if binary:
+			fout = open(fname, "wb")
+			write_binary_map_header(fout, self.num_rows, self.num_columns, self.num_entries)
+			fout.write(np.asarray(self.entry, dtype="<f8").tobytes())
+			fout.write(np.asarray(self.key, dtype="<i8").tobytes())
+			fout.write(np.asarray(self.col, dtype="<i8").tobytes())
+			fout.close()
+			return
+
+		fout = open(fname, "w")
+		write_map_header(fout, self.num_rows, self.num_columns, self.num_entries)
+		fout.write("entries - ")
+		write_values(fout, self.entry)
+		fout.write("\nkey - ")
+		write_values(fout, self.key)
+		fout.write("\ncolumns - ")
+		write_values(fout, self.col)
+		fout.write("\n")
+		fout.close()
 
 	def reset(self):
 		self.num_entries = 0
 		self.num_rows = 0
 		self.num_columns = 0
-		self.entry = []
-		self.key = []
-		self.col = []
+		self.matrix = scipy.sparse.csr_matrix((0, 0))
+		self.entry = self.matrix.data
+		self.key = self.matrix.indptr
+		self.col = self.matrix.indices
+
+def write_map_header(fout, num_rows, num_columns, num_entries):
+	fout.write("FFEA Kinetic Conformation Mapping File (Sparse)\n")
+	fout.write("num_nodes_from %d\n" % (num_columns))
+	fout.write("num_nodes_to %d\n" % (num_rows))
+	fout.write("num_entries %d\n" % (num_entries))
+	fout.write("map:\n")
+
+def write_values(fout, values):
+	"""
+	Write an array as space separated values, each followed by a space,
+	as in the text (Sparse) format.
+	"""
+	values = np.asarray(values).tolist()
+	if len(values) > 0:
+		fout.write(" ".join([repr(v) for v in values]) + " ")
+
+def is_binary_map(fname):
+	"""
+	Check whether a file starts with the binary map magic number.
+	"""
+	try:
+		with open(fname, "rb") as fin:
+			return fin.read(len(BINARY_MAP_MAGIC)) == BINARY_MAP_MAGIC
+	except(IOError):
+		return False
+
+def write_binary_map_header(fout, num_rows, num_columns, num_entries):
+	fout.write(BINARY_MAP_MAGIC + struct.pack("<4IQ", BINARY_MAP_VERSION, BINARY_MAP_HEADER_SIZE, num_columns, num_rows, num_entries))
+
+def read_binary_map(fname):
+	"""
+	Read a binary (.mapb) sparse map.
+	In: the filename.
+	Out: num_rows, num_columns, and the entry, key and col arrays.
+	"""
+	fin = open(fname, "rb")
+	try:
+		if fin.read(len(BINARY_MAP_MAGIC)) != BINARY_MAP_MAGIC:
+			raise IOError("Expected binary map magic number '" + BINARY_MAP_MAGIC.decode() + "' in '" + fname + "'. This may not be a binary FFEA kinetic map.")
+
+		version, header_size, num_columns, num_rows, num_entries = struct.unpack("<4IQ", fin.read(24))
+		if version != BINARY_MAP_VERSION:
+			raise IOError("Binary map version " + str(version) + " in '" + fname + "' is not supported.")
+
+		fin.seek(header_size)
+		entry = np.fromfile(fin, dtype="<f8", count = num_entries)
+		key = np.fromfile(fin, dtype="<i8", count = num_rows + 1)
+		col = np.fromfile(fin, dtype="<i8", count = num_entries)
+
+	except(struct.error):
+		raise IOError("Binary map header in '" + fname + "' is truncated.")
+	finally:
+		fin.close()
+
+	if len(entry) != num_entries or len(key) != num_rows + 1 or len(col) != num_entries:
+		raise IOError("Binary map '" + fname + "' is truncated.")
+
+	return num_rows, num_columns, entry, key, col
+
+def parse_dense_block(text, num_lines, num_columns, limit = 0.0):
+	"""
+	Find the non-zero values in a block of rows of a dense map.
+	The text is tokenised as an array of bytes. Most of a dense map is
+	written as a bare "0", and those tokens are recognised without being
+	parsed; the rest are converted to floats, one by one if there are few
+	of them, or all at once with numpy otherwise.
+	In: the bytes of whole rows, the number of rows, the number of columns,
+	and the largest absolute value treated as zero.
+	Out: the row and column of each value kept, and the values.
+	Raises ValueError if any row does not have num_columns values.
+	"""
+	b = np.frombuffer(text, dtype=np.uint8)
+	space = (b == ord(" ")) | (b == ord("\n")) | (b == ord("\t")) | (b == ord("\r"))
+	starts = np.flatnonzero(~space & np.concatenate([[True], space[:-1]]))
+	ends = np.flatnonzero(~space & np.concatenate([space[1:], [True]])) + 1
+
+	# Every row must have the same number of values
+	line_of_token = np.searchsorted(np.flatnonzero(b == ord("\n")), starts)
+	if len(starts) != num_lines * num_columns or np.any(np.bincount(line_of_token, minlength = num_lines) != num_columns):
+		raise ValueError("Wrong number of values in dense map block")
+
+	candidates = np.flatnonzero((ends - starts != 1) | (b[starts] != ord("0")))
+	if 4 * len(candidates) > len(starts):
+		values = np.fromstring(text.decode(), sep=" ")[candidates]
+	else:
+		values = np.array([float(text[starts[i]:ends[i]]) for i in candidates], dtype=float)
+
+	keep = np.abs(values) > limit
+	candidates = candidates[keep]
+	return candidates // num_columns, candidates % num_columns, values[keep]
+
+def convert_dense_to_sparse(fname, out_fname, binary = None, limit = 0.0, chunk_size = None):
+	"""
+	Convert a dense map (as written by make_structure_map) to the sparse
+	format. The dense rows are parsed a block at a time, and the entries
+	and columns kept are streamed out to temporary files as they are found,
+	so only one block of rows is ever in memory.
+	In: the dense and sparse filenames, whether to write the binary format
+	(by default, only if the extension is .mapb), the largest absolute value
+	treated as zero, and the number of rows to parse at a time (by default,
+	enough for about 250000 values).
+	Out: the number of entries kept.
+	"""
+	if binary == None:
+		binary = os.path.splitext(out_fname)[1] == ".mapb"
+
+	fin = open(fname, "rb")
+	line = fin.readline().decode().strip()
+	if line != "FFEA Kinetic Conformation Mapping File (Dense)":
+		fin.close()
+		raise IOError("Expected 'FFEA Kinetic Conformation Mapping File (Dense)' and got " + line + ". May not be the correct file type")
+
+	num_columns = int(fin.readline().split()[1])
+	num_rows = int(fin.readline().split()[1])
+	num_entries_start = int(fin.readline().split()[1])
+
+	# 'map:'
+	fin.readline()
+
+	if chunk_size == None:
+		chunk_size = max(1, 250000 // max(1, num_columns))
+
+	# The key is only one number per row, but the entries and columns can be as big as the map
+	key = np.zeros(num_rows + 1, dtype=np.int64)
+	mode = "w+b" if binary else "w+"
+	entry_file = tempfile.TemporaryFile(mode = mode)
+	col_file = tempfile.TemporaryFile(mode = mode)
+
+	row = 0
+	while(row < num_rows):
+		lines = list(islice(fin, min(chunk_size, num_rows - row)))
+		if len(lines) == 0:
+			break
+
+		try:
+			nz_rows, nz_cols, values = parse_dense_block(b"".join(lines), len(lines), num_columns, limit)
+		except(ValueError):
+			fin.close()
+			raise IOError("Error. Expected %d values on each of rows %d to %d of '%s'." % (num_columns, row, row + len(lines) - 1, fname))
+
+		key[row + 1:row + len(lines) + 1] = key[row] + np.cumsum(np.bincount(nz_rows, minlength = len(lines)))
+		if binary:
+			entry_file.write(values.astype("<f8").tobytes())
+			col_file.write(nz_cols.astype("<i8").tobytes())
+		else:
+			write_values(entry_file, values)
+			write_values(col_file, nz_cols)
+
+		row += len(lines)
+		sys.stdout.write("\r%d%% read" % (int(row * 100.0 / num_rows)))
+		sys.stdout.flush()
+
+	fin.close()
+	sys.stdout.write("\n")
+
+	if row != num_rows:
+		raise IOError("Error. Expected %d rows in '%s', but found %d." % (num_rows, fname, row))
+
+	num_entries = int(key[-1])
+	if limit == 0.0 and num_entries_start != num_entries:
+		raise IOError("Error. Specified num_entries %d not equal to num_read %d" % (num_entries_start, num_entries))
+
+	# Now everything is known, put the file together
+	entry_file.seek(0)
+	col_file.seek(0)
+	if binary:
+		fout = open(out_fname, "wb")
+		write_binary_map_header(fout, num_rows, num_columns, num_entries)
+		shutil.copyfileobj(entry_file, fout)
+		fout.write(key.astype("<i8").tobytes())
+		shutil.copyfileobj(col_file, fout)
+	else:
+		fout = open(out_fname, "w")
+		write_map_header(fout, num_rows, num_columns, num_entries)
+		fout.write("entries - ")
+		shutil.copyfileobj(entry_file, fout)
+		fout.write("\nkey - ")
+		write_values(fout, key)
+		fout.write("\ncolumns - ")
+		shutil.copyfileobj(col_file, fout)
+		fout.write("\n")
+
+	fout.close()
+	entry_file.close()
+	col_file.close()
+	return num_entries
+
+def get_node_positions(node):
+	"""
+	Get the node positions of an FFEA_node (or frame) object as an array
+	of [node][x,y,z]. Arrays are passed straight through.
+	"""
+	if hasattr(node, "pos"):
+		node = node.pos
+	return np.asarray(node, dtype=float)
+
+def get_tetrahedra(top):
+	"""
+	Get the corner nodes of every element of an FFEA_topology object as an
+	array of [element][4]. The extra nodes of second order elements are
+	left out. Arrays are passed straight through (first 4 columns).
+	"""
+	if hasattr(top, "element_nodes"):
+		return top.element_nodes[:,0:4].astype(np.int64)
+	return np.asarray(top, dtype=np.int64)[:,0:4]
+
+def get_inverse_edge_matrices(corners):
+	"""
+	Get, for each tetrahedron, the inverse of the matrix whose columns are
+	its edges from the first corner, so that the barycentric coordinates
+	of a point p are 1 - sum(l), l = inv.(p - corner[0]).
+	In: an array of [element][corner][x,y,z].
+	Out: an array of [element][3][3]. Degenerate elements get NaNs, so
+	that no point is ever found inside them.
+	"""
+	edges = np.swapaxes(corners[:,1:,:] - corners[:,0:1,:], 1, 2)
+	det = np.linalg.det(edges)
+	inv = np.full(edges.shape, np.nan)
+	good = np.isfinite(det) & (det != 0)
+	inv[good] = np.linalg.inv(edges[good])
+	return inv
+
+def get_barycentric(inv, corner0, points):
+	"""
+	Get the barycentric coordinates of each point in each tetrahedron.
+	In: the inverse edge matrices and first corners of the tetrahedra, and
+	the points, all with the same leading dimension.
+	Out: an array of [point][4].
+	"""
+	l = np.einsum("...ij,...j->...i", inv, points - corner0)
+	return np.concatenate([1 - np.sum(l, axis=-1)[...,np.newaxis], l], axis=-1)
+
+def build_element_grid(corners):
+	"""
+	Build a spatial index of the bounding boxes of the elements, a uniform
+	grid with cells about the size of a typical element. Every element is
+	listed in each cell its bounding box overlaps.
+	In: an array of [element][corner][x,y,z].
+	Out: a dictionary with the grid origin, cell size and dimensions, and
+	the cell of every (cell, element) pair, sorted by cell, with the
+	elements of each cell in ascending order.
+	"""
+	lo = np.min(corners, axis=1)
+	hi = np.max(corners, axis=1)
+	cell = np.median(np.max(hi - lo, axis=1))
+	if not cell > 0:
+		cell = 1.0
+
+	origin = np.min(lo, axis=0)
+	lo_cell = np.floor((lo - origin) / cell).astype(np.int64)
+	hi_cell = np.floor((hi - origin) / cell).astype(np.int64)
+	dims = np.max(hi_cell, axis=0) + 1
+
+	# Expand every element into the cells of its bounding box
+	box = hi_cell - lo_cell + 1
+	counts = np.prod(box, axis=1)
+	pair_elem = np.repeat(np.arange(len(corners)), counts)
+	k = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+	bx = box[pair_elem,0]
+	by = box[pair_elem,1]
+	ijk = lo_cell[pair_elem] + np.stack([k % bx, (k // bx) % by, k // (bx * by)], axis=-1)
+	pair_cell = (ijk[:,2] * dims[1] + ijk[:,1]) * dims[0] + ijk[:,0]
+
+	order = np.argsort(pair_cell, kind="mergesort")
+	return {"origin": origin, "cell": cell, "dims": dims, "cells": pair_cell[order], "elements": pair_elem[order]}
+
+def find_containing_elements(grid, inv, corner0, points):
+	"""
+	Find an element containing each point, using the grid from
+	build_element_grid. As in make_structure_map, if several elements
+	contain a point (i.e. it is on a shared face), the first is taken.
+	Out: the element index for each point, or -1 if none contains it.
+	"""
+	found = np.full(len(points), -1, dtype=np.int64)
+	ijk = np.floor((points - grid["origin"]) / grid["cell"]).astype(np.int64)
+	in_grid = np.all((ijk >= 0) & (ijk < grid["dims"]), axis=1)
+	point_index = np.flatnonzero(in_grid)
+	ijk = ijk[in_grid]
+	point_cell = (ijk[:,2] * grid["dims"][1] + ijk[:,1]) * grid["dims"][0] + ijk[:,0]
+
+	# Every (point, candidate element) pair, in point then element order
+	start = np.searchsorted(grid["cells"], point_cell, side="left")
+	counts = np.searchsorted(grid["cells"], point_cell, side="right") - start
+	cand_point = np.repeat(point_index, counts)
+	cand_elem = grid["elements"][np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(np.sum(counts))]
+
+	with np.errstate(invalid="ignore"):
+		inside = np.all(get_barycentric(inv[cand_elem], corner0[cand_elem], points[cand_point]) >= -1e-12, axis=1)
+	first_point, first = np.unique(cand_point[inside], return_index=True)
+	found[first_point] = cand_elem[inside][first]
+	return found
+
+def build_kinetic_map(base_node, base_top, target_node, limit = 1e-5, block_size = 65536):
+	"""
+	Build the map from a base structure to a target structure, as
+	make_structure_map does: every target node is written in terms of the
+	(linear) nodes of the base element that contains it, using barycentric
+	weights. Target nodes outside the base structure use the base element
+	with the nearest centroid, so their weights extrapolate. The elements
+	are found through a grid over their bounding boxes, and everything is
+	vectorised over blocks of target nodes.
+	In: the base FFEA_node and FFEA_topology objects (or arrays of node
+	positions and element nodes), the target FFEA_node object (or array),
+	the largest absolute weight left out of the map, and the number of
+	target nodes to do at once.
+	Out: an FFEA_kinetic_map from the base nodes (columns) to the target
+	nodes (rows).
+	"""
+	base_pos = get_node_positions(base_node)
+	target_pos = get_node_positions(target_node)
+	tets = get_tetrahedra(base_top)
+
+	corners = base_pos[tets]
+	inv = get_inverse_edge_matrices(corners)
+	grid = build_element_grid(corners)
+
+	elem = np.empty(len(target_pos), dtype=np.int64)
+	for i in range(0, len(target_pos), block_size):
+		elem[i:i + block_size] = find_containing_elements(grid, inv, corners[:,0], target_pos[i:i + block_size])
+
+	# Nodes outside the structure
+	outside = np.flatnonzero(elem == -1)
+	if len(outside) > 0:
+		elem[outside] = cKDTree(np.mean(corners, axis=1)).query(target_pos[outside])[1]
+
+	weights = get_barycentric(inv[elem], corners[elem,0], target_pos)
+	rows = np.repeat(np.arange(len(target_pos)), 4).reshape(-1, 4)
+	keep = np.abs(weights) > limit
+
+	kmap = FFEA_kinetic_map()
+	kmap.set_matrix(scipy.sparse.csr_matrix((weights[keep], (rows[keep], tets[elem][keep])), shape = (len(target_pos), len(base_pos))))
+	return kmap
+
+def _build_kinetic_map_matrix(args):
+	return build_kinetic_map(*args).matrix
+
+def build_kinetic_maps(node_a, top_a, node_b, top_b, limit = 1e-5, num_procs = 2):
+	"""
+	Build the maps both ways between two conformations, each in its own
+	process if num_procs > 1.
+	In: the FFEA_node and FFEA_topology objects (or arrays) of both
+	conformations, the largest absolute weight left out of the maps, and
+	the number of processes.
+	Out: the maps from a to b and from b to a.
+	"""
+	pos_a = get_node_positions(node_a)
+	pos_b = get_node_positions(node_b)
+	jobs = [(pos_a, get_tetrahedra(top_a), pos_b, limit), (pos_b, get_tetrahedra(top_b), pos_a, limit)]
+
+	if num_procs > 1:
+		pool = multiprocessing.Pool(min(num_procs, 2))
+		try:
+			matrices = pool.map(_build_kinetic_map_matrix, jobs)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		matrices = [_build_kinetic_map_matrix(job) for job in jobs]
+
+	maps = []
+	for matrix in matrices:
+		kmap = FFEA_kinetic_map()
+		kmap.set_matrix(matrix)
+		maps.append(kmap)
+	return maps[0], maps[1]
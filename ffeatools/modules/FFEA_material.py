@@ -26,6 +26,7 @@ from time import sleep
 import numpy as np
 from FFEA_topology import FFEA_topology
 from FFEA_exceptions import *
+from FFEA_io import *
 
 class FFEA_material:
 
@@ -96,28 +97,12 @@ class FFEA_material:
 		except:
 			raise FFEAFormatError(lin="2", lstr="num_elements %d\n")
 
-		# Read elements now
-		try:
-			for i in range(num_elements):
-				sline = fin.readline().split()
-	
-				# Get an element (we want a matrix of values for slicing)
-				el = []
-
-				for s in sline:
-					el.append(float(s))
-				self.add_element(el)
-
-		except (IndexError, ValueError):
-			raise FFEAFormatError(lin=i+3, lstr="%f %f %f %f %f %f")
-		except:
-			raise
+		# Read elements now, all at once (we want a matrix of values for slicing)
+		self.element = parse_block(read_lines(fin, num_elements), 6, lin=3, lstr="%f %f %f %f %f %f")
+		self.num_elements = num_elements
 
 		fin.close()
 
-		# Numpy the params up, as they are basically a matrix
-		self.element = np.array(self.element)
-
 	def build(self, num_elements, **params):
 		
 		# Get a number of elements
@@ -150,9 +135,7 @@ class FFEA_material:
 	
 		fout = open(fname, "w")
 		fout.write("ffea material params file\nnum_elements %d\n" % (self.num_elements))
-		for el in self.element:
-			fout.write("%6.3f %6.3f %6.3f %10.1f %10.1f %6.3f" % (el[0], el[1], el[2], el[3], el[4], el[5]))
-			fout.write("\n")
+		write_block(fout, self.element, "%6.3f %6.3f %6.3f %10.1f %10.1f %6.3f\n")
 		fout.close()
 		
 	def add_element(self, el):
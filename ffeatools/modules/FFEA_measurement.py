@@ -21,7 +21,7 @@
 #  the research papers on the package.
 #
 
-import sys
+import sys, os
 from os import path
 import numpy as np
 
@@ -38,7 +38,7 @@ else:
 
 class FFEA_measurement:
 
-	def __init__(self, fname = "", frame_rate = 1, num_frames_to_read = 1000000):
+	def __init__(self, fname = "", frame_rate = 1, num_frames_to_read = 1000000, cache = False):
 
 		self.reset()
 
@@ -58,7 +58,7 @@ class FFEA_measurement:
 		fin.close()
 		try:
 			if line == "FFEA Global Measurement File":
-				self.load_global(fname, frame_rate = frame_rate, num_frames_to_read = num_frames_to_read)
+				self.load_global(fname, frame_rate = frame_rate, num_frames_to_read = num_frames_to_read, cache = cache)
 			else:		
 				print("\tPlease supply us with the global measurement file, not the '-d' .fdm file")				
 				return
@@ -68,7 +68,7 @@ class FFEA_measurement:
 
 			dfname = path.splitext(fname)[0] + ".fdm"
 			if path.exists(dfname):
-				self.load_detailed(dfname, frame_rate = frame_rate, num_frames_to_read = num_frames_to_read)
+				self.load_detailed(dfname, frame_rate = frame_rate, num_frames_to_read = num_frames_to_read, cache = cache)
 			
 		except:
 			raise
@@ -77,9 +77,28 @@ class FFEA_measurement:
 		self.empty = False
 		sys.stdout.write("done!\n")
 
-	def load_global(self, fname, frame_rate = 1, num_frames_to_read = 1000000):
+	def load_global(self, fname, frame_rate = 1, num_frames_to_read = 1000000, cache = False):
 
 		print("Loading FFEA Global Measurement file...")
+
+		# The cache, if up to date, saves parsing anything at all
+		cached = None
+		if cache:
+			cached = load_measurement_cache(fname)
+
+		if cached != None:
+			self.detail_string = str(cached["detail_string"])
+			self.param_string = str(cached["param_string"])
+			self.num_blobs = int(cached["num_blobs"])
+			keys = [str(key) for key in cached["keys"]]
+			rows = slice(None, num_frames_to_read, frame_rate)
+			self.segments = measurement_segments([int(r) for r in cached["restarts"]], int(cached["num_rows"]), frame_rate, num_frames_to_read)
+			self.global_meas = FFEA_measurement_columns({'Time': None, 'KineticEnergy': None, 'StrainEnergy': None, 'SpringEnergy': None, 'VdWEnergy': None, 'PreCompEnergy': None, 'Centroid': None, 'RMSD': None}, rows)
+			for key in keys:
+				self.global_meas.add_cached(key, get_measurement_cache_column_fname(fname, key))
+
+			print("done! Successfully read " + str(len(self.global_meas["Time"])) + " frame/s from the cache of '" + fname + "'.")
+			return
 	
 		# Open file
 		try:
@@ -106,161 +125,88 @@ class FFEA_measurement:
 			self.param_string += line
 			line = fin.readline()
 
-		# Build a dictionary of possible variables and a map to those
-		self.global_meas = {'Time': None, 'KineticEnergy': None, 'StrainEnergy': None, 'SpringEnergy': None, 'VdWEnergy': None, 'PreCompEnergy': None, 'Centroid.x': None, 'Centroid.y': None, 'Centroid.z': None, 'Centroid': None, 'RMSD': None}
-		sline = fin.readline().strip().split()
-		measmap = ["" for i in range(len(sline))]		
-		i = -1
-		for title in sline:
-			i += 1
-			measmap[i] = title.strip()
-			self.global_meas[measmap[i]] = []
-
-		num_meas = len(measmap)
+		# Then every measurement at once, as one structured array with a field per column
+		titles = parse_measurement_titles(fin.readline())
+		data, restarts = parse_measurement_block(fin.read(), len(titles))
+		fin.close()
 
-		# Read measurements
-		line = fin.readline()
-		frames_read = 0
-		all_frames = 0
-		while(line != "" and all_frames < num_frames_to_read):
-			#print(all_frames, num_frames_to_read)
-			if line.strip() == "#==RESTART==":
-				line = fin.readline()
-				continue
-
-			if all_frames % frame_rate == 0:
-				sline = line.split()
-				for i in range(num_meas):
-					self.global_meas[measmap[i]].append(float(sline[i]))
-				frames_read += 1
+		data = measurement_array(data, titles)
+		self.global_data = data[:num_frames_to_read:frame_rate]
+		self.segments = measurement_segments(restarts, len(data), frame_rate, num_frames_to_read)
 
-			line = fin.readline()
-			all_frames += 1
+		print("done! Successfully read " + str(len(self.global_data)) + " frame/s from '" + fname + "'.")
 
-			sys.stdout.write("\rFrames read = %d, Frames skipped = %d" % (frames_read, all_frames - frames_read))
-			sys.stdout.flush()
+		# Build a dictionary of possible variables, each one a view into that array
+		self.global_meas = {'Time': None, 'KineticEnergy': None, 'StrainEnergy': None, 'SpringEnergy': None, 'VdWEnergy': None, 'PreCompEnergy': None, 'Centroid': None, 'RMSD': None}
+		keys = [key for key in data.dtype.names if not key.startswith("Centroid.")]
+		for key in keys:
+			self.global_meas[key] = self.global_data[key]
 
-		print("\ndone! Successfully read " + str(frames_read) + " frame/s from '" + fname + "'.")
+		if cache:
+			write_measurement_cache(fname, data, keys, restarts, detail_string = self.detail_string, param_string = self.param_string, num_blobs = self.num_blobs)
 
-		# Move centroid into more useful format
-		self.global_meas["Centroid"] = []
-		for i in range(len(self.global_meas['Time'])):
-			self.global_meas["Centroid"].append([self.global_meas["Centroid.x"][i], self.global_meas["Centroid.y"][i], self.global_meas["Centroid.z"][i]])
+	def load_detailed(self, fname, frame_rate = 1, num_frames_to_read = 1000000, cache = False):
 
-		del self.global_meas["Centroid.x"]
-		del self.global_meas["Centroid.y"]
-		del self.global_meas["Centroid.z"]
-	
-		for key in self.global_meas:
-			if self.global_meas[key] != None:
-				self.global_meas[key] = np.array(self.global_meas[key])
+		print("Loading FFEA Detailed Measurement file...")
 
-	def load_detailed(self, fname, frame_rate = 1, num_frames_to_read = 1000000):
+		cached = None
+		if cache:
+			cached = load_measurement_cache(fname)
 
-		print("Loading FFEA Detailed Measurement file...")
+		if cached == None:
 	
-		# Open file
-		try:
-			fin = open(fname, "r")
-		except(IOError):
-			print("\tFile '" + fname + "' not found.")
-			self.reset()
-			raise
+			# Open file
+			try:
+				fin = open(fname, "r")
+			except(IOError):
+				print("\tFile '" + fname + "' not found.")
+				self.reset()
+				raise
 
-		line = fin.readline().strip()
-		while(line != "Measurements:"):
 			line = fin.readline().strip()
+			while(line != "Measurements:"):
+				line = fin.readline().strip()
+
+			# Column titles are prefixed by the blob, or pair of blobs, that they belong to
+			titles = parse_measurement_titles(fin.readline())
+			data, restarts = parse_measurement_block(fin.read(), len(titles))
+			fin.close()
+
+			data = measurement_array(data, titles)
+			self.detailed_data = data[:num_frames_to_read:frame_rate]
+			keys = [key for key in data.dtype.names if "." in key and not key.split(".", 1)[1].startswith("Centroid.")]
+
+			print("done! Successfully read " + str(len(self.detailed_data)) + " frame/s from '" + fname + "'.")
+
+			if cache:
+				write_measurement_cache(fname, data, keys, restarts)
+		else:
+			keys = [str(key) for key in cached["keys"]]
+
+		# Build dictionaries of views into the array (or the cache), local to blobs and then interblob
+		rows = slice(None, num_frames_to_read, frame_rate)
+		self.blob_meas = [FFEA_measurement_columns({'KineticEnergy': None, 'StrainEnergy': None, 'Centroid': None, 'RMSD': None}, rows) for i in range(self.num_blobs)]
+		self.interblob_meas = [[FFEA_measurement_columns({"VdWEnergy": None, "SpringEnergy": None, "PreCompEnergy": None}, rows) for i in range(self.num_blobs)] for j in range(self.num_blobs)]
+
+		for key in keys:
+			prefix, title = key.split(".", 1)
+			indices = [int(i) for i in prefix[1:].split("B")]
+			if len(indices) == 1:
+				meas = self.blob_meas[indices[0]]
+			else:
+				meas = self.interblob_meas[indices[0]][indices[1]]
 
-		# Get column title line and build maps to the required stuff
-		line = fin.readline()
-		sline = line.split("|")[1:]
-		localsline = sline[:self.num_blobs]
-		globalsline = sline[self.num_blobs:]
-
-		# Build dictionaries ans maps to variables
-		
-		# Local to blobs first
-		# Initialise arrays (measmap and indexmap are of unknown length initially)
-		self.blob_meas = [{'KineticEnergy': None, 'StrainEnergy': None, 'Centroid.x': None, 'Centroid.y': None, 'Centroid.z': None, 'Centroid': None, 'RMSD': None} for i in range(self.num_blobs)]
-		indexmap = []
-		measmap = []
-
-		for i in range(self.num_blobs):
-			ssline = localsline[i].split()[1:]
-			for title in ssline:
-				indexmap.append(i)
-				measmap.append(title.strip())
-				self.blob_meas[i][title.strip()] = []
-
-		# Now the global one
-		# Initialise arrays
-		self.interblob_meas = [[{"VdWEnergy": None, "SpringEnergy": None, "PreCompEnergy": None} for i in range(self.num_blobs)] for j in range(self.num_blobs)]
-		iindexmap = []
-		imeasmap = []
-
-		for i in range(len(globalsline)):
-
-			# Get the pair of indices
-			ssline = globalsline[i].split()
-			indexpair = [int(j) for j in ssline[0][1:].split("B")]
-			ssline = ssline[1:]
-			for title in ssline:
-				iindexmap.append(indexpair)
-				imeasmap.append(title.strip())
-				self.interblob_meas[indexpair[0]][indexpair[1]][title.strip()] = []
-
-		# Now, read measurements and fill the relevent arrays
-		line = fin.readline()
-		frames_read = 0
-		all_frames = 0
-		while(line != "" and all_frames < num_frames_to_read):
-			if line.strip() == "#==RESTART==":
-				line = fin.readline()
-				continue
-
-			if all_frames % frame_rate == 0:
-
-				sline = line.split()[1:]
-
-				localsline = sline[:len(indexmap)]
-				globalsline = sline[len(indexmap):]
-
-				# Local to blobs first!
-				for i in range(len(localsline)):
-					self.blob_meas[indexmap[i]][measmap[i]].append(float(localsline[i]))
-
-				# Now global
-				for i in range(len(globalsline)):
-					self.interblob_meas[iindexmap[i][0]][iindexmap[i][1]][imeasmap[i]].append(float(globalsline[i]))
-				frames_read += 1
-
-			line = fin.readline()
-			all_frames += 1
-
-			sys.stdout.write("\rFrames read = %d, Frames skipped = %d" % (frames_read, all_frames - frames_read))
-			sys.stdout.flush()
+			if cached == None:
+				meas[title] = self.detailed_data[key]
+			else:
+				meas.add_cached(title, get_measurement_cache_column_fname(fname, key))
 
-		print("\ndone! Successfully read " + str(frames_read) + " frame/s from '" + fname + "'.")
+		if cached != None:
+			print("done! Successfully read the cache of '" + fname + "'.")
 
-		# Move centroid into more useful format, make interblob array symmetric and turn stuff to numpy
+		# Make interblob array symmetric
 		for i in range(self.num_blobs):
-			self.blob_meas[i]["Centroid"] = []
-
-			for j in range(len(self.global_meas['Time'])):
-				self.blob_meas[i]["Centroid"].append([self.blob_meas[i]["Centroid.x"][j], self.blob_meas[i]["Centroid.y"][j], self.blob_meas[i]["Centroid.z"][j]])
-
-			del self.blob_meas[i]["Centroid.x"]
-			del self.blob_meas[i]["Centroid.y"]
-			del self.blob_meas[i]["Centroid.z"]
-
-			for key in self.blob_meas[i]:
-				if self.blob_meas[i][key] != None:
-					self.blob_meas[i][key] = np.array(self.blob_meas[i][key])
-
 			for j in range(i, self.num_blobs):
-				for key in self.interblob_meas[i][j]:
-					if self.interblob_meas[i][j][key] != None:
-						self.interblob_meas[i][j][key] = np.array(self.interblob_meas[i][j][key])
 				self.interblob_meas[j][i] = self.interblob_meas[i][j]
 
 
@@ -453,3 +399,246 @@ class FFEA_measurement:
 		self.global_meas = None
 		self.blob_meas = []
 		self.interblob_meas = []
+		self.global_data = None
+		self.detailed_data = None
+		self.segments = []
+
+class FFEA_measurement_columns(dict):
+	"""
+	A dictionary of measurement columns, some of which may be in the column
+	cache (see write_measurement_cache). Those are only memory mapped the
+	first time they are asked for, so a script reading two columns of a huge
+	file never touches the rest.
+	"""
+
+	def __init__(self, defaults, rows = slice(None)):
+
+		dict.__init__(self, defaults)
+		self.fnames = {}
+		self.rows = rows
+
+	def add_cached(self, key, fname):
+		self.fnames[key] = fname
+		dict.__setitem__(self, key, None)
+
+	def __getitem__(self, key):
+		if key in self.fnames:
+			fname = self.fnames.pop(key)
+			try:
+				column = np.load(fname, mmap_mode = "c")
+			except(ValueError):
+
+				# Empty columns can't be mapped
+				column = np.load(fname)
+			dict.__setitem__(self, key, column[self.rows])
+
+		return dict.__getitem__(self, key)
+
+	def __setitem__(self, key, value):
+		self.fnames.pop(key, None)
+		dict.__setitem__(self, key, value)
+
+	def get(self, key, default = None):
+		if key in self:
+			return self[key]
+		return default
+
+	def items(self):
+		return [(key, self[key]) for key in self]
+
+	def values(self):
+		return [self[key] for key in self]
+
+def get_measurement_cache_dirname(fname):
+	return fname + "cache"
+
+def get_measurement_cache_column_fname(fname, key):
+	return path.join(get_measurement_cache_dirname(fname), key + ".npy")
+
+def load_measurement_cache(fname):
+	"""
+	Get the index of the column cache of a measurement file, if there is one
+	and the size and modification time of the file still match it.
+	In: the .fm or .fdm filename.
+	Out: a dictionary of what was stored alongside the columns by
+	write_measurement_cache, or None.
+	"""
+	iname = path.join(get_measurement_cache_dirname(fname), "index.npz")
+	if not path.exists(iname):
+		return None
+
+	try:
+		cached = np.load(iname)
+		index = dict((key, cached[key]) for key in cached.files)
+		cached.close()
+		if int(index["size"]) == path.getsize(fname) and float(index["mtime"]) == path.getmtime(fname):
+			return index
+	except(IOError, OSError, ValueError, KeyError):
+		pass
+
+	return None
+
+def write_measurement_cache(fname, data, keys, restarts, **header):
+	"""
+	Write each of the given columns of a measurement file to its own .npy
+	file, in a directory next to the file (see get_measurement_cache_dirname).
+	In: the .fm or .fdm filename, the structured array of all of its rows,
+	the columns to cache, the rows at which the simulation was restarted, and
+	any header information to store in the index.
+	"""
+	dirname = get_measurement_cache_dirname(fname)
+	iname = path.join(dirname, "index.npz")
+
+	# The index goes last, so a half written cache is never mistaken for a whole one.
+	# A read-only directory just means we parse the text again next time
+	try:
+		if not path.isdir(dirname):
+			os.mkdir(dirname)
+		elif path.exists(iname):
+			os.remove(iname)
+
+		for key in keys:
+			np.save(get_measurement_cache_column_fname(fname, key), np.ascontiguousarray(data[key]))
+
+		with open(iname, "wb") as fout:
+			np.savez(fout, size = path.getsize(fname), mtime = path.getmtime(fname), keys = np.array(keys), num_rows = len(data), restarts = np.array(restarts, dtype=int), **header)
+	except(IOError, OSError):
+		pass
+
+def read_measurement_header(fname):
+	"""
+	Read the header of a global (.fm) or detailed (.fdm) measurement file.
+	In: the filename.
+	Out: the list of column titles and the byte offset of the first row of
+	measurements, or (None, None) if the header has not been completely
+	written yet.
+	"""
+	try:
+		fin = open(fname, "rb")
+	except(IOError):
+		return None, None
+
+	titles = None
+	offset = None
+	line = fin.readline()
+	while(line != b""):
+		if line.strip() == b"Measurements:":
+			line = fin.readline()
+			if line[-1:] == b"\n":
+				titles = parse_measurement_titles(line.decode())
+				offset = fin.tell()
+			break
+		line = fin.readline()
+
+	fin.close()
+	return titles, offset
+
+def parse_measurement_titles(line):
+	"""
+	Get the column titles from the title line of a measurement file.
+	Detailed columns are named after the blob (or pair of blobs) they
+	belong to, such as 'B0.StrainEnergy' or 'B0B1.VdWEnergy'.
+	"""
+	titles = []
+	prefix = ""
+	for group in line.split("|"):
+		sgroup = group.split()
+		if sgroup != [] and sgroup[0][0] == "B" and sgroup[0][1:2].isdigit():
+			prefix = sgroup[0] + "."
+			sgroup = sgroup[1:]
+		titles += [prefix + title for title in sgroup]
+
+	return titles
+
+def parse_measurement_block(text, num_columns):
+	"""
+	Parse the rows of a measurement file in bulk.
+	In: the text following the column titles, and the number of columns.
+	Out: a (rows x columns) array, and the index of the first row after
+	each '#==RESTART==' marker. Rows that are malformed, or not completely
+	written yet, are dropped.
+	"""
+	data = []
+	restarts = []
+	num_rows = 0
+	for block in text.split("#==RESTART=="):
+		if data != []:
+			restarts.append(num_rows)
+
+		rows = parse_measurement_rows(block, num_columns)
+		data.append(rows)
+		num_rows += len(rows)
+
+	return np.concatenate(data), restarts
+
+def parse_measurement_rows(text, num_columns):
+
+	# All at once, unless some row is malformed
+	text = text.strip()
+	if text == "":
+		return np.empty([0, num_columns])
+
+	rows = parse_measurement_lines(text, num_columns)
+	if rows is not None:
+		return rows
+
+	# Most often, that is only the last row, still being written
+	end = text.rfind("\n")
+	if end != -1:
+		rows = parse_measurement_lines(text[:end], num_columns)
+		if rows is not None:
+			return np.concatenate([rows, parse_measurement_rows_slowly(text[end:], num_columns)])
+
+	return parse_measurement_rows_slowly(text, num_columns)
+
+def parse_measurement_lines(text, num_columns):
+
+	num_lines = text.count("\n") + 1
+	try:
+		rows = np.fromstring(text, sep=" ")
+	except(ValueError):
+		return None
+
+	if rows.size != num_columns * num_lines:
+		return None
+	return rows.reshape(num_lines, num_columns)
+
+def parse_measurement_rows_slowly(text, num_columns):
+
+	rows = []
+	for line in text.split("\n"):
+		try:
+			row = np.fromstring(line, sep=" ")
+		except(ValueError):
+			continue
+		if row.size == num_columns:
+			rows.append(row)
+
+	return np.array(rows).reshape(len(rows), num_columns)
+
+def measurement_array(data, titles):
+	"""
+	View a (rows x columns) array of measurements as a structured array with
+	a field for each column. Every Centroid.x, .y, .z triplet also gets a
+	(rows x 3) 'Centroid' field, sharing the same memory.
+	"""
+	names = list(titles)
+	formats = ["f8" for t in titles]
+	offsets = [8 * i for i in range(len(titles))]
+	for i in range(len(titles) - 2):
+		if titles[i].endswith("Centroid.x") and titles[i + 1].endswith("Centroid.y") and titles[i + 2].endswith("Centroid.z"):
+			names.append(titles[i][:-2])
+			formats.append(("f8", (3,)))
+			offsets.append(8 * i)
+
+	dtype = np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": 8 * len(titles)})
+	return np.ascontiguousarray(data, dtype=np.float64).view(dtype)[:,0]
+
+def measurement_segments(restarts, num_rows, frame_rate = 1, num_frames_to_read = 1000000):
+	"""
+	Get the (start, stop) frames of each run of a restarted simulation, in
+	terms of the frames that were actually loaded.
+	"""
+	bounds = [min(r, num_rows, num_frames_to_read) for r in [0] + restarts + [num_rows]]
+	bounds = [(b + frame_rate - 1) // frame_rate for b in bounds]
+	return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]]
@@ -25,6 +25,7 @@ import sys, os
 from time import sleep
 import numpy as np
 from FFEA_exceptions import *
+from FFEA_io import *
 
 class FFEA_node:
 
@@ -121,33 +122,23 @@ class FFEA_node:
 		if fin.readline().strip() != "surface nodes:":
 			raise FFEAFormatError(lin="5", lstr="surface nodes:")
 
-		# Read nodes now
-		try:
-			j = 0
-			for i in range(num_surface_nodes):
-				sline = fin.readline().split()
-				n = [self.scale * float(sline[0]), self.scale * float(sline[1]), self.scale * float(sline[2])]
-				self.add_node(n, nodetype = 0)
-
-			if fin.readline().strip() != "interior nodes:":
-				if num_interior_nodes != 0:
-					raise FFEAFormatError(lin=num_surface_nodes + 6, lstr="interior nodes:")
-
-			i = num_surface_nodes
-			for j in range(num_interior_nodes):
-				sline = fin.readline().split()
-				n = [self.scale * float(sline[0]), self.scale * float(sline[1]), self.scale * float(sline[2])]
-				self.add_node(n, nodetype = 1)
-
-		except (IndexError, ValueError):
-			raise FFEAFormatError(lin=i+j+6, lstr="%f %f %f")
-		except:
-			raise
+		# Read nodes now, a block of each type at once
+		surface = parse_block(read_lines(fin, num_surface_nodes), 3, lin=6, lstr="%f %f %f")
+
+		if fin.readline().strip() != "interior nodes:":
+			if num_interior_nodes != 0:
+				raise FFEAFormatError(lin=num_surface_nodes + 6, lstr="interior nodes:")
+
+		interior = parse_block(read_lines(fin, num_interior_nodes), 3, lin=num_surface_nodes + 7, lstr="%f %f %f")
 
 		fin.close()
 
-		# Numpy it up, for speed
-		self.pos = np.array(self.pos)
+		surface *= self.scale
+		interior *= self.scale
+
+		self.reserve_nodes(num_surface_nodes + num_interior_nodes)
+		self.add_nodes(surface, nodetype = 0)
+		self.add_nodes(interior, nodetype = 1)
 
 	def load_tetgen_node(self, fname):
 
@@ -182,28 +173,15 @@ class FFEA_node:
 		except(IndexError, ValueError):
 			raise FFEAFormatError(lin=1, lstr="<num_nodes> <num_dimensions> 0 0")
 
-		# Read nodes now	
-		for i in range(num_nodes):
-			try:
-				sline = fin.readline().split()
-				if sline[0].strip() == "#":
-					raise FFEAFormatError(lin=i + 2, lstr=str(i + 1) + " %f %f %f")
-
-				sline = sline[1:]
-
-				# Get a node
-				n = [float(sline[0]), float(sline[1]), float(sline[2])]
-				
-				self.add_node(n)
-
-			except(IndexError, ValueError):
-				raise FFEAFormatError(lin=i + 2, lstr=str(i + 1) + " %f %f %f")
+		# Read nodes now, skipping the index (comments and all, which are not numbers)
+		try:
+			pos = parse_block(read_lines(fin, num_nodes), 3, first_column=1, lin=2)
 
+		except FFEAFormatError as e:
+			raise FFEAFormatError(lin=e.lin, lstr=str(int(e.lin) - 1) + " %f %f %f")
 
 		fin.close()
-
-		# Numpy it up, for speed
-		self.pos = np.array(self.pos)
+		self.add_nodes(pos)
 
 	def load_obj(self, fname):
 
@@ -228,15 +206,15 @@ class FFEA_node:
 
 		lines = lines[start_index:]
 
+		pos = []
 		for line in lines:
 			if line[0] != "v" or line[:2] == "vn":
 				continue
 
 			sline = line.split()[1:4]
-			self.add_node([float(sline[0]), float(sline[1]), float(sline[2])])
+			pos.append([float(sline[0]), float(sline[1]), float(sline[2])])
 
-		# Numpy it up, for speed
-		self.pos = np.array(self.pos)
+		self.add_nodes(pos)
 
 	def load_vol(self, fname):
 
@@ -268,37 +246,55 @@ class FFEA_node:
 		# Get num_nodes
 		i += 1
 		num_nodes = int(lines[i])
+		pos = np.empty([num_nodes, 3])
 		for j in range(i + 1, i + 1 + num_nodes):
 			try:
 				sline = lines[j].split()
-				self.add_node([float(sline[0]), float(sline[1]), float(sline[2])])	
+				pos[j - i - 1] = [float(sline[0]), float(sline[1]), float(sline[2])]
 			except:
-				print("\tCouldn't find the specified %d nodes. Only found %d. File '" + fname + "' not formatted correctly." % (num_nodes, i))
+				print("\tCouldn't find the specified %d nodes. Only found %d. File '" % (num_nodes, j - i - 1) + fname + "' not formatted correctly.")
 				self.reset()
 				return
 
-		# Numpy stuff up
-		self.pos = np.array(self.pos)
+		self.add_nodes(pos)
 
 	def add_node(self, n, nodetype = -1):
 		
-		# Numpy or not?
-		try:
-			if isinstance(self.pos, list):
-				self.pos.append(n)
-			else:
-				self.pos = np.append(self.pos, [n], axis=0)
-		except(IndexError, ValueError):
-			raise
-
-		self.num_nodes += 1
-		
-		if nodetype == -1:
-			self.num_surface_nodes += 1
-		elif nodetype == 0:
-			self.num_surface_nodes += 1
+		self.add_nodes([n], nodetype = nodetype)
+
+	def add_nodes(self, pos, nodetype = -1):
+		"""
+		Add many nodes at once.
+		In: self, an array of [node][x,y,z], and their type (-1 unknown, 0
+		surface or 1 interior).
+		"""
+		pos = np.asarray(pos, dtype=float).reshape(-1, 3)
+
+		num = len(self.pos)
+		self.reserve_nodes(num + len(pos))
+		self.pos = self.pos_buffer[:num + len(pos)]
+		self.pos[num:] = pos
+
+		self.num_nodes += len(pos)
+		if nodetype == -1 or nodetype == 0:
+			self.num_surface_nodes += len(pos)
 		else:
-			self.num_interior_nodes += 1
+			self.num_interior_nodes += len(pos)
+
+	def reserve_nodes(self, num_nodes):
+		"""
+		Make sure pos has room for num_nodes nodes. pos is a view of the
+		first rows of a buffer that grows geometrically, so that adding nodes
+		one at a time is amortised O(1). If pos has been replaced by some
+		other array, it is copied into a new buffer first.
+		"""
+		if self.pos_buffer is not None and isinstance(self.pos, np.ndarray) and self.pos.base is self.pos_buffer and len(self.pos_buffer) >= num_nodes:
+			return
+
+		pos = np.asarray(self.pos, dtype=float).reshape(-1, 3)
+		self.pos_buffer = np.empty([max(num_nodes, 2 * len(pos)), 3])
+		self.pos_buffer[:len(pos)] = pos
+		self.pos = self.pos_buffer[:len(pos)]
 
 	def calculateInterior(self, top=None, surf=None):
 
@@ -313,48 +309,26 @@ class FFEA_node:
 		#	return
 
 		# Use surface to determine which nodes are interior and build a map
-		surfBool = [False for i in range(self.num_nodes)]
+		surfBool = np.zeros(self.num_nodes, dtype=bool)
 
 		# Surface
-		for f in surf.face:
-			for n in f.n:
-				surfBool[n] = True
-
-		amap = [-1 for i in range(self.num_nodes)]
-		index = 0
+		surfBool[surf.face_nodes[surf.face_nodes != -1]] = True
 
-		for n in range(self.num_nodes):
+		# Surface nodes first, then the remainder are interior
+		order = np.concatenate([np.flatnonzero(surfBool), np.flatnonzero(~surfBool)])
+		amap = np.empty(self.num_nodes, dtype=np.int32)
+		amap[order] = np.arange(self.num_nodes)
 
-			if surfBool[n]:
-				amap[n] = index
-				index += 1
-
-		self.num_surface_nodes = index
+		self.num_surface_nodes = int(np.sum(surfBool))
 		self.num_interior_nodes = self.num_nodes - self.num_surface_nodes
 
-		# Now remainder are interior
-		for i in range(self.num_nodes):
-			if amap[i] == -1:
-				amap[i] = index
-				index += 1
-
 		# Alter order of nodes
-		oldpos = self.pos
-		self.pos = [None for i in range(self.num_nodes)]
-
-		for n in range(len(amap)):
-			self.pos[amap[n]] = oldpos[n]
+		self.pos = np.asarray(self.pos)[order]
 
 		# And reassign surface and topologies
-		for i in range(top.num_elements):
-
-			# Map node indices
-			for j in range(len(top.element[i].n)):
-				top.element[i].n[j] = amap[top.element[i].n[j]]
-
-		for i in range(surf.num_faces):
-			for j in range(len(surf.face[i].n)):
-				surf.face[i].n[j] = amap[surf.face[i].n[j]]
+		for n in [top.element_nodes, surf.face_nodes]:
+			n[n != -1] = amap[n[n != -1]]
+		top.face_index = None
 	
 		# And make sure the interior node of surface elements if at the end of the list of the linear indices
 		#for i in range(top.num_interior_elements, top.num_elements):
@@ -413,8 +387,7 @@ class FFEA_node:
 		if ext == ".vol":
 			fout = open(fname, "a")
 			fout.write("#          X             Y             Z\npoints\n%d\n" % (self.num_nodes))
-			for p in self.pos:
-				fout.write("%22.16f  %22.16f  %22.16f\n" % (p[0], p[1], p[2]))
+			write_block(fout, self.pos, "%22.16f  %22.16f  %22.16f\n")
 
 			fout.write("\n\n")
 
@@ -424,13 +397,11 @@ class FFEA_node:
 		
 			# Surface nodes
 			fout.write("surface nodes:\n")
-			for i in range(self.num_surface_nodes):
-				fout.write("%10.6f %10.6f %10.6f\n" % (self.pos[i][0], self.pos[i][1], self.pos[i][2]))
+			write_block(fout, self.pos[:self.num_surface_nodes], "%10.6f %10.6f %10.6f\n")
 
 			# Interior nodes
 			fout.write("interior nodes:\n")
-			for i in range(self.num_surface_nodes, self.num_nodes, 1):
-				fout.write("%10.6f %10.6f %10.6f\n" % (self.pos[i][0], self.pos[i][1], self.pos[i][2]))
+			write_block(fout, self.pos[self.num_surface_nodes:self.num_nodes], "%10.6f %10.6f %10.6f\n")
 
 		elif ext == ".obj":
 			if surf == None:
@@ -447,14 +418,13 @@ class FFEA_node:
 
 	def linearise_system(self, top):
 		
-		for e in top.element:
-			#for n in e.n[4:]:
-				#node.pos[n]
-			sindex = 4
-			for i in range(0,3,1):
-				for j in range(i + 1,4,1):
-					self.pos[e.n[sindex]] = 0.5 * (self.pos[e.n[i]] + self.pos[e.n[j]])
-					sindex += 1	
+		# Put the midpoint nodes of each 2nd order element back at the middle of their edges
+		n = top.element_nodes
+		if n.shape[1] == 10:
+			n = n[n[:,4] != -1]
+			edges = [[0,1], [0,2], [0,3], [1,2], [1,3], [2,3]]
+			for k in range(6):
+				self.pos[n[:,4 + k]] = 0.5 * (self.pos[n[:,edges[k][0]]] + self.pos[n[:,edges[k][1]]])
 
 	def rescale(self, factor):
 		
@@ -462,13 +432,7 @@ class FFEA_node:
 
 	def calc_mass(self, top, mat):
 
-		mass = 0.0
-		eindex = -1
-		for e in top.element:
-			eindex += 1		
-			mass += e.calc_volume(self) * mat.element[eindex][0]
-
-		return mass
+		return top.calc_mass(mat, self)
 
 	def calc_centroid(self, subset=None):
 		if subset == None:
@@ -481,17 +445,7 @@ class FFEA_node:
 	
 	def calc_CoM(self, top, mat):
 
-		CoM = np.array([0.0,0.0,0.0])
-		tmass = 0.0
-		eindex = -1
-		for e in top.element:
-			eindex += 1
-			elmass = e.calc_volume(self) * mat.element[eindex][0]
-
-			tmass += elmass
-			CoM += elmass * np.mean([self.pos[n] for n in e.n[0:4]], axis=0)
-
-		self.CoM = CoM * 1.0/tmass
+		self.CoM = top.calc_CoM(self, mat)
 		return self.CoM
 
 	def get_CoM(self):
@@ -574,7 +528,8 @@ class FFEA_node:
 		self.valid = False
 		self.empty = True
 
-		self.pos = []
+		self.pos = np.zeros([0, 3])
+		self.pos_buffer = None
 		self.centroid = None
 		self.CoM = None
 		self.num_nodes = 0
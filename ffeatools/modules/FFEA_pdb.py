@@ -266,21 +266,32 @@ class FFEA_pdb:
 		for i in range(frames[0], frames[1], frame_rate):
 			#sys.stdout.write("\r\r%d frames written (%d%%)" % (i, (i * 100) / self.num_frames))
 			sys.stdout.flush()
-			text += ("MODEL     %4d\n" % (i + 1))
-			for j in range(self.num_chains):
-				for k in range(self.num_atoms[j]):
-					#print j, self.num_chains, len(self.chain), k, self.num_atoms[j], len(self.chain[j].atom)
-					a = self.chain[j].atom[k]
-					x = ('%.5f' % self.chain[j].frame[i].pos[k][0])
-					y = ('%.5f' % self.chain[j].frame[i].pos[k][1])
-					z = ('%.5f' % self.chain[j].frame[i].pos[k][2])
-					text += ("%6s%5d %4s %3s %c%4d     %.7s %.7s %.7s%6.2f%6.2f      %4s%2s%2s\n" % ("ATOM  ", a.atomID, a.name, a.res, self.chain[j].chainID, a.resID, x, y, z, a.occupancy, a.temperature, a.segID ,a.element, a.charge))
-
-				text += ("TER\n")
-			text+= ("ENDMDL\n")
+			text += self.write_model_to_text(i)
 		text += ("END\n")
 		return text 
 
+	def write_model_to_text(self, i, model = None):
+		"""
+		Get the text of a single MODEL, so frames can be written one by one.
+		In: self, the frame index, and the model number (frame index + 1 by default).
+		"""
+		if model == None:
+			model = i + 1
+
+		text = ("MODEL     %4d\n" % (model))
+		for j in range(self.num_chains):
+			for k in range(self.num_atoms[j]):
+				#print j, self.num_chains, len(self.chain), k, self.num_atoms[j], len(self.chain[j].atom)
+				a = self.chain[j].atom[k]
+				x = ('%.5f' % self.chain[j].frame[i].pos[k][0])
+				y = ('%.5f' % self.chain[j].frame[i].pos[k][1])
+				z = ('%.5f' % self.chain[j].frame[i].pos[k][2])
+				text += ("%6s%5d %4s %3s %c%4d     %.7s %.7s %.7s%6.2f%6.2f      %4s%2s%2s\n" % ("ATOM  ", a.atomID, a.name, a.res, self.chain[j].chainID, a.resID, x, y, z, a.occupancy, a.temperature, a.segID ,a.element, a.charge))
+
+			text += ("TER\n")
+		text += ("ENDMDL\n")
+		return text
+
 
 	def write_to_file(self, fname, frames = None, frame_rate = 1):
 
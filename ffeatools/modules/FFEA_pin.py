@@ -25,6 +25,7 @@ import sys, os
 from time import sleep
 import numpy as np
 from FFEA_exceptions import *
+from FFEA_io import *
 
 class FFEA_pin:
 
@@ -95,14 +96,10 @@ class FFEA_pin:
 
 		fin.readline()
 
-		# Read pinned nodes now
-		pintype = 0	
-		while(True):
-			line = fin.readline().strip()
-			if line == "":
-				break
-			else:
-				self.add_pinned_node(line)
+		# Read pinned nodes now, all at once
+		index = parse_block(read_lines(fin), 1, dtype=int, lin=4, lstr="%d")[:,0].tolist()
+		self.index.extend(index)
+		self.num_pinned_nodes += len(index)
 
 		fin.close()
 
@@ -136,8 +133,7 @@ class FFEA_pin:
 		
 		with open(fname, "w") as f:
 			f.write("ffea pinned nodes file\nnum_pinned_nodes %d\npinned nodes:\n" % (self.num_pinned_nodes))
-			for i in self.index:
-				f.write("%d\n" % (i))
+			write_block(f, self.index, "%d\n")
 
 
 	def pin_radially(self, node, oindex, radius, top=None, linear=0, reset=1):
@@ -28,10 +28,12 @@
         Email: py12rw@leeds.ac.uk
 """
 
+import struct
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy.interpolate as interpolate
 from mpl_toolkits.mplot3d import Axes3D # do not remove
+import FFEA_rod_math
 try:
     import rod.ndc_extractor as cc_extractor # for old-style module imports
 except:
@@ -40,6 +42,17 @@ except:
 global rod_creator_version
 rod_creator_version = 0.3
 
+# The rows of each frame of a .rodtraj file, in order, and the names older
+# versions of the format gave some of them
+rod_row_names = ["equil_r", "equil_m", "current_r", "current_m",
+                 "perturbed_x_energy_positive", "perturbed_y_energy_positive",
+                 "perturbed_z_energy_positive", "twisted_energy_positive",
+                 "perturbed_x_energy_negative", "perturbed_y_energy_negative",
+                 "perturbed_z_energy_negative", "twisted_energy_negative",
+                 "material_params", "B_matrix"]
+rod_row_aliases = {"equil_n": "equil_r", "equil_m1": "equil_m",
+                   "current_n": "current_r", "current_m1": "current_m"}
+
 
 
 """
@@ -87,13 +100,15 @@ class FFEA_rod:
         degree of freedom (x, y, z, twist)
     """
     
-    def __init__(self, filename=None, rod_no=0, num_rods=1, num_elements=0):
+    def __init__(self, filename=None, rod_no=0, num_rods=1, num_elements=0, start=0, stop=None, stride=1, rows=None):
         """
         Initialize the rod object and load the contents of the trajectory.
         
         Params:
             filename - the path to the .rodtraj file to be loaded.
             rod_no - give the rod a unique ID, if you like
+            start, stop, stride, rows - which frames and rows of the
+            trajectory to load (see load_trajectory).
             
         Returns:
             nothing. But it populates every attribute in this object, save for
@@ -101,7 +116,10 @@ class FFEA_rod:
         """
         self.rod_no = rod_no
         
-        if filename:
+        if filename and is_binary_rod_trajectory(filename):
+            self.load_binary(filename, start=start, stop=stop, stride=stride, rows=rows)
+
+        elif filename:
             self.filename = filename
             self.end_of_header = 0
             rod_file = open(filename, "r")
@@ -118,8 +136,7 @@ class FFEA_rod:
                 if line == "---END HEADER---\n":
                     break
             rod_file.close()
-            self.get_trajectory_length()
-            self.load_trajectory()
+            self.load_trajectory(start=start, stop=stop, stride=stride, rows=rows)
         
         else:
             self.num_frames = 1
@@ -143,111 +160,161 @@ class FFEA_rod:
 
         return
     
-    def get_num_dimensions(self, row):
+    def iter_trajectory_lines(self, start=0, stop=None, stride=1, rows=None):
         """
-        Get the number of dimensions for the row. For example, equil_r is stored
-        in row 1, and it's positions, so it's 3D. This will return 4 for
-        B_matrix because the B_matrix of each node is 4 elements long.
+        Go through the frames of the .rodtraj file once, without parsing
+        anything.
+        Inputs: the first frame, the frame to stop before (None for the end
+        of the file), the stride, and the rows wanted (see load_trajectory).
+        Yields: the text lines of the wanted rows, for each wanted frame. A
+        frame that was still being written when the file was read is left out.
         """
+        row_indices = get_rod_row_indices(rows)
+        frame_no = 0
+
         rod_file = open(self.filename, "r")
         for lines_skipped in range(self.end_of_header):
             rod_file.readline()
-        for lines_skipped in range(row):
-            rod_file.readline()
-        line = rod_file.readline()
+
+        while stop is None or frame_no < stop:
+            line = rod_file.readline()
+            if not line:
+                break
+            if line.split(" ")[0] != "FRAME":
+                continue
+
+            frame_lines = [rod_file.readline() for i in range(len(rod_row_names))]
+            if not frame_lines[-1].endswith("\n"):
+                break
+
+            if frame_no >= start and (frame_no - start) % stride == 0:
+                yield [frame_lines[i] for i in row_indices]
+            frame_no += 1
+
         rod_file.close()
-        return len(line.split(","))/self.num_elements
 
-        
-    def get_trajectory_length(self):
-        """
-        Get the number of frames in the trajectory.
-        Input: nothing, but the file header info must already be loaded (see
-        __init__).
-        Output: sets the self.num_frames attribute.
-        """
+    def load_trajectory(self, start=0, stop=None, stride=1, rows=None):
+        """
+        Loads the trajectory, in a single pass through the file. For each
+        frame to be loaded, the rows wanted are joined and parsed with one
+        np.fromstring call, and the arrays they go into grow geometrically,
+        so we never need to know the number of frames in advance. The size
+        of each row (3 for positions, 4 for B_matrix, etc.) is taken from
+        the first frame.
+        
+        Inputs: the first frame to load, the frame to stop before (None for
+        the end of the file), the stride between loaded frames, and the rows
+        to load, as a list of names from rod_row_names (or the older names in
+        rod_row_aliases). By default, every row is loaded. Rows that aren't
+        loaded are set to None, so loading just current_r and current_m takes
+        a fraction of the time and memory.
+        Outputs: none, but it populates the 'contents' arrays and sets
+        self.num_frames to the number of frames loaded. A frame that was
+        still being written when the file was read is ignored.
+        """
+
+        row_indices = get_rod_row_indices(rows)
+        buffers = [None for i in row_indices]
+        row_sizes = None
         self.num_frames = 0
-        rod_file = open(self.filename, "r")
-        for line in rod_file:
-            if line.split(" ")[0] == "FRAME" and line.split(" ")[2] == "ROD":
-                self.num_frames+=1
-        rod_file.close()
 
-    def load_trajectory(self):
-        """
-        Loads the trajectory. Fast, but also messy. The basic idea is that it allocates
-        a load of very large numpy arrays, then iterates over every frame, calling
-        rod_file.readline() for each line, loading that frame for that line into
-        the array, and then does .readline() again. It does that 14 times for the
-        14 rows in each frame. No, it's not pretty, you're right. It's not.
-        At least it's not trying to be clever.
-        
-        Inputs: none, it already has the filename set in self.filename and all
-        the meta info.
-        Outputs: none, but it populates all the 'contents' arrays.
-        """
-
-        self.equil_r = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(1)])
-        self.equil_m = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(2)])
-        self.current_r = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(3)])
-        self.current_m  = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(4)])
-        self.perturbed_x_energy_positive = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(5)])
-        self.perturbed_y_energy_positive = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(6)])
-        self.perturbed_z_energy_positive = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(7)])
-        self.twisted_energy_positive = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(8)])
-        self.perturbed_x_energy_negative = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(9)])
-        self.perturbed_y_energy_negative = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(10)])
-        self.perturbed_z_energy_negative = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(11)])
-        self.twisted_energy_negative = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(12)])
-        self.material_params = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(13)])
-        self.B_matrix = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(14)])
-
-        # look, this is not pretty but it is really fast
+        for wanted in self.iter_trajectory_lines(start=start, stop=stop, stride=stride, rows=rows):
+            if row_sizes is None:
+                row_sizes = [line.count(",") + 1 for line in wanted]
+                for i in range(len(row_indices)):
+                    buffers[i] = np.empty([16, self.num_elements, row_sizes[i]//self.num_elements])
 
-        rod_file = open(self.filename, "r")
-        frame_no = 0
-        while True:
-            line = rod_file.readline()
-            if not line:
-                break
-            if line.split(" ")[0] == "FRAME":
-                try:
-                    line = rod_file.readline()
-                    self.equil_r[frame_no] = np.fromstring(line, sep=",").reshape(self.equil_r[frame_no].shape)
-                    line = rod_file.readline()
-                    self.equil_m[frame_no] = np.fromstring(line, sep=",").reshape(self.equil_m[frame_no].shape)
-                    line = rod_file.readline()
-                    self.current_r[frame_no] = np.fromstring(line, sep=",").reshape(self.current_r[frame_no].shape)
-                    line = rod_file.readline()
-                    self.current_m[frame_no] = np.fromstring(line, sep=",").reshape(self.current_m[frame_no].shape)
-                    line = rod_file.readline()
-                    self.perturbed_x_energy_positive[frame_no] = np.fromstring(line, sep=",").reshape(self.perturbed_x_energy_positive[frame_no].shape)
-                    line = rod_file.readline()
-                    self.perturbed_y_energy_positive[frame_no] = np.fromstring(line, sep=",").reshape(self.perturbed_y_energy_positive[frame_no].shape)
-                    line = rod_file.readline()
-                    self.perturbed_z_energy_positive[frame_no] = np.fromstring(line, sep=",").reshape(self.perturbed_z_energy_positive[frame_no].shape)
-                    line = rod_file.readline()
-                    self.twisted_energy_positive[frame_no] = np.fromstring(line, sep=",").reshape(self.twisted_energy_positive[frame_no].shape)
-                    line = rod_file.readline()
-                    self.perturbed_x_energy_negative[frame_no] = np.fromstring(line, sep=",").reshape(self.perturbed_x_energy_negative[frame_no].shape)
-                    line = rod_file.readline()
-                    self.perturbed_y_energy_negative[frame_no] = np.fromstring(line, sep=",").reshape(self.perturbed_y_energy_negative[frame_no].shape)
-                    line = rod_file.readline()
-                    self.perturbed_z_energy_negative[frame_no] = np.fromstring(line, sep=",").reshape(self.perturbed_z_energy_negative[frame_no].shape)
-                    line = rod_file.readline()
-                    self.twisted_energy_negative[frame_no] = np.fromstring(line, sep=",").reshape(self.twisted_energy_negative[frame_no].shape)
-                    line = rod_file.readline()
-                    self.material_params[frame_no] = np.fromstring(line, sep=",").reshape(self.material_params[frame_no].shape)
-                    line = rod_file.readline()
-                    self.B_matrix[frame_no] = np.fromstring(line, sep=",").reshape(self.B_matrix[frame_no].shape)
-                    frame_no += 1
-                except ValueError as e:
-                    raise ValueError(str(e)+"\nError loading frame "+str(frame_no)+"\nProblem line: "+str(line))
+            try:
+                data = np.fromstring(",".join(wanted), sep=",")
+                if data.size != sum(row_sizes):
+                    raise ValueError("Expected "+str(sum(row_sizes))+" values, read "+str(data.size))
+            except ValueError as e:
+                raise ValueError(str(e)+"\nError loading frame "+str(start + self.num_frames*stride))
+
+            if buffers != [] and self.num_frames == len(buffers[0]):
+                for i in range(len(buffers)):
+                    buffers[i] = np.concatenate([buffers[i], np.empty(buffers[i].shape)])
+
+            offset = 0
+            for i in range(len(buffers)):
+                buffers[i][self.num_frames] = data[offset:offset + row_sizes[i]].reshape(buffers[i].shape[1:])
+                offset += row_sizes[i]
+
+            self.num_frames += 1
+
+        for row in rod_row_names:
+            setattr(self, row, None)
+        for i in range(len(buffers)):
+            if buffers[i] is not None:
+                buffers[i].resize((self.num_frames,) + buffers[i].shape[1:], refcheck=False)
+                setattr(self, rod_row_names[row_indices[i]], buffers[i])
+            else:
+                setattr(self, rod_row_names[row_indices[i]], np.empty([0, self.num_elements, 4 if row_indices[i] == len(rod_row_names) - 1 else 3]))
         #self.set_avg_energies()
         return
+
+    def load_binary(self, filename, start=0, stop=None, stride=1, rows=None):
+        """
+        Load a binary rod trajectory (see write_rod_binary). Nothing is read
+        up front: each row is a copy-on-write memory map of its block of the
+        file, and start / stop / stride are applied by slicing it, so they
+        don't copy anything either.
+        Inputs: as for load_trajectory.
+        Outputs: none, but it populates the 'contents' arrays.
+        """
+        header = read_rod_binary_header(filename)
+        self.filename = filename
+        self.rod_id = header["rod_id"]
+        self.num_rods = header["num_rods"]
+        self.num_elements = header["num_elements"]
+        self.length = self.num_elements*3
+
+        row_indices = get_rod_row_indices(rows)
+        frames = slice(start, stop, stride)
+        self.num_frames = len(range(header["num_frames"])[frames])
+
+        for row in rod_row_names:
+            setattr(self, row, None)
+        for name, num_values in header["fields"]:
+            if rod_row_names.index(name) not in row_indices:
+                continue
+            shape = (header["num_frames"], self.num_elements, num_values)
+            if header["num_frames"] == 0:
+                setattr(self, name, np.empty(shape))
+            else:
+                setattr(self, name, np.memmap(filename, dtype="<f8", mode="c", offset=header["offsets"][name], shape=shape)[frames])
+
+    def write_rod_binary(self, filename):
+        """
+        Write the rod trajectory in the binary format. Each row that is
+        loaded is stored as its own contiguous (frames x elements x values)
+        block of doubles, after a header describing them (see
+        make_rod_binary_header). Rows that weren't loaded (see
+        load_trajectory) are left out of the file, and are None again when
+        it is loaded.
+        """
+        fields = [(row, getattr(self, row)) for row in rod_row_names if getattr(self, row) is not None]
+        if len(fields) == 0:
+            raise ValueError("No rod trajectory rows are loaded, so there is nothing to write to '"+filename+"'.")
+        header = make_rod_binary_header(getattr(self, "rod_id", self.rod_no), self.num_rods, self.num_elements, len(fields[0][1]), [(row, data.shape[2]) for row, data in fields])
+
+        rod_file = open(filename, "wb")
+        write_rod_binary_header(rod_file, header)
+        for row, data in fields:
+            np.ascontiguousarray(data, dtype="<f8").tofile(rod_file)
+        rod_file.close()
     
     def write_rod(self, filename):
-        
+        """
+        Write the rod trajectory in the text (.rodtraj) format. Every frame
+        of that format has every row, so all of them must be loaded: a
+        trajectory loaded with only some of its rows can be written with
+        write_rod_binary instead.
+        """
+        unloaded = [row for row in rod_row_names if getattr(self, row, None) is None]
+        if len(unloaded) > 0:
+            raise ValueError("Can't write '"+filename+"' as text, the rows "+", ".join(unloaded)+" weren't loaded. Use write_rod_binary, or load every row.")
+
         try:
             self.p_i
         except AttributeError:
@@ -285,14 +352,12 @@ class FFEA_rod:
         # Write trajectory
         
         try:
-            StringIO
-            shutil
-        except NameError:
-            import cStringIO as StringIO
-#            import shutil
+            from cStringIO import StringIO
+        except ImportError:
+            from io import StringIO
         
         def write_array(array, file_obj):
-            sio = StringIO.StringIO()
+            sio = StringIO()
             np.savetxt(sio, array, newline=",")
             str_to_write = sio.getvalue()[:-1]+"\n"
             file_obj.write(str_to_write)
@@ -328,19 +393,7 @@ class FFEA_rod:
         Returns: an array containing the p_i vectors for each frame.
         """
         #x = either self.current_r, or self.equil_r!
-        
-        # Find p_i
-        x_shifted = np.copy(x)
-            
-        for frame in range(len(x_shifted)):
-            x_shifted[frame] = np.roll(x_shifted[frame],1,axis=0) 
-        p_i = x - x_shifted #get all the p_i values in one big giant array operation
-        
-        # Remove first p_i
-        p_i_new = np.empty([self.num_frames, self.num_elements-1, len(self.current_r[0][0]) ])
-        for frame in range(len(p_i_new)):
-            p_i_new[frame] = np.delete(p_i[frame], 0, axis=0)
-        return p_i_new
+        return FFEA_rod_math.get_p_i(x)
         
     def set_avg_energies(self):
         """
@@ -357,7 +410,7 @@ class FFEA_rod:
         unperturbed_energy_dof.
         """
         #this is dragons, do not use
-        self.unperturbed_energy_type = np.empty([self.num_frames, self.num_elements, self.get_num_dimensions(5)])
+        self.unperturbed_energy_type = np.empty([self.num_frames, self.num_elements, self.perturbed_x_energy_positive.shape[2]])
         self.unperturbed_energy_dof = np.empty([self.num_frames, self.num_elements, 4])
         for frame in range(len(self.perturbed_x_energy_positive)):
             for node in range(len(self.perturbed_x_energy_positive[frame])):
@@ -577,12 +630,7 @@ class anal_rod:
         self.p_i = self.get_p_i(self.rod.current_r)
         self.equil_p_i = self.get_p_i(self.rod.equil_r)
         
-        self.stretching_energy = np.zeros( [len(self.p_i), len(self.p_i[0])-1] )
-        
-        for frame in range(len(self.p_i)):
-            for element in range(len(self.stretching_energy[0])):
-                self.stretching_energy[frame][element] = self.py_rod_math.get_stretch_energy(self.get_constant_parameter(0), self.p_i[frame][element], self.equil_p_i[frame][element])
-                
+        self.stretching_energy = FFEA_rod_math.get_stretch_energy(self.get_constant_parameter(0), self.p_i[:,:-1], self.equil_p_i[:,:-1])
         
     def get_bending_response(self):
         """
@@ -606,47 +654,24 @@ class anal_rod:
         except ValueError:
             import warnings
             warnings.warn("EI is not constant. If this is for an equipartition test, it won't work.")
-            
-        self.bending_energy = np.zeros( [len(self.p_i), len(self.p_i[0])-1] )
         
-        for frame in range(len(self.p_i)):
-            for element in range(len(self.bending_energy[0])):
-                
-                # NOTE TO SELF: ADD NORMALISATION!
-                
-                B_j = np.matrix([[self.rod.B_matrix[frame][element][0], self.rod.B_matrix[0][0][1]], [self.rod.B_matrix[0][0][2], self.rod.B_matrix[0][0][3]]])
-                B_i= np.matrix([[self.rod.B_matrix[frame][element+1][0], self.rod.B_matrix[0][0][1]], [self.rod.B_matrix[0][0][2], self.rod.B_matrix[0][0][3]]])
-                
-                pim1 = self.p_i[frame][element]
-                pi = self.p_i[frame][element+1]
-                mim1 = self.py_rod_math.normalize(self.rod.current_m[frame][element])
-                nim1 = np.cross(mim1, pim1/np.linalg.norm(pim1))
-                mi = self.py_rod_math.normalize(self.rod.current_m[frame][element+1])
-                ni = np.cross(mi, pi/np.linalg.norm(pi))
-                omega_i, equil_kbi = self.py_rod_math.omega(pi, pim1, nim1, mim1)
-                omega_j, equil_kbj = self.py_rod_math.omega(pi, pim1, ni, mi)
-                
-                equil_pim1 = self.equil_p_i[frame][element]
-                equil_pi = self.equil_p_i[frame][element+1]
-                equil_mim1 = self.py_rod_math.normalize(self.rod.equil_m[frame][element])
-                equil_nim1 = np.cross(equil_mim1, equil_pim1/np.linalg.norm(equil_pim1))
-                equil_mi = self.py_rod_math.normalize(self.rod.equil_m[frame][element+1])
-                equil_ni = np.cross(equil_mi, equil_pi/np.linalg.norm(equil_pi))
-                
-                equil_omega_i, equil_kbi = self.py_rod_math.omega(equil_pi, equil_pim1, equil_nim1, equil_mim1)
-                equil_omega_j, equil_kbj = self.py_rod_math.omega(equil_pi, equil_pim1, equil_ni, equil_mi)
-
-                delta_omega_i = omega_i - equil_omega_i
-                delta_omega_j = omega_j - equil_omega_j
-                
-                inner_i = np.dot(np.transpose(delta_omega_i), np.dot(B_j, delta_omega_i))
-                inner_j = np.dot(np.transpose(delta_omega_j), np.dot(B_i, delta_omega_j))
-                
-                energy = 0.5*(inner_i + inner_j)*(1/(2*(self.py_rod_math.get_length(equil_pi)+self.py_rod_math.get_length(equil_pim1))))
-                
-                l_i = self.py_rod_math.get_length(equil_pi)+self.py_rod_math.get_length(equil_pim1) #shouldn't this be regular pi and pim1?
-                
-                self.bending_energy[frame][element] = energy
+        # NOTE TO SELF: ADD NORMALISATION!
+        
+        # Only the first element of B changes along the rod, the rest come from the first node
+        num_pairs = len(self.p_i[0])-1
+        B_j = self.get_node_B_matrix(self.rod.B_matrix[:,:num_pairs,0])
+        B_i = self.get_node_B_matrix(self.rod.B_matrix[:,1:num_pairs+1,0])
+        
+        pim1, pi = self.p_i[:,:-1], self.p_i[:,1:]
+        equil_pim1, equil_pi = self.equil_p_i[:,:-1], self.equil_p_i[:,1:]
+        
+        omega_i, omega_j = FFEA_rod_math.get_element_omega(pim1, pi, self.rod.current_m[:,:num_pairs], self.rod.current_m[:,1:num_pairs+1])
+        equil_omega_i, equil_omega_j = FFEA_rod_math.get_element_omega(equil_pim1, equil_pi, self.rod.equil_m[:,:num_pairs], self.rod.equil_m[:,1:num_pairs+1])
+        
+        inner_i = FFEA_rod_math.get_bend_inner(omega_i - equil_omega_i, B_j)
+        inner_j = FFEA_rod_math.get_bend_inner(omega_j - equil_omega_j, B_i)
+        
+        self.bending_energy = 0.5*(inner_i + inner_j)*(1/(2*(FFEA_rod_math.get_length(equil_pi)+FFEA_rod_math.get_length(equil_pim1))))
         
     def get_bending_response_mutual(self, rotate=False):
         """
@@ -655,25 +680,6 @@ class anal_rod:
         Params: none
         Returns: none, but it populates self.bending_energy, an array.
         """
-
-        def get_weights(a, b):
-            a_length = rod_math.get_length(a)
-            b_length = rod_math.get_length(b)
-            weight1 = a_length/(a_length+b_length)
-            return weight1
-
-        def get_mutual_frame_inverse(pim1, pi, weights=None):
-            if not weights:
-                weights = get_weights(pim1, pi)
-            mutual_element = (1/weights)*rod_math.normalize(pim1) + (1/(1-weights))*rod_math.normalize(pi)
-            return rod_math.normalize(mutual_element)
-
-        def get_mutual_axes_inverse(mim1, mi, pim1=None, pi=None, weight=None):
-            if not weight:
-                weight = get_weights(pim1, pi)
-            m_mutual = (mim1*(1.0/weight) + mi*(1.0/(1-weight)))/(rod_math.get_length(mi)+rod_math.get_length(mim1))
-            return rod_math.normalize(m_mutual)
-
         try:
             self.p_i
         except AttributeError:
@@ -688,84 +694,31 @@ class anal_rod:
         except ValueError:
             import warnings
             warnings.warn("EI is not constant. If this is for an equipartition test, it won't work.")
-            
-        self.bending_energy = np.zeros( [len(self.p_i), len(self.p_i[0])-1] )
-        #L_i = np.zeros( [len(self.p_i), len(self.p_i[0])-1] )
-        #delta_omega_all = np.zeros( [len(self.p_i), len(self.p_i[0])-1, 2] )
         
-        for frame in range(len(self.p_i)):
-            for element in range(len(self.bending_energy[0])):
-                
-                # NOTE TO SELF: ADD NORMALISATION!
-                
-                #B_j = np.matrix([[self.rod.B_matrix[frame][element][0], self.rod.B_matrix[0][0][1]], [self.rod.B_matrix[0][0][2], self.rod.B_matrix[0][0][3]]])
-                B= np.matrix([[self.rod.B_matrix[frame][element+1][0], self.rod.B_matrix[0][0][1]], [self.rod.B_matrix[0][0][2], self.rod.B_matrix[0][0][3]]])
-                
-                #mutual_l = get_mutual_frame_inverse(self.p_i[frame][element], self.p_i[frame][element+1])
-                #equil_mutual_l = get_mutual_frame_inverse(self.equil_p_i[frame][element], self.equil_p_i[frame][element+1])
-                
-                pim1 = self.p_i[frame][element]
-                pi = self.p_i[frame][element+1]
-                mim1 = self.py_rod_math.normalize(self.rod.current_m[frame][element])
-                nim1 = np.cross(mim1, pim1/np.linalg.norm(pim1))
-                mi = self.py_rod_math.normalize(self.rod.current_m[frame][element+1])
-                ni = np.cross(mi, pi/np.linalg.norm(pi))
-
-                #get weighting between elements adjacent to bending node!
-                weight = get_weights(pim1, pi)
-                
-                #get weighted element at that node
-                mutual_l = get_mutual_frame_inverse(pim1, pi, weight)
-
-                # parallel transport our two existing material axes onto our new element
-                mutual_mi = np.array(rod_math.parallel_transport(mi,  rod_math.normalize(pi), mutual_l))[0]
-                mutual_mim1 = np.array(rod_math.parallel_transport(mim1,  rod_math.normalize(pim1), mutual_l))[0]
-                
-                # get the weighted average to create the mutual material axes
-                mutual_m_rotated = get_mutual_axes_inverse(mutual_mim1, mutual_mi, pim1, pi, weight=weight)
-                
-                #angle_between = np.arccos(np.dot(mutual_mi, mutual_mim1))
-                #mutual_angle = get_mutual_angle_inverse(mutual_mi, mutual_mim1, angle_between)
-                #mutual_m_rotated = rod_math.rodrigues(mutual_mim1, mutual_l, mutual_angle)
-                if rotate:
-                    mutual_m_rotated = rod_math.rodrigues(mutual_m_rotated, mutual_l, rotate)
-                omega, kb = rod_math.omega(pi, pim1, np.cross(mutual_m_rotated, mutual_l), mutual_m_rotated)
-                
-                equil_pim1 = self.equil_p_i[frame][element]
-                equil_pi = self.equil_p_i[frame][element+1]
-                equil_mim1 = self.py_rod_math.normalize(self.rod.equil_m[frame][element])
-                equil_nim1 = np.cross(equil_mim1, equil_pim1/np.linalg.norm(equil_pim1))
-                equil_mi = self.py_rod_math.normalize(self.rod.equil_m[frame][element+1])
-                equil_ni = np.cross(equil_mi, equil_pi/np.linalg.norm(equil_pi))
-                
-                #get weighting between elements adjacent to bending node!
-                equil_weight = get_weights(equil_pim1, equil_pi)
-                
-                #get weighted element at that node
-                equil_mutual_l = get_mutual_frame_inverse(equil_pim1, equil_pi, equil_weight)
-
-                # parallel transport our two existing material axes onto our new element
-                equil_mutual_mi = np.array(rod_math.parallel_transport(equil_mi, rod_math.normalize(equil_pi), equil_mutual_l))[0]
-                equil_mutual_mim1 = np.array(rod_math.parallel_transport(equil_mim1, rod_math.normalize(equil_pim1), equil_mutual_l))[0]
-                
-                # get the weighted average to create the mutual material axes
-                equil_mutual_m_rotated = get_mutual_axes_inverse(equil_mutual_mim1, equil_mutual_mi, equil_pim1, equil_pi, weight=equil_weight)
-
-                equil_omega, equil_kb = rod_math.omega(equil_pi, equil_pim1, np.cross(equil_mutual_m_rotated, equil_mutual_l), equil_mutual_m_rotated)
-                
-                delta_omega = omega - equil_omega
-                
-                inner = np.dot(np.transpose(delta_omega), np.dot(B, delta_omega))
-
-                energy = 0.5*(inner)*(1/( (rod_math.get_length(equil_pi)+rod_math.get_length(equil_pim1))/2.0) )
-                
-                #L_i[frame][element] = (rod_math.get_length(equil_pi)+rod_math.get_length(equil_pim1))/(2.0)
-                
-                self.bending_energy[frame][element] = energy
-                
-                #delta_omega_all[frame][element] = np.array(omega - equil_omega).transpose()[0]
-                
-        #return delta_omega_all, L_i
+        # NOTE TO SELF: ADD NORMALISATION!
+        
+        num_pairs = len(self.p_i[0])-1
+        B = self.get_node_B_matrix(self.rod.B_matrix[:,1:num_pairs+1,0])
+        
+        delta_omega, L_i = FFEA_rod_math.get_mutual_delta_omega(self.p_i[:,:-1], self.p_i[:,1:], self.equil_p_i[:,:-1], self.equil_p_i[:,1:], self.rod.current_m[:,:num_pairs], self.rod.current_m[:,1:num_pairs+1], self.rod.equil_m[:,:num_pairs], self.rod.equil_m[:,1:num_pairs+1], rotate=rotate)
+        
+        # Unlike rod_math_core, this has always used n = m x l for the mutual frame
+        delta_omega[...,0] *= -1
+        
+        self.bending_energy = 0.5*FFEA_rod_math.get_bend_inner(delta_omega, B)/L_i
+    
+    def get_node_B_matrix(self, B_0):
+        """
+        Build the B matrix used for each pair of elements by the bending
+        energy functions, from the first element of B at each node and the
+        rest of B at the first node.
+        Params: B_0, an array of the first element of B at each node and frame.
+        Returns: an array of flattened 2x2 matrices.
+        """
+        B = np.empty(np.shape(B_0)+(4,))
+        B[...,0] = B_0
+        B[...,1:] = self.rod.B_matrix[0][0][1:]
+        return B
     
     def get_twist_amount(self, set_twist_amount=False):
         """
@@ -782,37 +735,17 @@ class anal_rod:
             self.p_i = self.get_p_i(self.rod.current_r)
             self.equil_p_i = self.get_p_i(self.rod.equil_r)
         
-        self.twist_amount = np.zeros( [len(self.p_i), len(self.p_i[0])-1] )
-        self.twist_energy = np.zeros( [len(self.p_i), len(self.p_i[0])-1] )
+        num_pairs = len(self.p_i[0])-1
+        mim1, mi = self.rod.current_m[:,:num_pairs], self.rod.current_m[:,1:num_pairs+1]
+        pim1, pi = self.p_i[:,:-1], self.p_i[:,1:]
+        beta = self.rod.material_params[:,:num_pairs,1]
         
-        for frame in range(len(self.p_i)):
-            for element in range(len(self.p_i[frame])-1):
-                
-                mim1 = self.rod.current_m[frame][element]
-                mim1_equil = self.rod.equil_m[frame][element]
-                mi = self.rod.current_m[frame][element+1]
-                mi_equil = self.rod.equil_m[frame][element+1]
-                pi = self.p_i[frame][element+1]
-                pim1 = self.p_i[frame][element]
-                pim1_equil = self.equil_p_i[frame][element]
-                pi_equil = self.equil_p_i[frame][element+1]
-                beta = self.rod.material_params[frame][element][1]
-                twist_energy = self.py_rod_math.get_twist_energy(mim1, mim1_equil, mi, mi_equil, pim1, pim1_equil, pi, pi_equil, beta)
-
-                if set_twist_amount:
-                    mim1_transported = rod_math.parallel_transport(rod_math.normalize(mim1), rod_math.normalize(pim1), rod_math.normalize(pi))
-                    delta_theta = rod_math.get_signed_angle( mim1_transported, rod_math.normalize(mi), rod_math.normalize(pi))
-                    self.twist_amount[frame][element] = delta_theta
-                # parallel transport  mi to mip1
-                #mim1_transported = rod_math.parallel_transport(rod_math.normalize(self.rod.current_m[frame][element]), rod_math.normalize(self.p_i[frame][element]), rod_math.normalize(self.p_i[frame][element+1] ))
-                #delta_theta = rod_math.get_twist_angle( mim1_transported, rod_math.normalize(self.rod.current_m[frame][element+1]))
-                #equil_mim1_transported = rod_math.parallel_transport(rod_math.normalize(self.rod.equil_m[frame][element]), rod_math.normalize(self.equil_p_i[frame][element]), rod_math.normalize(self.equil_p_i[frame][element+1] ))
-                #equil_delta_theta = rod_math.get_twist_angle( equil_mim1_transported, rod_math.normalize(self.rod.equil_m[frame][element+1]))
-                
-                #self.twist_amount[frame][element] = delta_theta - equil_delta_theta
-                
-                #Li = rod_math.get_length(self.equil_p_i[frame][element]) + rod_math.get_length(self.equil_p_i[frame][element+1]) 
-                self.twist_energy[frame][element] = twist_energy #self.rod.material_params[frame][element][1]/Li * np.power(delta_theta-equil_delta_theta, 2)
+        self.twist_energy = FFEA_rod_math.get_twist_energy(mim1, self.rod.equil_m[:,:num_pairs], mi, self.rod.equil_m[:,1:num_pairs+1], pim1, self.equil_p_i[:,:-1], pi, self.equil_p_i[:,1:], beta)
+        
+        if set_twist_amount:
+            self.twist_amount = FFEA_rod_math.get_delta_theta(mim1, mi, pim1, pi)
+        else:
+            self.twist_amount = np.zeros(np.shape(self.twist_energy))
         
     def get_equipartition(self):
         """
@@ -913,14 +846,7 @@ class anal_rod:
             self.p_i = self.get_p_i(self.rod.current_r)
             self.equil_p_i = self.get_p_i(self.rod.equil_r)
             
-        self.stretch_energy = np.zeros([len(self.p_i), len(self.p_i[0]) ] )
-        
-        
-        for frame_no in range(len(self.stretch_energy)):
-            for element_no in range(len(self.p_i[frame_no])):
-                k = self.get_constant_parameter(0)/rod_math.get_length( self.equil_p_i[frame_no][element_no] )
-                delta_e = rod_math.get_length(self.p_i[frame_no][element_no]) - rod_math.get_length(self.equil_p_i[frame_no][element_no])
-                self.stretch_energy[frame_no][element_no] = 0.5*k*(delta_e**2)
+        self.stretch_energy = FFEA_rod_math.get_stretch_energy(self.get_constant_parameter(0), self.p_i, self.equil_p_i)
         
     def plot(self, force=None, temp=None):
         """
@@ -1252,26 +1178,15 @@ class anal_rod:
             translated_array[i] = np.dot(T, node_1)[:3]
         return translated_array
     
-    def align_to_equil(self):
+    def align_to_equil(self, weights=None):
         """
-        Align the trajectory to the equilibrium configuration using the icp
-        (iterative closest point) library.
-        Params: none
+        Align the trajectory to the equilibrium configuration. The nodes of
+        both are the same, so this is a best fit superposition of every frame
+        at once (see FFEA_rod_math.get_best_fit_transformation).
+        Params: weights - optionally, a weight for each node.
         Retruns: none, but updates self.rod.current_r
         """
-        try:
-            import icp
-        except ImportError:
-            raise ImportError("Please install the icp (iterative closest point) library!")
-        
-        for frame_index in range(len(self.rod.current_r)): # aargh
-            T, distances = icp.icp(self.rod.current_r[frame_index], self.rod.equil_r[frame_index], max_iterations=10000, tolerance = 1e-9)
-            self.rod.current_r[frame_index] = self.apply_transformation_4x4(self.rod.current_r[frame_index], T)
-
-            if frame_index % 1000 == 0:
-                print("Aligning frame "+str(frame_index)+"...")
-                
-        return
+        self.rod.current_r[...] = FFEA_rod_math.superpose(self.rod.current_r, self.rod.equil_r, weights)
         
     def thin(self, target_num_frames):
         """
@@ -1284,20 +1199,10 @@ class anal_rod:
         """
         interval = int(len(self.rod.current_r)/target_num_frames)
         
-        self.rod.equil_r = self.rod.equil_r[::interval]
-        self.rod.equil_m = self.rod.equil_m[::interval]
-        self.rod.current_r = self.rod.current_r[::interval]
-        self.rod.current_m  = self.rod.current_m[::interval]
-        self.rod.perturbed_x_energy_positive = self.rod.perturbed_x_energy_positive[::interval]
-        self.rod.perturbed_y_energy_positive = self.rod.perturbed_y_energy_positive[::interval]
-        self.rod.perturbed_z_energy_positive = self.rod.perturbed_z_energy_positive[::interval]
-        self.rod.twisted_energy_positive = self.rod.twisted_energy_positive[::interval]
-        self.rod.perturbed_x_energy_negative = self.rod.perturbed_x_energy_negative[::interval]
-        self.rod.perturbed_y_energy_negative = self.rod.perturbed_y_energy_negative[::interval]
-        self.rod.perturbed_z_energy_negative = self.rod.perturbed_z_energy_negative[::interval]
-        self.rod.twisted_energy_negative = self.rod.twisted_energy_negative[::interval]
-        self.rod.material_params = self.rod.material_params[::interval]
-        self.rod.B_matrix = self.rod.B_matrix[::interval]
+        # Slices are views, so this copies nothing, even for a memory mapped rod
+        for row in rod_row_names:
+            if getattr(self.rod, row) is not None:
+                setattr(self.rod, row, getattr(self.rod, row)[::interval])
         self.rod.num_frames = len(self.rod.current_r)
 
         try:
@@ -1309,51 +1214,20 @@ class anal_rod:
         except AttributeError:
             pass
     
-    def get_node_rmsd(self, align=False):
+    def get_node_rmsd(self, align=False, weights=None):
         """
         Get the per-node RMSD for the rod. Otherwise known as the time-averaged
         RMSD for each node.
-        Params: align - whether the trajectory has already been aligned to the
-        equilibrium configuration. If not, it uses the iterative closest point
-        algorithm to align them. Please note: this algorithm can get confused
-        with very bendy rods. If you see a gigantic spike in the middle of your
-        RMSD, then it's confused (easier to spot in get_time_rmsd).
+        Params: align - whether to align the trajectory to the equilibrium
+        configuration first. If so, the equilibrium configuration of each frame
+        is best fitted onto the current one (this changes self.rod.equil_r).
+        weights - optionally, a weight for each node, used for the alignment.
         Returns: the rmsd, a 1d numpy array indexed by node.
         """
-        
-        rmsd = np.zeros(len(self.rod.current_r[0]))
-
-        
         if align:
-            try:
-                import icp
-            except ImportError:
-                raise ImportError("Please install the icp (iterative closest point) library!")
-
+            self.rod.equil_r[...] = FFEA_rod_math.superpose(self.rod.equil_r, self.rod.current_r, weights)
         
-        if align:
-            for frame_index in range(len(self.rod.current_r)): # aargh
-                if frame_index%15000 == 0:
-                    # note: icp algorithm is confused if it has to start from scratch all the time,
-                    #but we reset it every so often to mitigate against floating point errors
-                    T, distances = icp.icp(self.rod.equil_r[frame_index], self.rod.current_r[frame_index], max_iterations=10000, tolerance = 1e-9)
-                    self.rod.equil_r[frame_index] = self.apply_transformation_4x4(self.rod.equil_r[frame_index], T)
-                else:
-                    T, distances = icp.icp(self.rod.equil_r[frame_index-1], self.rod.current_r[frame_index], max_iterations=10000, tolerance = 1e-9)
-                    self.rod.equil_r[frame_index] = self.apply_transformation_4x4(self.rod.equil_r[frame_index-1], T)
-
-                if frame_index % 1000 == 0:
-                    print("Aligning frame "+str(frame_index)+"...")
-        #N = len(equil)
-        
-        for node_no in range(len(rmsd)):
-        
-            current = self.rod.current_r[:,node_no]
-            equil = self.rod.equil_r[:,node_no]
-        
-            rmsd[node_no] = np.sqrt( np.average(  np.linalg.norm(current - equil, axis=1)**2  )  ) # need get length!!!!
-        
-        return rmsd
+        return np.sqrt( np.average( np.sum( (self.rod.current_r - self.rod.equil_r)**2, axis=2 ), axis=0 ) )
     
     def get_B_eigenvalues(self):
         """
@@ -1389,12 +1263,7 @@ class anal_rod:
         current_r = self.rod.current_r[:max_frame_index]
         equil_r = self.rod.equil_r[:max_frame_index]
         
-        rmsds = np.zeros(len(equil_r))
-        
-        for frame in range(len(rmsds)):
-            rmsds[frame] = np.sqrt(np.average( np.linalg.norm(current_r[frame] - equil_r[frame], axis=1)**2 ))
-        
-        return rmsds
+        return np.sqrt( np.average( np.sum( (current_r - equil_r)**2, axis=2 ), axis=1 ) )
 
     def subdivide(self, iterations):
         """
@@ -1648,7 +1517,7 @@ class py_rod_math:
         equil_delta_theta = rod_math.get_signed_angle(equil_mim1_transported, rod_math.normalize(mi_equil), rod_math.normalize(pi_equil))
         Li = (rod_math.get_length(pim1_equil) + rod_math.get_length(pi_equil))/2
         twist_energy = beta/(2*Li) * np.power( np.mod(delta_theta-equil_delta_theta + np.pi, 2*np.pi) - np.pi, 2)
-        return float(twist_energy)
+        return float(np.asarray(twist_energy).item())
     
     def get_bend_energy(self, p_im1, p_i, p_im1_equil, p_i_equil, n_im1, m_im1, n_im1_equil, m_im1_equil, n_i, m_i, n_i_equil, m_i_equil, B_i_equil, B_im1_equil):
         raise Exception("Not implemented yet!")
@@ -2099,6 +1968,144 @@ def load_grace(filename, comment="#"):
     
     return header_columns, data
 
+def get_rod_row_indices(rows=None):
+    """
+    Turn a list of row names (or older aliases) into indices in
+    rod_row_names, in file order. None means every row.
+    """
+    if rows is None:
+        return list(range(len(rod_row_names)))
+    rows = [rod_row_aliases.get(row, row) for row in rows]
+    for row in rows:
+        if row not in rod_row_names:
+            raise ValueError("Unknown rod trajectory row '"+str(row)+"'. Rows are "+", ".join(rod_row_names)+".")
+    return [i for i in range(len(rod_row_names)) if rod_row_names[i] in rows]
+
+# Binary rod trajectory (.rodtrajb) layout. Everything is little-endian.
+#
+#   char[8] magic, "FFEARODB"
+#   uint32  version
+#   uint32  header size in bytes (the first block starts here)
+#   uint32  rod_id, num_rods, num_elements, num_frames, num_fields
+#   for each field:
+#       char[32] name (one of rod_row_names, zero padded)
+#       uint32   values per element (3 for vectors, 4 for B_matrix)
+#
+# The header is zero padded to a multiple of 8 bytes and is followed by one
+# contiguous (num_frames x num_elements x values) block of doubles per field,
+# in header order, so each field can be memory mapped on its own.
+ROD_BINARY_MAGIC = b"FFEARODB"
+ROD_BINARY_VERSION = 1
+
+def is_binary_rod_trajectory(filename):
+    try:
+        with open(filename, "rb") as rod_file:
+            return rod_file.read(len(ROD_BINARY_MAGIC)) == ROD_BINARY_MAGIC
+    except IOError:
+        return False
+
+def make_rod_binary_header(rod_id, num_rods, num_elements, num_frames, fields):
+    """
+    Build the header dictionary of a binary rod trajectory.
+    Params: the rod id, number of rods, elements and frames, and a list of
+    (field name, values per element) pairs.
+    Returns: the header dictionary, with its size and the byte offset of
+    each field's block filled in.
+    """
+    header = {"version": ROD_BINARY_VERSION, "rod_id": int(rod_id),
+              "num_rods": int(num_rods), "num_elements": int(num_elements),
+              "num_frames": int(num_frames),
+              "fields": [(name, int(num_values)) for name, num_values in fields]}
+
+    size = 8 + 7*4 + 36*len(fields)
+    header["header_size"] = size + (-size % 8)
+
+    header["offsets"] = {}
+    offset = header["header_size"]
+    for name, num_values in header["fields"]:
+        header["offsets"][name] = offset
+        offset += 8*header["num_frames"]*header["num_elements"]*num_values
+    return header
+
+def read_rod_binary_header(filename):
+    """
+    Read the header of a binary rod trajectory.
+    Returns: a header dictionary (see make_rod_binary_header).
+    """
+    try:
+        rod_file = open(filename, "rb")
+    except IOError:
+        raise IOError("Failed to open '"+filename+"' for reading.")
+
+    try:
+        if rod_file.read(len(ROD_BINARY_MAGIC)) != ROD_BINARY_MAGIC:
+            raise IOError("Expected binary rod trajectory magic number '"+ROD_BINARY_MAGIC.decode()+"' in '"+filename+"'.")
+        version, header_size, rod_id, num_rods, num_elements, num_frames, num_fields = struct.unpack("<7I", rod_file.read(28))
+        if version != ROD_BINARY_VERSION:
+            raise IOError("Binary rod trajectory version "+str(version)+" in '"+filename+"' is not supported.")
+        fields = []
+        for i in range(num_fields):
+            name = rod_file.read(32).rstrip(b"\0").decode()
+            fields.append((name, struct.unpack("<I", rod_file.read(4))[0]))
+    except struct.error:
+        raise IOError("Binary rod trajectory header in '"+filename+"' is truncated.")
+    finally:
+        rod_file.close()
+
+    header = make_rod_binary_header(rod_id, num_rods, num_elements, num_frames, fields)
+    if header["header_size"] != header_size:
+        raise IOError("Binary rod trajectory header in '"+filename+"' is inconsistent ("+str(header_size)+" bytes declared, "+str(header["header_size"])+" found).")
+    return header
+
+def write_rod_binary_header(rod_file, header):
+    data = ROD_BINARY_MAGIC
+    data += struct.pack("<7I", header["version"], header["header_size"], header["rod_id"], header["num_rods"], header["num_elements"], header["num_frames"], len(header["fields"]))
+    for name, num_values in header["fields"]:
+        data += name.encode().ljust(32, b"\0") + struct.pack("<I", num_values)
+    rod_file.write(data + b"\0"*(header["header_size"] - len(data)))
+
+def convert_rodtraj_to_binary(filename, out_filename):
+    """
+    Convert a text .rodtraj into the binary format, one frame at a time.
+    The file is read twice - once, without parsing, to count the frames, and
+    once to fill in the memory mapped blocks of the output - so only one
+    frame is ever held in memory.
+    """
+    rod = FFEA_rod(filename, rows=[])
+    num_frames = rod.num_frames
+
+    # Row sizes come from the first frame
+    fields = []
+    for wanted in rod.iter_trajectory_lines(stop=1):
+        fields = [(rod_row_names[i], (wanted[i].count(",") + 1)//rod.num_elements) for i in range(len(rod_row_names))]
+    if fields == []:
+        fields = [(name, 4 if name == "B_matrix" else 3) for name in rod_row_names]
+
+    header = make_rod_binary_header(rod.rod_id, rod.num_rods, rod.num_elements, num_frames, fields)
+    with open(out_filename, "wb") as rod_file:
+        write_rod_binary_header(rod_file, header)
+        rod_file.truncate(header["offsets"][fields[-1][0]] + 8*num_frames*rod.num_elements*fields[-1][1])
+    if num_frames == 0:
+        return
+
+    blocks = [np.memmap(out_filename, dtype="<f8", mode="r+", offset=header["offsets"][name], shape=(num_frames, rod.num_elements, num_values)) for name, num_values in fields]
+    sizes = [block[0].size for block in blocks]
+    for frame_no, wanted in enumerate(rod.iter_trajectory_lines()):
+        data = np.fromstring(",".join(wanted), sep=",")
+        if data.size != sum(sizes):
+            raise ValueError("Expected "+str(sum(sizes))+" values, read "+str(data.size)+"\nError converting frame "+str(frame_no))
+        offset = 0
+        for block, size in zip(blocks, sizes):
+            block[frame_no] = data[offset:offset + size].reshape(block.shape[1:])
+            offset += size
+
+    for block in blocks:
+        block.flush()
+
+def convert_binary_to_rodtraj(filename, out_filename):
+    rod = FFEA_rod(filename)
+    rod.write_rod(out_filename)
+
 ### deprecated; will be removed
 
 #def mpt_weight(a, b):
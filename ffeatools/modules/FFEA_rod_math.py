@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+#
+#  This file is part of the FFEA simulation package
+#
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file.
+#
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  To help us fund FFEA development, we humbly ask that you cite
+#  the research papers on the package.
+#
+
+"""
+Batched versions of the rod math functions in FFEA_rod.py (py_rod_math) and
+rod_math_core.c. Instead of one pair of elements at a time, these work on
+whole arrays of vectors, e.g. [frame][element][x,y,z], so a whole trajectory
+can be analysed without any python loops. Every argument can have any number
+of leading dimensions, as long as they broadcast against each other; the last
+dimension is always the vector (3) or, for B, the flattened 2x2 matrix (4).
+The formulas are the same as the ones in rod_math.cpp.
+"""
+
+import numpy as np
+
+def dot(a, b):
+    """
+    Dot product of the vectors in the last dimension of a and b.
+    """
+    return np.einsum("...i,...i->...", a, b)
+
+def get_length(vec):
+    """
+    Get the length of each vector, an array with one less dimension.
+    """
+    return np.sqrt(dot(vec, vec))
+
+def normalize(vec):
+    """
+    Get the normalized version of each vector.
+    """
+    return vec/get_length(vec)[...,np.newaxis]
+
+def get_p_i(r):
+    """
+    Get the elements p_i from the node positions (e.g. current_r, equil_r).
+    Params: r, an array of [frame][node][x,y,z].
+    Returns: an array of [frame][element][x,y,z], one element shorter than r.
+    """
+    r = np.asarray(r)
+    return r[...,1:,:] - r[...,:-1,:]
+
+def get_l_i(p_im1, p_i):
+    """
+    Get the length associated with the node between two elements, half the
+    length of both of them.
+    """
+    return (get_length(p_im1) + get_length(p_i))/2.0
+
+def get_kb_i(p_im1, p_i):
+    """
+    Get the curvature binormal kb_i for each pair of elements.
+    """
+    return 2*np.cross(p_im1, p_i)/(get_length(p_im1)*get_length(p_i) + dot(p_im1, p_i))[...,np.newaxis]
+
+def parallel_transport(m, a, b):
+    """
+    Transport each material axis m from the basis of the normalized element a
+    to the basis of the normalized element b. This is the same as applying the
+    rotation matrix R = I + [v]x + [v]x^2/(1+c), where v = a x b and c = a.b.
+    """
+    v = np.cross(a, b)
+    c = dot(a, b)
+    v_cross_m = np.cross(v, m)
+    return m + v_cross_m + np.cross(v, v_cross_m)/(1 + c)[...,np.newaxis]
+
+def get_signed_angle(m1, m2, l):
+    """
+    Get the signed angle between m1 and m2 (left hand rotation) about the
+    normalized element l, in radians.
+    """
+    return np.arctan2(dot(np.cross(m2, m1), l), dot(m1, m2))
+
+def rodrigues(v, k, theta):
+    """
+    Rotate each vector v about the axis k by the angle theta (a float, or an
+    array with one less dimension than v).
+    """
+    k = normalize(k)
+    cos_theta = np.cos(theta)[...,np.newaxis]
+    sin_theta = np.sin(theta)[...,np.newaxis]
+    return cos_theta*v + np.cross(k, v)*sin_theta + k*dot(k, v)[...,np.newaxis]*(1 - cos_theta)
+
+def get_omega(kb_i, n, m):
+    """
+    Get the material curvature omega, a 2-vector, of kb_i in the material
+    frame given by n and m.
+    """
+    return np.stack([dot(kb_i, n), -dot(kb_i, m)], axis=-1)
+
+def get_bend_inner(delta_omega, B):
+    """
+    Get delta_omega^T B delta_omega for each 2-vector delta_omega and each
+    flattened 2x2 matrix B.
+    """
+    return (delta_omega[...,0]*(delta_omega[...,0]*B[...,0] + delta_omega[...,1]*B[...,1]) +
+            delta_omega[...,1]*(delta_omega[...,0]*B[...,2] + delta_omega[...,1]*B[...,3]))
+
+def get_stretch_energy(k, p_i, p_i_equil):
+    """
+    Get the stretch energy of each element.
+    Params: k, the stretching constant; p_i and p_i_equil, the current and
+    equilibrium elements.
+    Returns: the stretch energy.
+    """
+    equil_length = get_length(p_i_equil)
+    diff = get_length(p_i) - equil_length
+    return (diff*diff*0.5*k)/equil_length
+
+def get_delta_theta(m_im1, m_i, p_im1, p_i):
+    """
+    Get the twist angle between each pair of elements: the signed angle
+    between m_i and m_im1, once m_im1 has been parallel transported onto p_i.
+    """
+    l_i = normalize(p_i)
+    m_im1_transported = parallel_transport(normalize(m_im1), normalize(p_im1), l_i)
+    return get_signed_angle(m_im1_transported, normalize(m_i), l_i)
+
+def get_twist_energy(m_im1, m_im1_equil, m_i, m_i_equil, p_im1, p_im1_equil, p_i, p_i_equil, beta):
+    """
+    Get the twist energy between each pair of elements. The arguments are the
+    same as py_rod_math.get_twist_energy, but every one can be an array.
+    Returns: the twist energy.
+    """
+    delta_theta = get_delta_theta(m_im1, m_i, p_im1, p_i)
+    equil_delta_theta = get_delta_theta(m_im1_equil, m_i_equil, p_im1_equil, p_i_equil)
+    L_i = get_l_i(p_im1_equil, p_i_equil)
+    return beta/(2*L_i) * np.power(np.mod(delta_theta - equil_delta_theta + np.pi, 2*np.pi) - np.pi, 2)
+
+def get_element_omega(p_im1, p_i, m_im1, m_i):
+    """
+    Get omega for each pair of elements, once in the material frame of each
+    element, with n = m x l as in rod_math.cpp.
+    Returns: omega_im1 and omega_i, arrays of 2-vectors.
+    """
+    kb_i = get_kb_i(p_im1, p_i)
+    m_im1 = normalize(m_im1)
+    m_i = normalize(m_i)
+    omega_im1 = get_omega(kb_i, np.cross(m_im1, normalize(p_im1)), m_im1)
+    omega_i = get_omega(kb_i, np.cross(m_i, normalize(p_i)), m_i)
+    return omega_im1, omega_i
+
+def get_mutual_frame(p_im1, p_i, m_im1, m_i, rotate=None):
+    """
+    Get the mutual material frame at the node between each pair of elements.
+    The mutual element is the weighted average of both elements, and the
+    mutual material axis is the weighted average of both material axes, once
+    they have been parallel transported onto it.
+    Params: the elements and material axes either side of the node, and
+    optionally an angle to rotate the mutual material axis by.
+    Returns: l and m, the mutual element and material axis (both normalized).
+    """
+    l_im1 = normalize(p_im1)
+    l_i = normalize(p_i)
+    weight = (get_length(p_im1)/(get_length(p_im1) + get_length(p_i)))[...,np.newaxis]
+    mutual_l = normalize(l_im1/weight + l_i/(1 - weight))
+    mutual_m_im1 = parallel_transport(normalize(m_im1), l_im1, mutual_l)
+    mutual_m_i = parallel_transport(normalize(m_i), l_i, mutual_l)
+    mutual_m = normalize(mutual_m_im1/weight + mutual_m_i/(1 - weight))
+    if rotate:
+        mutual_m = rodrigues(mutual_m, mutual_l, rotate)
+    return mutual_l, mutual_m
+
+def get_mutual_omega(p_im1, p_i, m_im1, m_i, rotate=None):
+    """
+    Get omega for each pair of elements in their mutual material frame, with
+    n = l x m as in rod_math_core.c.
+    """
+    mutual_l, mutual_m = get_mutual_frame(p_im1, p_i, m_im1, m_i, rotate)
+    return get_omega(get_kb_i(p_im1, p_i), np.cross(mutual_l, mutual_m), mutual_m)
+
+def get_mutual_delta_omega(p_im1, p_i, p_im1_equil, p_i_equil, m_im1, m_i, m_im1_equil, m_i_equil, rotate=None):
+    """
+    Get delta omega, omega - omega_equil, in the mutual material frame, for
+    each pair of elements.
+    Returns: delta_omega, an array of 2-vectors, and L_i, the length
+    associated with each node at equilibrium.
+    """
+    omega = get_mutual_omega(p_im1, p_i, m_im1, m_i, rotate)
+    omega_equil = get_mutual_omega(p_im1_equil, p_i_equil, m_im1_equil, m_i_equil)
+    return omega - omega_equil, get_l_i(p_im1_equil, p_i_equil)
+
+def get_bend_energy_mutual(p_im1, p_i, p_im1_equil, p_i_equil, m_im1, m_i, m_im1_equil, m_i_equil, B):
+    """
+    Get the bend energy between each pair of elements using the mutual
+    parallel transport method.
+    Params: the current and equilibrium elements and material axes either
+    side of each node, and B, the flattened 2x2 bending matrix at each node.
+    Returns: the bend energy.
+    """
+    delta_omega, L_i = get_mutual_delta_omega(p_im1, p_i, p_im1_equil, p_i_equil, m_im1, m_i, m_im1_equil, m_i_equil)
+    return 0.5*get_bend_inner(delta_omega, B)/L_i
+
+def get_best_fit_transformation(mobile, target, weights=None):
+    """
+    Get the rigid body transformation that best superposes each set of points
+    in mobile onto the same set in target (the Kabsch algorithm). The points
+    are assumed to correspond already, node for node, so unlike iterative
+    closest point there is no searching: every frame is done at once, with
+    one SVD of a stack of 3x3 covariance matrices.
+    Params: mobile and target, arrays of [frame][node][x,y,z] (or a single
+    [node][x,y,z]); optionally weights, one for each node (or each frame and
+    node), for a mass-weighted fit.
+    Returns: R and t, arrays of [frame][3][3] rotation matrices and
+    [frame][3] translations, such that mobile.R^T + t best fits target.
+    """
+    mobile = np.asarray(mobile, dtype=float)
+    target = np.asarray(target, dtype=float)
+    if weights is None:
+        weights = np.ones(mobile.shape[:-1])
+    weights = np.broadcast_to(np.asarray(weights, dtype=float), mobile.shape[:-1])[...,np.newaxis]
+
+    mobile_centroid = np.sum(weights*mobile, axis=-2)/np.sum(weights, axis=-2)
+    target_centroid = np.sum(weights*target, axis=-2)/np.sum(weights, axis=-2)
+
+    # Covariance matrix for each frame
+    H = np.einsum("...ni,...nj->...ij", weights*(mobile - mobile_centroid[...,np.newaxis,:]), target - target_centroid[...,np.newaxis,:])
+    U, S, Vt = np.linalg.svd(H)
+
+    # Make sure R is a rotation, not a reflection
+    V = np.swapaxes(Vt, -1, -2)
+    Ut = np.swapaxes(U, -1, -2)
+    V[...,:,2] *= np.sign(np.linalg.det(np.matmul(V, Ut)))[...,np.newaxis]
+    R = np.matmul(V, Ut)
+
+    t = target_centroid - np.einsum("...ij,...j->...i", R, mobile_centroid)
+    return R, t
+
+def apply_transformation(pos, R, t):
+    """
+    Apply a rotation matrix R and translation t (e.g. from
+    get_best_fit_transformation) to each frame of pos, an array of
+    [frame][node][x,y,z].
+    """
+    return np.einsum("...ij,...nj->...ni", R, pos) + np.asarray(t)[...,np.newaxis,:]
+
+def superpose(mobile, target, weights=None):
+    """
+    Get mobile, best fitted onto target, for every frame.
+    """
+    R, t = get_best_fit_transformation(mobile, target, weights)
+    return apply_transformation(mobile, R, t)
@@ -603,8 +603,8 @@ class FFEA_script:
 	def load_trajectory(self, num_frames=100000000, start=0, frame_rate = 1):
 		return FFEA_trajectory.FFEA_trajectory(self.params.trajectory_out_fname, num_frames_to_read = num_frames, start=start, frame_rate = frame_rate)
 
-	def load_measurement(self, num_frames=100000000):
-		return FFEA_measurement.FFEA_measurement(self.params.measurement_out_fname, num_frames_to_read = num_frames)
+	def load_measurement(self, num_frames=100000000, cache=False):
+		return FFEA_measurement.FFEA_measurement(self.params.measurement_out_fname, num_frames_to_read = num_frames, cache = cache)
 
 	def load_lj(self):
 		return FFEA_lj.FFEA_lj(self.params.vdw_forcefield_params)
@@ -25,6 +25,7 @@ import sys, os
 from time import sleep
 from numpy import pi
 from FFEA_exceptions import *
+from FFEA_io import *
 
 class FFEA_stokes:
 
@@ -94,13 +95,8 @@ class FFEA_stokes:
 
 		num_nodes = int(fin.readline().split()[1])
 
-		# Read stokes radii now
-		while(True):
-			line = fin.readline().strip()
-			if line == "":
-				break
-			else:
-				self.add_node(line)
+		# Read stokes radii now, all at once
+		self.add_nodes(parse_block(read_lines(fin), 1, lin=3, lstr="%f")[:,0].tolist())
 
 		fin.close()
 
@@ -122,12 +118,16 @@ class FFEA_stokes:
 		self.radius.append(float(afloat))
 		self.num_nodes += 1
 
+	def add_nodes(self, radii):
+
+		self.radius.extend([float(r) for r in radii])
+		self.num_nodes += len(radii)
+
 	def write_to_file(self, fname):
 
 		with open(fname, "w") as f:
 			f.write("ffea stokes radii file\nnum_nodes %d\n" % (self.num_nodes))
-			for rad in self.radius:
-				f.write("%6.3f\n" % (rad))
+			write_block(f, self.radius, "%6.3f\n")
 	
 	def print_details(self):
 
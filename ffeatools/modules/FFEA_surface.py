@@ -25,6 +25,7 @@ import sys, os
 from time import sleep
 import numpy as np
 from FFEA_exceptions import *
+from FFEA_io import *
 
 # from line_profiler import LineProfiler
 
@@ -119,37 +120,36 @@ class FFEA_surface:
 
 		fin.readline()
 
-		# Read faces now	
-		while(True):
-			sline = fin.readline().split()
+		# Read faces now, all at once, either just faces or faces with their parent elements first
+		lines = read_lines(fin)
+		fin.close()
 
-			if len(sline) == 0:
-				break
+		if len(lines) == 0:
+			return
 
-			# Get a face	
-			if len(sline) == 3 or len(sline) == 4:
-				f = FFEA_face_tri_lin()
+		n = parse_lines(lines, dtype=np.int32)
+		if n is not None and (n.shape[1] == 3 or n.shape[1] == 6):
+			self.add_faces(n)
+			return
 
-				if len(sline) == 3:
-					# Just a face
-					f.set_indices(sline)
-				else:
-					# Face with parent element
-					f.set_indices(sline[1:], elindex = sline[0])
+		elif n is not None and (n.shape[1] == 4 or n.shape[1] == 7):
+			self.add_faces(n[:,1:], elindex = n[:,0])
+			return
 
-			elif len(sline) == 6 or len(sline) == 7:
-				f = FFEA_face_tri_sec()
+		# Otherwise, a face at a time
+		n = []
+		elindex = []
+		for line in lines:
+			sline = line.split()
+			if len(sline) == 3 or len(sline) == 6:
+				n.append([int(i) for i in sline])
+				elindex.append(-1)
 
-				if len(sline) == 6:
-					# Just a face
-					f.set_indices(sline)
-				else:
-					# Face with parent element
-					f.set_indices(sline[1:], elindex = sline[0])
+			elif len(sline) == 4 or len(sline) == 7:
+				n.append([int(i) for i in sline[1:]])
+				elindex.append(int(sline[0]))
 
-			self.add_face(f)
-
-		fin.close()
+		self.add_faces(n, elindex = elindex)
 
 	def load_stl(self, fname):
 
@@ -196,6 +196,7 @@ class FFEA_surface:
 
 		lines = lines[start_index:]
 
+		n = []
 		for line in lines:
 			if line[0] != "f":
 				continue
@@ -206,9 +207,9 @@ class FFEA_surface:
 			except:
 				sline = [np.absolute(int(s.split("//")[0])) - 1 for s in sline]
 
-			f = FFEA_face_tri_lin()
-			f.set_indices(sline)
-			self.add_face(f)
+			n.append(sline)
+
+		self.add_faces(n)
 
 	def load_face(self, fname):
 
@@ -228,20 +229,19 @@ class FFEA_surface:
 		num_faces = int(sline[0])
 
 		# Read faces now	
+		n = []
 		while(True):
 			sline = fin.readline().split()
 
-			if sline[0].strip() == "#":
+			if len(sline) == 0 or sline[0].strip() == "#":
 				break
 
 			# Get a face
 			sline = sline[1:4]
-			sline = [int(s) - 1 for s in sline]
-			f = FFEA_face_tri_lin()
-			f.set_indices(sline)
-			self.add_face(f)
+			n.append([int(s) - 1 for s in sline])
 
 		fin.close()
+		self.add_faces(n)
 
 	def load_vol(self, fname):
 
@@ -270,68 +270,123 @@ class FFEA_surface:
 		# Get num_faces
 		i += 1
 		num_faces = int(lines[i])
-		zeroindexing = False
-		for j in range(i + 1, i + 1 + num_faces):
-			try:
-				sline = lines[j].split()[5:]
-				face = FFEA_face_tri_lin()
-				
-				# Test indices
-				for s in sline:
-					if s.strip() == "0":
-						zeroindexing = True
-						break
- 
-				face.set_indices(sline[:3])
-				self.add_face(face)
+		try:
+			n = np.array([lines[j].split()[5:8] for j in range(i + 1, i + 1 + num_faces)], dtype=np.int32).reshape(num_faces, 3)
+		except:
+			self.reset()
+			raise Exception("\tCouldn't find the specified %d faces. File '" % (num_faces) + fname + "' not formatted correctly.")
 
-			except:
-				self.reset()
-				raise Exception("\tCouldn't find the specified %d faces. Only found %d. File '" + fname + "' not formatted correctly." % (num_faces, i))
+		# Indexing from 0, unless any index is already 0
+		if not np.any(n == 0):
+			n -= 1
 
-		# Indexing from 0
-		if not zeroindexing:
-			for i in range(self.num_faces):
-				for j in range(3):
-					self.face[i].n[j] -= 1
+		self.add_faces(n)
 	def add_face(self, f):
-		self.face.append(f)
-		self.num_faces += 1
 
-	def get_element_indices(self, top):
+		# Copies the face into the arrays. From now on, it is self.face[-1]
+		if f.elindex == None:
+			self.add_faces([f.n], elindex = [-1])
+		else:
+			self.add_faces([f.n], elindex = [f.elindex])
+
+	def add_faces(self, n, elindex = None):
+		"""
+		Add many faces at once.
+		In: self, an array of [face][3 or 6 nodes] (or a list of node lists,
+		which can mix the two), and the parent element of each face (-1 if
+		it is not known; all unknown if None).
+		"""
+		if len(n) == 0:
+			return
 
-		elcheck = range(top.num_elements)
-		index = -1
-		for f in self.face:
-			index += 1			
-			success = 0
-			for i in elcheck:
-				compare = 0
-				for j in range(3):
-					if f.n[j] in top.element[i].n:
-						compare += 1
-				if compare == 3:
-					success = 1
-					f.elindex = i
-					#elcheck.remove(i)	# Can't remove, as elements can have more than one surface face (especially in coarse structures :( )
-					break
+		if elindex is None:
+			elindex = -1 * np.ones(len(n), dtype=np.int32)
+		elindex = np.asarray(elindex, dtype=np.int32).reshape(-1)
+
+		# Widen mixed lists with -1, as in the arrays
+		if isinstance(n, np.ndarray):
+			width = n.shape[1]
+		else:
+			width = max([len(f) for f in n])
+			n = [list(f) + [-1] * (width - len(f)) for f in n]
+
+		start = len(self.face_nodes)
+		self.reserve_faces(start + len(n), width)
+		self.face_nodes = self.face_buffer[0][:start + len(n)]
+		self.face_elindex = self.face_buffer[1][:start + len(n)]
+		self.face_nodes[start:] = -1
+		self.face_nodes[start:,:width] = n
+		self.face_elindex[start:] = elindex
+		self.num_faces += len(n)
+
+	def reserve_faces(self, num_faces, num_nodes = 3):
+		"""
+		Make sure the face arrays have room for num_faces faces with
+		num_nodes nodes each, growing their buffers geometrically.
+		"""
+		width = max(num_nodes, self.face_nodes.shape[1])
+		if self.face_buffer != None:
+			nodes, elindex = self.face_buffer
+			if self.face_nodes.base is nodes and self.face_elindex.base is elindex and len(nodes) >= num_faces and nodes.shape[1] == width:
+				return
+
+		num = len(self.face_nodes)
+		nodes = -1 * np.ones([max(num_faces, 2 * num), width], dtype=np.int32)
+		elindex = -1 * np.ones(len(nodes), dtype=np.int32)
+		nodes[:num,:self.face_nodes.shape[1]] = self.face_nodes
+		elindex[:num] = self.face_elindex
+		self.face_buffer = (nodes, elindex)
+		self.face_nodes = nodes[:num]
+		self.face_elindex = elindex[:num]
+
+	def set_faces(self, n, elindex = None):
+		"""
+		Replace all of the faces with new ones (see add_faces).
+		"""
+		self.reset_faces()
+		self.add_faces(n, elindex = elindex)
+
+	def get_face(self, index):
+		"""
+		Get face index as an FFEA_face object, a view into the arrays.
+		"""
+		if self.face_nodes.shape[1] == 6 and self.face_nodes[index,3] != -1:
+			return FFEA_face_tri_sec(surf = self, index = index)
+		else:
+			return FFEA_face_tri_lin(surf = self, index = index)
 
-			if success != 1:
-				print("Face " + str(index) + " could not be found in the topology structure. This topology cannot be paired with this surface. Regenerating surface...")
-				print("Face in error = ", self.face[index].n)
-				for f in self.face:
-					f.elindex = None
-				return -1
+	def get_face_nodes(self, index):
 
-	def upgrade_face(self, index):
+		if self.face_nodes.shape[1] == 6 and self.face_nodes[index,3] == -1:
+			return self.face_nodes[index,:3]
+		return self.face_nodes[index]
 
-		# Replace element with a higher order one
-		f = FFEA_face_tri_sec()
-		f.n = self.face[index].n
-		f.elindex = self.face[index].elindex
+	def set_face_nodes(self, index, n):
 
-		self.face.insert(index, f)
-		self.face.pop(index + 1)
+		if len(n) > self.face_nodes.shape[1]:
+			self.reserve_faces(len(self.face_nodes), len(n))
+		self.face_nodes[index] = -1
+		self.face_nodes[index,:len(n)] = n
+
+	def get_element_indices(self, top):
+
+		# Look every face up in the face index of the topology at once. Faces shared by two elements get the lower index
+		if self.num_faces == 0:
+			return
+		elindex = top.get_face_index().get_elements(self.face_nodes[:,:3])
+		if np.any(elindex == -1):
+			index = np.flatnonzero(elindex == -1)[0]
+			print("Face " + str(index) + " could not be found in the topology structure. This topology cannot be paired with this surface. Regenerating surface...")
+			print("Face in error = ", self.face[index].n)
+			self.face_elindex[:] = -1
+			return -1
+
+		self.face_elindex[:] = elindex
+
+	def upgrade_face(self, index, midpoints):
+
+		# Replace face with a higher order one, given the nodes at the midpoints of its edges (01, 02, 12)
+		self.set_face_nodes(index, list(self.get_face_nodes(index)[0:3]) + list(midpoints))
 
 	def split_face(self, index):
 
@@ -340,44 +395,50 @@ class FFEA_surface:
 			
 			# Order is lin0, lin1, lin2, sec01, sec02, sec12
 			# So, 4 tris are 034, 153, 245, 354
-			oldf = self.face[index]
-			f = [FFEA_face_tri_lin() for i in range(4)]
-			f[0].set_indices([oldf.n[0], oldf.n[3], oldf.n[4]], oldf.elindex)
-			f[1].set_indices([oldf.n[1], oldf.n[5], oldf.n[3]], oldf.elindex)
-			f[2].set_indices([oldf.n[2], oldf.n[4], oldf.n[5]], oldf.elindex)
-			f[3].set_indices([oldf.n[3], oldf.n[5], oldf.n[4]], oldf.elindex)
-			
-			# Insert in this order after the old face
-			for face in f:
-				self.face.append(face)
-			
-			self.face.pop(index)
+			n = self.face_nodes[index]
+			elindex = self.face_elindex[index]
+			f = [[n[0], n[3], n[4]], [n[1], n[5], n[3]], [n[2], n[4], n[5]], [n[3], n[5], n[4]]]
 
-			# 1 -> 4 means += 3
-			self.num_faces += 3
+			# Add them at the end, and remove the old face. 1 -> 4 means += 3
+			self.add_faces(f, elindex = [elindex] * 4)
+			self.face_nodes = np.delete(self.face_nodes, index, axis = 0)
+			self.face_elindex = np.delete(self.face_elindex, index)
+			self.num_faces -= 1
 
 	def check_normals(self, node, top):
 		
 		# Get element for each face and make normal point away from it
-		for i in range(self.num_faces):
-			elindex = self.face[i].elindex
-			
-			# El to face vector
-			cf = self.face[i].calc_centroid(node) - top.element[elindex].calc_centroid(node)
-
-			# Current face normal
-			norm = np.cross(node.pos[self.face[i].n[1]] - node.pos[self.face[i].n[0]], node.pos[self.face[i].n[2]] - node.pos[self.face[i].n[0]])
-
-			# Switch if in different directions
-			if np.dot(cf, norm) < 0.0:
-				index = [self.face[i].n[1], self.face[i].n[2]]
-				self.face[i].n[1] = index[1]
-				self.face[i].n[2] = index[0]
-				for j in range(4):
-					if top.element[elindex].n[j] == index[0]:
-						top.element[elindex].n[j] = index[1]
-					elif top.element[elindex].n[j] == index[1]:
-						top.element[elindex].n[j] = index[0]
+		if self.num_faces == 0:
+			return
+
+		# A face without an element has nothing to point away from (see get_element_indices)
+		elindex = self.face_elindex
+		if np.any(elindex == -1):
+			raise ValueError("Face " + str(np.flatnonzero(elindex == -1)[0]) + " has no element, so its normal cannot be checked. Find the elements with get_element_indices first.")
+
+		pos = np.asarray(node.pos)
+		fn = self.face_nodes
+		en = top.element_nodes[elindex]
+
+		# El to face vector
+		cf = get_centroids(pos, fn) - get_centroids(pos, en)
+
+		# Current face normal
+		norm = np.cross(pos[fn[:,1]] - pos[fn[:,0]], pos[fn[:,2]] - pos[fn[:,0]])
+
+		# Switch if in different directions. The elements are changed one face at a time, as a face can share them
+		for i in np.flatnonzero(np.einsum("ij,ij->i", cf, norm) < 0.0):
+			index = [fn[i,1], fn[i,2]]
+			fn[i,1] = index[1]
+			fn[i,2] = index[0]
+
+			e = top.element_nodes[elindex[i],:4]
+			first = e == index[0]
+			second = e == index[1]
+			e[first] = index[1]
+			e[second] = index[0]
+
+		top.face_index = None
 
 	def print_details(self):
 
@@ -422,11 +483,15 @@ class FFEA_surface:
 			fout = open(fname, "w")
 			fout.write("ffea surface file\nnum_surface_faces %d\n" % (self.num_faces))
 			fout.write("faces:\n")
-			for i in range(self.num_faces):
-				fout.write("%d " % (self.face[i].elindex))
-				for n in self.face[i].n:
-					fout.write("%d " % (n))
-				fout.write("\n")
+
+			# Each face after its parent element, all in one go unless the faces are of mixed order
+			n = np.hstack([self.face_elindex[:,np.newaxis], self.face_nodes])
+			if not np.any(self.face_nodes == -1):
+				write_block(fout, n, "%d " * n.shape[1] + "\n")
+			else:
+				for fn in n.tolist():
+					fn = fn[:1] + [i for i in fn[1:] if i != -1]
+					fout.write("%d " * len(fn) % tuple(fn) + "\n")
 
 		elif ext == ".obj":
 			if node == None:
@@ -434,11 +499,8 @@ class FFEA_surface:
 				raise IOError
 			
 			fout=open(fname, "w")
-			for n in node.pos:
-				fout.write("v %10.6f %10.6f %10.6f\n" % (n[0], n[1], n[2]))
-
-			for f in self.face:
-				fout.write("f %d %d %d\n" % (f.n[0], f.n[1], f.n[2]))
+			write_block(fout, node.pos, "v %10.6f %10.6f %10.6f\n")
+			write_block(fout, self.face_nodes[:,:3], "f %d %d %d\n")
 		
 		elif ext == ".stl":
 			if node == None:
@@ -470,20 +532,17 @@ class FFEA_surface:
 		if intype.lower() == "node" or intype.lower() == "nodes":
 
 			# Check if at least 'limit' nodes are in face
-			for i in range(self.num_faces):
-				if len(inindex & set(self.face[i].n)) >= limit:
-		   			outindex.append(i)
+			n = self.face_nodes
+			outindex = np.flatnonzero(np.sum(np.isin(n, list(inindex)) & (n != -1), axis=1) >= limit).tolist()
 
 		elif intype.lower() == "topology" or intype.lower() == "top" or intype.lower() == "element" or intype.lower() == "elem":
 			
 			# Check if elindex in face
-			for i in range(self.num_faces):
-				if self.face[i].elindex == None:
-					print("Cannot link surface to mesh. Will fix in future...")
-					raise IOError
+			if np.any(self.face_elindex == -1):
+				print("Cannot link surface to mesh. Will fix in future...")
+				raise IOError
 
-				if self.face[i].elindex in inindex:
-					outindex.append(i)
+			outindex = np.flatnonzero(np.isin(self.face_elindex, list(inindex))).tolist()
 
 		else:
 			raise IndexError
@@ -568,20 +627,103 @@ class FFEA_surface:
 		
 		return minL
 
-	def reset(self):
+	def reset_faces(self):
 
-		self.face = []
+		# The nodes of each face, one row each (3 or 6 nodes, and linear faces in a 2nd order surface end with -1s), and its parent element (-1 if unknown)
+		self.face_nodes = np.zeros([0, 3], dtype=np.int32)
+		self.face_elindex = np.zeros(0, dtype=np.int32)
+		self.face_buffer = None
+		self.face = FFEA_face_list(self)
 		self.num_faces = 0
+
+	def reset(self):
+
+		self.reset_faces()
 		self.valid = False
 		self.empty = True
 		self.firstOrderFaceNodes = [] # an array of nodes n_i1, n_i2, n_i3, ... describing 1st order faces.
 		self.num_linear_faces = 0
 
-class FFEA_face:
+def get_centroids(pos, n):
+	"""
+	Get the centroid of each row of node indices, ignoring any -1s.
+	"""
+	valid = n != -1
+	return np.einsum("ijk,ij->ik", pos[np.where(valid, n, 0)], valid) / np.sum(valid, axis=1)[:,np.newaxis]
 
-	def __init__(self):
+class FFEA_face_list(object):
+	"""
+	The faces of a surface, as FFEA_face objects: each one a view of a row
+	of the surface's arrays, made when it is asked for.
+	"""
 
-		self.reset()
+	def __init__(self, surf):
+		self.surf = surf
+
+	def __len__(self):
+		return len(self.surf.face_nodes)
+
+	def __getitem__(self, index):
+
+		if isinstance(index, slice):
+			return [self[i] for i in range(*index.indices(len(self)))]
+
+		if index < 0:
+			index += len(self)
+		if index < 0 or index >= len(self):
+			raise IndexError("Face " + str(index) + " does not exist.")
+
+		return self.surf.get_face(index)
+
+	def __setitem__(self, index, f):
+		view = self[index]
+		view.n = f.n
+		view.elindex = f.elindex
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self.surf.get_face(i)
+
+class FFEA_face(object):
+
+	def __init__(self, surf = None, index = None):
+
+		# A face on its own keeps its own nodes. Face index of a surface is a view into the surface's arrays
+		self.surf = surf
+		self.index = index
+		if surf == None:
+			self.reset()
+
+	def get_n(self):
+		if self.surf == None:
+			return self._n
+		return self.surf.get_face_nodes(self.index)
+
+	def set_n(self, n):
+		if self.surf == None:
+			self._n = n
+		else:
+			self.surf.set_face_nodes(self.index, n)
+
+	n = property(get_n, set_n)
+
+	def get_elindex(self):
+		if self.surf == None:
+			return self._elindex
+		elindex = self.surf.face_elindex[self.index]
+		if elindex == -1:
+			return None
+		return int(elindex)
+
+	def set_elindex(self, elindex):
+		if self.surf == None:
+			self._elindex = elindex
+		elif elindex == None:
+			self.surf.face_elindex[self.index] = -1
+		else:
+			self.surf.face_elindex[self.index] = elindex
+
+	elindex = property(get_elindex, set_elindex)
 
 	def set_indices(self, alist, elindex = None):
 
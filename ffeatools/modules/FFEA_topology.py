@@ -26,6 +26,20 @@ from time import sleep
 import numpy as np
 import FFEA_surface
 from FFEA_exceptions import *
+from FFEA_io import *
+
+# The nodes of face j of an element, as in FFEA_element.get_linear_face (face j is the face without node j)
+face_local_nodes = [[1,3,2], [0,2,3], [0,3,1], [0,1,2]]
+
+# The midpoints of the edges of each face of a 2nd order element, in FFEA_face_tri_sec order (01, 02, 12).
+# The midpoint of edge (j, k) of an element is node 4, 5, 6, 7, 8, 9 for (0,1), (0,2), (0,3), (1,2), (1,3), (2,3)
+face_local_midpoints = [[8,7,9], [5,6,9], [6,4,8], [4,5,7]]
+
+# The 6 edges of an element, in the order of its midpoints (n[4:10])
+edge_local_nodes = [[0,1], [0,2], [0,3], [1,2], [1,3], [2,3]]
+
+# The 4 linear faces a 2nd order face (lin0, lin1, lin2, sec01, sec02, sec12) splits into, as in FFEA_surface.split_face
+split_face_local_nodes = [[0,3,4], [1,5,3], [2,4,5], [3,5,4]]
 
 class FFEA_topology:
 
@@ -101,29 +115,30 @@ class FFEA_topology:
 
 		fin.readline()
 
-		# Read elements now
-		eltype = 0	
-		while(True):
-			sline = fin.readline().split()
+		# Read elements now, a block of each type at once
+		lines = read_lines(fin)
+		fin.close()
 
-			# Get an element
-			try:
-				if sline[0].strip() == "interior":
-					eltype = 1
-					continue
-	
-				elif len(sline) == 4:
-					el = FFEA_element_tet_lin()
-				elif len(sline) == 10:
-					el = FFEA_element_tet_sec()
+		# The interior elements should start after the surface ones, but look for them if not
+		marker = num_surface_elements
+		if marker >= len(lines) or not lines[marker].lstrip().startswith("interior"):
+			marker = len(lines)
+			for i in range(len(lines)):
+				if lines[i].lstrip().startswith("interior"):
+					marker = i
+					break
 
-			except(IndexError):
-				break
+		for block, eltype in [(lines[:marker], 0), (lines[marker + 1:], 1)]:
+			if len(block) == 0:
+				continue
 
-			el.set_indices(sline)
-			self.add_element(el, eltype=eltype)
+			# A block mixing linear and second order elements is read a line at a time
+			n = parse_lines(block, dtype=np.int32)
+			if n is None or (n.shape[1] != 4 and n.shape[1] != 10):
+				n = [sline for sline in [line.split() for line in block] if len(sline) == 4 or len(sline) == 10]
+				n = [[int(i) for i in sline] for sline in n]
 
-		fin.close()
+			self.add_elements(n, interior = eltype * np.ones(len(n), dtype=np.int8))
 
 	def load_vol(self, fname):
 
@@ -146,25 +161,14 @@ class FFEA_topology:
 		num_elements = int(fin.readline())
 
 		# Get all elements
-		zeroindexing = False
-		for i in range(num_elements):
-			sline = fin.readline().split()[2:]
-			el = FFEA_element_tet_lin()
-			
-			# Test indices
-			for s in sline:
-				if s.strip() == "0":
-					zeroindexing = True
-					break
- 
-			el.set_indices(sline)
-			self.add_element(el)
+		n = [fin.readline().split()[2:6] for i in range(num_elements)]
+		n = np.array(n, dtype=np.int32).reshape(-1, 4)
 
-		# Indexing from 0
-		if not zeroindexing:
-			for i in range(self.num_elements):
-				for j in range(4):
-					self.element[i].n[j] -= 1
+		# Indexing from 0, unless any index is already 0
+		if not np.any(n == 0):
+			n -= 1
+
+		self.add_elements(n)
 
 	def load_ele(self, fname):
 
@@ -185,183 +189,254 @@ class FFEA_topology:
 		num_surface_elements = num_elements
 
 		# Read elements now
+		n = []
 		while(True):
 			sline = fin.readline().split()
-			if sline[0].strip() == "#":
-				break
-
-			sline = sline[1:]
-			# Get an element
-			try:
-				if len(sline) == 4:
-					el = FFEA_element_tet_lin()
-				elif len(sline) == 10:
-					el = FFEA_element_tet_sec()
-
-			except(IndexError):
+			if len(sline) == 0 or sline[0].strip() == "#":
 				break
 
 			# Indexing from zero
-			sline = [int(s) - 1 for s in sline]
-			el.set_indices(sline)
-			self.add_element(el)
+			sline = sline[1:]
+			if len(sline) == 4 or len(sline) == 10:
+				n.append([int(s) - 1 for s in sline])
 
 		fin.close()
+		self.add_elements(n)
 
 	def add_element(self, el, eltype = -1):
 
 		if eltype == -1:
-			self.num_surface_elements += 1
 			el.interior = None
+		else:
+			el.interior = eltype != 0
+
+		# Copies the element into the arrays. From now on, it is self.element[-1]
+		self.add_elements([el.n], interior = [eltype])
+
+	def add_elements(self, n, interior = None):
+		"""
+		Add many elements at once.
+		In: self, an array of [element][4 or 10 nodes] (or a list of node
+		lists, which can mix the two), and the type of each element: -1
+		unknown, 0 surface or 1 interior (all unknown if None).
+		"""
+		if len(n) == 0:
+			return
 
-		elif eltype == 0:
-			self.num_surface_elements += 1
-			el.interior = False
+		if interior is None:
+			interior = -1 * np.ones(len(n), dtype=np.int8)
+		interior = np.asarray(interior, dtype=np.int8).reshape(-1)
+
+		# Widen mixed lists with -1, as in the arrays
+		if isinstance(n, np.ndarray):
+			width = n.shape[1]
 		else:
-			self.num_interior_elements += 1
-			el.interior = True
+			width = max([len(el) for el in n])
+			n = [list(el) + [-1] * (width - len(el)) for el in n]
+
+		start = len(self.element_nodes)
+		self.reserve_elements(start + len(n), width)
+		self.element_nodes = self.element_buffer[0][:start + len(n)]
+		self.element_interior = self.element_buffer[1][:start + len(n)]
+		self.element_nodes[start:] = -1
+		self.element_nodes[start:,:width] = n
+		self.element_interior[start:] = interior
+
+		self.num_elements += len(n)
+		self.num_surface_elements += int(np.sum(interior != 1))
+		self.num_interior_elements += int(np.sum(interior == 1))
+		self.face_index = None
+
+	def reserve_elements(self, num_elements, num_nodes = 4):
+		"""
+		Make sure the element arrays have room for num_elements elements with
+		num_nodes nodes each. The arrays are views of the first rows of
+		buffers that grow geometrically, so that adding elements one at a
+		time is amortised O(1).
+		"""
+		width = max(num_nodes, self.element_nodes.shape[1])
+		if self.element_buffer != None:
+			nodes, interior = self.element_buffer
+			if self.element_nodes.base is nodes and self.element_interior.base is interior and len(nodes) >= num_elements and nodes.shape[1] == width:
+				return
 
-		self.element.append(el)
-		self.num_elements += 1
+		num = len(self.element_nodes)
+		nodes = -1 * np.ones([max(num_elements, 2 * num), width], dtype=np.int32)
+		interior = -1 * np.ones(len(nodes), dtype=np.int8)
+		nodes[:num,:self.element_nodes.shape[1]] = self.element_nodes
+		interior[:num] = self.element_interior
+		self.element_buffer = (nodes, interior)
+		self.element_nodes = nodes[:num]
+		self.element_interior = interior[:num]
+
+	def set_elements(self, n, interior = None):
+		"""
+		Replace all of the elements with new ones (see add_elements).
+		"""
+		self.reset_elements()
+		self.add_elements(n, interior = interior)
+
+	def remove_elements(self, indices):
+
+		indices = np.unique(indices)
+		interior = self.element_interior[indices]
+		self.element_nodes = np.delete(self.element_nodes, indices, axis = 0)
+		self.element_interior = np.delete(self.element_interior, indices)
+		self.num_elements -= len(indices)
+		self.num_surface_elements -= int(np.sum(interior != 1))
+		self.num_interior_elements -= int(np.sum(interior == 1))
+		self.face_index = None
+
+	def get_element(self, index):
+		"""
+		Get element index as an FFEA_element object, a view into the arrays.
+		"""
+		if self.get_element_num_nodes(index) == 10:
+			return FFEA_element_tet_sec(top = self, index = index)
+		else:
+			return FFEA_element_tet_lin(top = self, index = index)
+
+	def get_element_num_nodes(self, index = None):
+		"""
+		Get the number of nodes in an element (or an array for all of them).
+		"""
+		# Only look at the one row if we can, as views are made one element at a time
+		if index != None:
+			if self.element_nodes.shape[1] == 10 and self.element_nodes[index,4] != -1:
+				return 10
+			return 4
+
+		if self.element_nodes.shape[1] == 4:
+			return 4 * np.ones(len(self.element_nodes), dtype=int)
+		return np.where(self.element_nodes[:,4] == -1, 4, 10)
+
+	def get_element_nodes(self, index):
+
+		if self.element_nodes.shape[1] == 10 and self.element_nodes[index,4] == -1:
+			return self.element_nodes[index,:4]
+		return self.element_nodes[index]
+
+	def set_element_nodes(self, index, n):
+
+		if len(n) > self.element_nodes.shape[1]:
+			self.reserve_elements(len(self.element_nodes), len(n))
+		self.element_nodes[index] = -1
+		self.element_nodes[index,:len(n)] = n
+		self.face_index = None
+
+	def get_element_node_lists(self):
+		"""
+		Get the nodes of every element as a list of lists, for the loops
+		that need them one at a time.
+		"""
+		return [[i for i in n if i != -1] for n in self.element_nodes.tolist()]
+
+	def get_order(self):
+		"""
+		Get the order of the elements, 1 or 2, or None if they are mixed.
+		"""
+		num_nodes = set(self.get_element_num_nodes().tolist())
+		if num_nodes == set([10]):
+			return 2
+		elif num_nodes == set([4]) or len(num_nodes) == 0:
+			return 1
+		return None
 
 	def get_num_elements(self):
-		return len(self.element)
+		return len(self.element_nodes)
 
 	def get_linear_nodes(self):
 	
-		# Get them all
-		n = []
-		for e in self.element:
-			for index in e.n[0:4]:
-				n.append(index)
-		
-		# Make a list of a set
-		return list(set(n))
+		# Get them all, as a list of a set
+		return np.unique(self.element_nodes[:,:4]).tolist()
 
 	def calc_CoM(self, node, mat):
 
-		CoM = np.array([0.0,0.0,0.0])
-		eindex = -1
-		total_mass = 0.0
-		for e in self.element:
-			eindex += 1
-			elmass = e.calc_volume(node) * mat.element[eindex][0]
-			total_mass += elmass			
-			CoM += elmass * (np.mean([node.pos[n] for n in e.n[0:4]], axis=0))
-		self.CoM = CoM * 1.0/total_mass
+		elmass = self.calc_element_volumes(node) * np.asarray(mat.element, dtype=float)[:,0]
+		centroids = np.mean(np.asarray(node.pos)[self.element_nodes[:,:4]], axis=1)
+		self.CoM = np.sum(elmass[:,np.newaxis] * centroids, axis=0) * 1.0/np.sum(elmass)
 		return self.CoM
 
+	def calc_element_volumes(self, node, scale = 1.0):
+		"""
+		Get the volume of every element (see FFEA_element.calc_volume).
+		"""
+		pos = np.asarray(node.pos)
+		n = self.element_nodes[:,:4]
+		e = pos[n[:,1:]] - pos[n[:,0]][:,np.newaxis,:]
+		return np.fabs(np.einsum("ij,ij->i", e[:,2], np.cross(e[:,1], e[:,0])) / 6.0) * np.power(scale, 3.0)
+
 	def get_CoM(self):
 		return self.CoM
 	
 	def extract_surface(self):
-		
-		faces = []
-		facessorted = []
-		elindex = []
-		surf = FFEA_surface.FFEA_surface()
+		"""
+		Find the surface of the mesh: the element faces that only occur
+		once, according to the face index (see get_face_index).
+		Out: an FFEA_surface object, with the faces in element order, each
+		keeping the winding of get_linear_face and the index of its
+		element. Second order elements give second order faces (the three
+		corners, then the midpoints of edges 01, 02 and 12).
+		"""
 
-		# Get all faces in entire system. If only occurs once, it's a surface face. Keep the order
-		for i in range(self.num_elements):
-			e = self.element[i]
+		surf = FFEA_surface.FFEA_surface()
+		if self.num_elements == 0:
+			return surf
 
-			if len(e.n) == 10:
-				print("Error. Functionality not yet available for 2nd order elements")
-				return
+		order = self.get_order()
+		if order == None:
+			print("Error. Cannot extract a surface from a mix of 1st and 2nd order elements")
+			return
 
-			for j in range(4):
-				faces.append(e.get_linear_face(j, obj=False))
-				facessorted.append(sorted(e.get_linear_face(j, obj=False)))
-				elindex.append(i)
+		index = self.get_face_index()
+		surface = index.get_surface_faces()
+		faces = index.faces[surface]
+		if order == 2:
+			faces = np.hstack([faces, self.element_nodes[:,face_local_midpoints].reshape(-1, 3)[surface]])
 
-		# Now, go through sorted faces and if it occurs twice, delete both from the actual surface
-		run = -1
-		while(facessorted != []):
-			run += 1
-			# Get a face
-			fsort = facessorted.pop(0)					
-			f = faces.pop(0)
-			eind = elindex.pop(0)
-
-			# Is it in the list?
-			if fsort not in facessorted:
-				
-				# It was only there once! Surface face baby
-				sf = FFEA_surface.FFEA_face_tri_lin()
-				sf.set_indices(f, elindex = eind)				
-				surf.add_face(sf)
-			else:
-				# Delete the other face in the list
-				for i in range(len(facessorted)):
-					if facessorted[i] == fsort:
-						index = i
-						break
-				try:
-					facessorted.pop(index)
-					faces.pop(index)
-					elindex.pop(index)
-				except:
-					break
-	
+		surf.add_faces(faces, elindex = surface // 4)
 		return surf
 
-	def calculateInterior(self, surf=None):
+	def get_face_index(self, rebuild = False):
+		"""
+		Get the face index of this topology (see FFEA_face_index), built
+		the first time it is needed. The methods here that change the
+		elements rebuild it; if you change them yourself, ask for a rebuild.
+		"""
+		if self.face_index == None or rebuild:
+			self.face_index = FFEA_face_index(self)
+		return self.face_index
 
-		# Don't continue without surface (we could do, but it's slow)
-		if surf == None:
-			print("Cannot calculate interior elements without an associated surface (currently).")
-			return
+	def calculateInterior(self, surf=None):
 
 		# Don't continue if we're already done
-		num_done = 0
-		for e in self.element:
-			if e.interior == None:
-				break
-			else:
-				num_done += 1
-
-		if num_done == self.num_elements:
+		if np.all(self.element_interior != -1):
 			return
 
-		# Set all elements as default to interior elements
-		self.num_interior_elements = self.num_elements
-		self.num_surface_elements = 0
-
-		for i in range(self.num_elements):
-			self.element[i].interior = True
-
-
-		# Now, use surface to work out which are surface elements
-		for i in range(surf.num_faces):
-			if self.element[surf.face[i].elindex].interior:
-				self.element[surf.face[i].elindex].interior = False
-				self.num_interior_elements -= 1
-				self.num_surface_elements += 1
-
-		# Get a map, so we know what element wil go where
-		amap = [-1 for i in range(self.num_elements)]
-		index = 0
+		# Surface elements are those with a face on the surface. Without a surface, those are the ones with an unshared face
+		if surf == None:
+			interior = self.get_face_index().get_interior()
+		else:
+			interior = np.ones(self.num_elements, dtype=bool)
+			interior[surf.face_elindex[surf.face_elindex != -1]] = False
 
-		for i in range(self.num_elements):
-			if self.element[i].interior:
-				amap[i] = index 
-				index += 1
+		self.num_interior_elements = int(np.sum(interior))
+		self.num_surface_elements = self.num_elements - self.num_interior_elements
 
-		for i in range(len(amap)):
-			if amap[i] == -1:
-				amap[i] = index
-				index += 1
+		# Get a map, so we know what element wil go where (interior elements first)
+		order = np.concatenate([np.flatnonzero(interior), np.flatnonzero(~interior)])
+		amap = np.empty(self.num_elements, dtype=np.int32)
+		amap[order] = np.arange(self.num_elements)
 
 		# Now, reorder actual elements
-		old_els = self.element
-		self.element = [None for i in range(self.num_elements)]
-
-		for i in range(self.num_elements):
-			self.element[amap[i]] = old_els[i]
+		self.element_nodes = self.element_nodes[order]
+		self.element_interior = interior[order].astype(np.int8)
+		self.face_index = None
 
 		# And reorder the surface indices
-		for i in range(surf.num_faces):
-			surf.face[i].elindex = amap[surf.face[i].elindex]
+		if surf != None:
+			known = surf.face_elindex != -1
+			surf.face_elindex[known] = amap[surf.face_elindex[known]]
 
 	def isElementInterior(self, index):
 		
@@ -375,44 +450,8 @@ class FFEA_topology:
 		if testEl.interior != None:
 			return testEl.interior
 
-		else:
-			testEl.interior = False
-
-		# To test if interior, see if a faces are repeated. If all are, element is interior
-		i = -1
-		faces_not_found = [0,1,2,3]
-		for el in self.element:
-			
-			i += 1
-			el_connected = False
-			faces_to_remove = -1
-
-			# Same element doesn't count
-			if i == index:
-				continue
-		
-			for j in faces_not_found:
-				testFace = testEl.get_linear_face(j)
-				
-				for k in range(4):
-					face = el.get_linear_face(k)
-
-					if face.isSame(testFace):
-						faces_to_remove = j
-						el_connected = True
-						break
-
-				if el_connected:
-					break
-	
-			try:
-				faces_not_found.remove(faces_to_remove)
-			except:
-				pass
-			if faces_not_found == []:
-				testEl.interior = True
-				break
-
+		# An element is interior if all of its faces are shared with other elements
+		testEl.interior = bool(self.get_face_index().get_interior()[testEl.index])
 		return testEl.interior
 	
 	def increase_order(self, node = None, surf = None, stokes = None):
@@ -420,100 +459,55 @@ class FFEA_topology:
 		# Increases the order of this topology, and all of the associated structures (if they exist)
 
 		# Check current order (function currently only for 1st order - 2nd order)
-		for e in self.element:
-			if len(e.n) == 10:
-				print("Error. Increasing to order > 2 is currently not supported")
-				return
-
-		# Get a unique edge list (edge is two nodes, and a potential 3rd node)
-		# Also get num_nodes whilst we're at it (in case node object not provided)
-		edges = []
-		max_node_index = -1 * float("inf")
-		for i in range(self.num_elements):
-			n = self.element[i].n
-			n = sorted(n)
-
-			nmax = max(n)
-			if nmax > max_node_index:
-				max_node_index = nmax
-
-			for j in range(3):
-				for k in range(j + 1, 4):
-					ed = (n[j], n[k], -1)
-					edges.append(ed)
-			
-		edges = list(set(edges))
-
-		# For each edge, add a new midpoint
-		new_edges = []
-		for e in edges:
-			max_node_index += 1
-			new_edge = (e[0], e[1], max_node_index)
-			new_edges.append(new_edge)
-			
-			# Now actually add the nodes if necessary
-
-			# Stokes 2nd order nodes should have no drag
-			if stokes != None:
-				stokes.add_node(0.0)
-			
-			if node != None:
-				nnpos = 0.5 * (node.pos[e[0]] + node.pos[e[1]])
-				node.add_node(nnpos)
-
-		# Now, rebuild topology (and surface, maybe)
-		# Make a dictionary
-		new_edges = dict(((e[0],e[1]), e[2]) for e in new_edges)
-		for i in range(self.num_elements):
-
-			# Replace element with a second order one
-			self.upgrade_element(i)
-
-			# Get local edges and append nodes to element
-			n = self.element[i].n
-			#n = sorted(n)
-
-			# 6 edges
-			for j in range(3):
-				for k in range(j + 1, 4):
-					ed = (n[j], n[k])
-					try:
-						self.element[i].n.append(new_edges[ed])
-					except(KeyError):
-						ed = (n[k], n[j])
-						self.element[i].n.append(new_edges[ed])
-		# Now surface
-		if surf != None:
-			for i in range(surf.num_faces):
-
-				# Replace face with a second order one, then convert to 4 linear ones
-				surf.upgrade_face(i)
+		if np.any(self.get_element_num_nodes() == 10):
+			print("Error. Increasing to order > 2 is currently not supported")
+			return
 
-				# Get local edges and append nodes to element
-				n = surf.face[i].n
-				#n = sorted(n)
+		if self.num_elements == 0:
+			return
 
-				# 3 edges
-				for j in range(2):
-					for k in range(j + 1, 3):
-						ed = (n[j], n[k])
-						try:
-							surf.face[i].n.append(new_edges[ed])
-						except(KeyError):
-							ed = (n[k], n[j])
-							surf.face[i].n.append(new_edges[ed])
-			# Now make linear again
-			for i in range(surf.num_faces):
-				surf.split_face(0)			# Always zero, as split_face deletes the face at index
-
-	def upgrade_element(self, index):
-
-		# Replace element with a higher order one
-		e = FFEA_element_tet_sec()
-		e.n = self.element[index].n
-		
-		self.element.insert(index, e)
-		self.element.pop(index + 1)
+		# Get a unique edge list, each edge packed into a single key (lower node * stride + higher node)
+		# Also get num_nodes whilst we're at it (in case node object not provided)
+		n = self.element_nodes[:,:4].astype(np.int64)
+		max_node_index = int(np.max(n))
+		stride = max_node_index + 1
+
+		edges = np.sort(n[:,edge_local_nodes], axis=2).reshape(-1, 2)
+		keys, edge_id = np.unique(edges[:,0] * stride + edges[:,1], return_inverse = True)
+		edge_id = edge_id.reshape(-1)
+
+		# For each edge, add a new midpoint, all at once
+		# Stokes 2nd order nodes should have no drag
+		if stokes != None:
+			stokes.add_nodes(np.zeros(len(keys)))
+
+		if node != None:
+			pos = np.asarray(node.pos)
+			node.add_nodes(0.5 * (pos[keys // stride] + pos[keys % stride]))
+
+		# Now, rebuild topology (and surface, maybe), 6 edges per element. The new elements are second order ones, not yet known to be interior or not
+		midpoints = max_node_index + 1 + edge_id.reshape(-1, 6)
+		self.set_elements(np.hstack([n, midpoints]))
+
+		# Now surface. Upgrade each face with its 3 edges, then split into 4 linear ones
+		if surf != None and surf.num_faces > 0:
+			fn = surf.face_nodes[:,:3].astype(np.int64)
+			elindex = surf.face_elindex
+			face_edges = np.sort(fn[:,[[0,1], [0,2], [1,2]]], axis=2).reshape(-1, 2)
+			face_keys = face_edges[:,0] * stride + face_edges[:,1]
+			face_edge_id = np.minimum(np.searchsorted(keys, face_keys), len(keys) - 1)
+			if np.any(keys[face_edge_id] != face_keys):
+				missing = np.flatnonzero(keys[face_edge_id] != face_keys)[0]
+				raise KeyError(tuple(face_edges[missing].tolist()))
+
+			sec = np.hstack([fn, max_node_index + 1 + face_edge_id.reshape(-1, 3)])
+			surf.set_faces(sec[:,split_face_local_nodes].reshape(-1, 3), elindex = np.repeat(elindex, 4))
+
+	def upgrade_element(self, index, midpoints):
+
+		# Replace element with a higher order one, given the nodes at the midpoints of its 6 edges
+		self.set_element_nodes(index, list(self.get_element_nodes(index)[0:4]) + list(midpoints))
+		self.element_interior[index] = -1
 
 	def cull_interior(self, limitvol, node, surf=None):
 
@@ -551,11 +545,8 @@ class FFEA_topology:
 					nodestorenumber = sorted(e.n[0:4])
 
 					# Delete elements (all interior)
-					for j in reversed(elstodelete):
-						self.element.pop(j)
-					self.num_elements -= len(elstodelete)
-					self.num_interior_elements -= len(elstodelete)
-					culled_elements += len(elstodelete)
+					culled_elements += len(set(elstodelete))
+					self.remove_elements(elstodelete)
 
 					# Delete all necessary nodes (not all interior :( )
 					for j in reversed(nodestorenumber):
@@ -617,31 +608,102 @@ class FFEA_topology:
 					self.num_interior_elements -= 1
 					break
 					'''
+		self.face_index = None
 		print ("Culled %d elements with volume < %e." % (culled_elements, limitvol))
 
 	def get_smallest_lengthscale(self, node):
-
-		length = float("inf")
-		for e in self.element:
-			new_length = e.get_smallest_lengthscale(node)
-			if new_length < length:
-				length = new_length
-
-		return length
+		"""
+		Get the smallest distance from a node of an element to the plane of
+		its opposite face, over all elements (see
+		FFEA_element.get_smallest_lengthscale).
+		"""
+		if self.num_elements == 0:
+			return float("inf")
+
+		pos = np.asarray(node.pos)
+		n = self.element_nodes[:,:4]
+		f = pos[n[:,face_local_nodes]]
+		normal = np.cross(f[:,:,1] - f[:,:,0], f[:,:,2] - f[:,:,0])
+		normal /= np.linalg.norm(normal, axis=2)[:,:,np.newaxis]
+		return float(np.min(np.fabs(np.einsum("ijk,ijk->ij", normal, pos[n] - f[:,:,0]))))
 
 	def calculate_volume(self, node):
-		vol = 0.0
-		for e in self.element:
-			vol += e.calc_volume(node)
-		return vol
+		return float(np.sum(self.calc_element_volumes(node)))
 
 	def calculate_strain_energy(self, frame, frame0, mat):
-		
-		se = 0.0
-		index = 0
-		for el in self.element:
-			se += el.calculate_strain_energy(frame, frame0, mat.element[index])
-			index += 1
+		return self.calc_strain_energy_trajectory(frame.pos, frame0, mat, per_blob = True)[0]
+
+	def get_linear_element_indices(self):
+		return self.element_nodes[:,:4].astype(int)
+
+	def calc_strain_energy_reference(self, frame0, mat):
+		"""
+		Precompute everything the strain energy needs from the reference
+		(unstrained) structure, so it is only done once however many frames
+		there are.
+		In: self, the reference frame (anything with a pos, like an FFEA_node
+		or FFEA_frame), and the material.
+		Out: a dictionary of the element node indices, the inverse reference
+		Jacobians and volumes, and the shear (G) and C = K - 2G/3 moduli.
+		"""
+		n = self.get_linear_element_indices()
+		pos0 = np.asarray(frame0.pos)
+		J0 = pos0[n[:,1:]] - pos0[n[:,0]][:,np.newaxis,:]
+
+		matel = np.asarray(mat.element, dtype=float)
+		G = matel[:,3]
+		K = matel[:,4]
+
+		return {"n": n, "invJ0": np.linalg.inv(J0), "vol0": np.fabs(np.linalg.det(J0)) / 6.0, "G": G, "C": K - (2.0/3.0) * G}
+
+	def calc_strain_energy_trajectory(self, pos, frame0, mat, num_frames_per_chunk = None, per_blob = False):
+		"""
+		Calculate the strain energy of every element in every frame at once.
+		In: self, a (frames x nodes x 3) array of positions (for instance
+		FFEA_traj_blob.get_pos(), which may be memory mapped) or the (nodes x 3)
+		positions of a single frame, the reference frame, the material, how
+		many frames to work on at a time (by default, enough to keep the
+		intermediate arrays to a few tens of megabytes), and whether to sum
+		over the elements of the blob.
+		Out: a (frames x elements) array of energies, or a (frames) array of
+		blob energies if per_blob.
+		"""
+		ref = self.calc_strain_energy_reference(frame0, mat)
+		n = ref["n"]
+		G = ref["G"]
+		C = ref["C"]
+
+		pos = np.asarray(pos)
+		if pos.ndim == 2:
+			pos = pos[np.newaxis]
+
+		num_frames = len(pos)
+		if num_frames_per_chunk == None:
+			num_frames_per_chunk = max(1, 2**20 // max(1, self.num_elements))
+
+		if per_blob:
+			se = np.empty(num_frames)
+		else:
+			se = np.empty([num_frames, self.num_elements])
+
+		for start in range(0, num_frames, num_frames_per_chunk):
+			p = np.asarray(pos[start:start + num_frames_per_chunk], dtype=float)
+
+			# Deformation gradients of every element, frames x elements x 3 x 3. The energy only
+			# needs its trace (F.F^T) and determinant, so we need not transpose it
+			J = p[:,n[:,1:]] - p[:,n[:,0]][:,:,np.newaxis,:]
+			F = np.einsum("feij,ejk->feik", J, ref["invJ0"])
+			trFFt = np.einsum("feij,feij->fe", F, F)
+			dF = np.linalg.det(F)
+
+			chunk = 0.5 * G * (trFFt - 3) + (C / 4.0) * (dF**2 - 1) - (0.5 * C + G) * np.log(dF)
+			chunk *= ref["vol0"]
+
+			if per_blob:
+				se[start:start + len(p)] = chunk.sum(axis = 1)
+			else:
+				se[start:start + len(p)] = chunk
+
 		return se
 
 	def print_details(self):
@@ -651,14 +713,13 @@ class FFEA_topology:
 		print ("num_interior_elements = %d" % (self.num_interior_elements))
 		sleep(1)
 
-		for e in self.element:
-			index = self.element.index(e)
+		for index, en in enumerate(self.get_element_node_lists()):
 			outline = "Element " + str(index) + " "
 			if(index < self.num_surface_elements):
 				outline += "(Surface): "
 			else:
 				outline += "(Interior): "
-			for n in e.n:
+			for n in en:
 				outline += str(n) + " "
 
 			print (outline)
@@ -674,9 +735,9 @@ class FFEA_topology:
 		if ext == ".vol":
 			fout = open(fname, "a")
 			fout.write("#  matnr      np      p1      p2      p3      p4\nvolumeelements\n%d\n" % (self.num_elements))
-			for e in self.element:
-				fout.write("1 %d" % (len(e.n)))
-				for n in e.n:
+			for en in self.get_element_node_lists():
+				fout.write("1 %d" % (len(en)))
+				for n in en:
 					fout.write(" %d" % (n + 1))
 				fout.write("\n")
 
@@ -686,15 +747,9 @@ class FFEA_topology:
 			fout = open(fname, "w")
 			fout.write("ffea topology file\nnum_elements %d\nnum_surface_elements %d\nnum_interior_elements %d\n" % (self.num_elements, self.num_surface_elements, self.num_interior_elements))
 			fout.write("surface elements:\n")
-			for i in range(self.num_surface_elements):
-				for n in self.element[i].n:
-					fout.write("%d " % (n))
-				fout.write("\n")
+			self.write_element_block(fout, 0, self.num_surface_elements)
 			fout.write("interior elements:\n")
-			for i in range(self.num_surface_elements, self.num_elements):
-				for n in self.element[i].n:
-					fout.write("%d " % (n))
-				fout.write("\n")
+			self.write_element_block(fout, self.num_surface_elements, self.num_elements)
 		else:
 			print("Extension not recognised")
 			raise IOError
@@ -703,14 +758,24 @@ class FFEA_topology:
 		fout.close()
 		print("done!")
 
+	def write_element_block(self, fout, start, stop):
+		"""
+		Write the nodes of elements start to stop, one element per line, as
+		in a .top file. A block of elements of one order is written in one
+		go, a mixed one an element at a time.
+		"""
+		n = self.element_nodes[start:stop]
+		if not np.any(n == -1):
+			write_block(fout, n, "%d " * n.shape[1] + "\n")
+			return
+
+		for en in n.tolist():
+			en = [i for i in en if i != -1]
+			fout.write("%d " * len(en) % tuple(en) + "\n")
+
 	def calc_mass(self, mat, node, scale = 1.0):
 	
-		mass = 0.0
-		index = 0
-		for e in self.element:
-			mass += e.calc_volume(node, scale) * mat.element[index][0]
-			index += 1
-		return mass
+		return float(np.sum(self.calc_element_volumes(node, scale) * np.asarray(mat.element, dtype=float)[:,0]))
 
 	# Takes index list of type intype ("node", "surf" etc) and returns the element list corresponding to those
 	def index_switch(self, inindex, intype, limit=1, surf=None):
@@ -720,9 +785,8 @@ class FFEA_topology:
 
 		if intype.lower() == "node" or intype.lower() == "nodes":
 			# Check if at least 'limit' nodes are in element
-			for i in range(self.num_elements):
-				if len(inindex & set(self.element[i].n)) >= limit:
-		   			outindex.append(i)
+			n = self.element_nodes
+			outindex = np.flatnonzero(np.sum(np.isin(n, list(inindex)) & (n != -1), axis=1) >= limit).tolist()
 
 		elif (intype.lower() == "surf" or intype.lower() == "surface" or intype.lower() == "face") and surf != None:
 			
@@ -734,22 +798,216 @@ class FFEA_topology:
 
 		return outindex
 
-	def reset(self):
+	def reset_elements(self):
 
-		self.CoM = None
-		self.element = []
+		# The nodes of each element, one row each (4 or 10 nodes, and linear elements in a 2nd order topology end with -1s).
+		# Whether each is interior, -1 if not yet known
+		self.element_nodes = np.zeros([0, 4], dtype=np.int32)
+		self.element_interior = np.zeros(0, dtype=np.int8)
+		self.element_buffer = None
+		self.element = FFEA_element_list(self)
 		self.num_elements = 0
 		self.num_surface_elements = 0
 		self.num_interior_elements = 0
+		self.face_index = None
+
+	def reset(self):
+
+		self.CoM = None
+		self.reset_elements()
 		self.valid = False
 		self.empty = True
 		self.linear_elemnode_list = []
 
-class FFEA_element:
+class FFEA_face_index:
+	"""
+	An index of the faces of a topology, built once: every face of every
+	element, keyed on its sorted node triple and grouped with the other
+	faces with the same key in a single sort. Element face i * 4 + j is
+	face j of element i (see face_local_nodes). For 2nd order elements,
+	the 4 linear faces each 2nd order face splits into (as in
+	FFEA_surface.split_face) are indexed as well, so that the faces of a
+	split surface can be found.
+	"""
+
+	def __init__(self, top):
+
+		n = top.element_nodes[:,:4].astype(np.int64)
+
+		# Every face of every element
+		self.faces = n[:,face_local_nodes].reshape(-1, 3)
+		self.order, self.keys, self.first, self.counts = group_faces(self.faces)
+		self.face_id = np.empty(len(self.faces), dtype=np.int64)
+		self.face_id[self.order] = np.repeat(np.arange(len(self.keys)), self.counts)
+
+		# The pieces of split 2nd order faces, 16 per element
+		self.split_faces = None
+		if top.num_elements > 0 and top.get_order() == 2:
+			n = top.element_nodes.astype(np.int64)
+			sec = np.concatenate([n[:,face_local_nodes], n[:,face_local_midpoints]], axis=2)
+			self.split_faces = sec[:,:,split_face_local_nodes].reshape(-1, 3)
+			self.split_order, self.split_keys, self.split_first, self.split_counts = group_faces(self.split_faces)
+
+	def find(self, faces):
+		"""
+		Find faces, given in any order and winding.
+		In: an array of [face][3 nodes].
+		Out: the id of each face (its row in self.keys), or -1 if no element
+		has that face.
+		"""
+		return match_faces(self.keys, faces)
+
+	def get_elements(self, faces):
+		"""
+		Get the element each face belongs to. For a face shared by two
+		elements, this is the one with the lower index.
+		In: an array of [face][3 nodes]. Faces of a split 2nd order
+		surface are found too.
+		Out: the element index of each face, or -1 if it is not found.
+		"""
+		faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+		ids = self.find(faces)
+		found = ids != -1
+		elements = np.full(len(faces), -1, dtype=np.int64)
+		elements[found] = self.order[self.first[ids[found]]] // 4
+
+		if self.split_faces is not None and not np.all(found):
+			missing = np.flatnonzero(~found)
+			ids = match_faces(self.split_keys, faces[missing])
+			elements[missing[ids != -1]] = self.split_order[self.split_first[ids[ids != -1]]] // 16
+
+		return elements
+
+	def get_interior(self):
+		"""
+		Get whether each element is interior: all four of its faces are
+		shared with another element.
+		"""
+		return np.all(self.counts[self.face_id].reshape(-1, 4) > 1, axis=1)
+
+	def get_surface_faces(self):
+		"""
+		Get the element faces on the surface, those that occur once.
+		Matching faces cancel in pairs, so if a face somehow occurs an odd
+		number of times, its last occurrence is on the surface.
+		Out: the element face indices, in element order.
+		"""
+		last = self.first + self.counts - 1
+		return np.sort(self.order[last[self.counts % 2 == 1]])
+
+def group_faces(faces):
+	"""
+	Group faces by their sorted node triples, with one stable sort.
+	In: an array of [face][3 nodes].
+	Out: the order that sorts the faces by key (equal keys keeping their
+	original order), the unique keys in sorted order, and the position in
+	that order of the first face with each key, and the number of faces
+	with each key.
+	"""
+	key = np.sort(faces, axis=1)
+	order = np.lexsort((key[:,2], key[:,1], key[:,0]))
+	key = key[order]
+	first = np.flatnonzero(np.concatenate([[True], np.any(key[1:] != key[:-1], axis=1)]))
+	counts = np.diff(np.append(first, len(key)))
+	return order, key[first], first, counts
+
+def match_faces(keys, faces):
+	"""
+	Look faces up in a table of unique sorted keys (from group_faces).
+	In: the keys, and an array of [face][3 nodes], in any order.
+	Out: the row of keys for each face, or -1 if it is not there.
+	"""
+	query = np.sort(np.asarray(faces, dtype=np.int64).reshape(-1, 3), axis=1)
+	if len(query) == 0 or len(keys) == 0:
+		return np.full(len(query), -1, dtype=np.int64)
+
+	# Sort keys and queries together, keys first amongst equals, then look back to the nearest key
+	table = np.concatenate([keys, query])
+	is_query = np.concatenate([np.zeros(len(keys), dtype=int), np.ones(len(query), dtype=int)])
+	order = np.lexsort((is_query, table[:,2], table[:,1], table[:,0]))
+	last_key = np.maximum.accumulate(np.where(is_query[order] == 0, order, -1))
+
+	ids = np.full(len(query), -1, dtype=np.int64)
+	at = np.flatnonzero(is_query[order] == 1)
+	candidate = last_key[at]
+	valid = candidate != -1
+	valid[valid] = np.all(keys[candidate[valid]] == query[order[at[valid]] - len(keys)], axis=1)
+	ids[order[at[valid]] - len(keys)] = candidate[valid]
+	return ids
+
+class FFEA_element_list(object):
+	"""
+	The elements of a topology, as FFEA_element objects: each one a view of
+	a row of the topology's arrays, made when it is asked for.
+	"""
+
+	def __init__(self, top):
+		self.top = top
+
+	def __len__(self):
+		return len(self.top.element_nodes)
+
+	def __getitem__(self, index):
+
+		if isinstance(index, slice):
+			return [self[i] for i in range(*index.indices(len(self)))]
+
+		if index < 0:
+			index += len(self)
+		if index < 0 or index >= len(self):
+			raise IndexError("Element " + str(index) + " does not exist.")
+
+		return self.top.get_element(index)
+
+	def __setitem__(self, index, el):
+		view = self[index]
+		view.n = el.n
+		view.interior = el.interior
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self.top.get_element(i)
+
+class FFEA_element(object):
+
+	def __init__(self, top = None, index = None):
+
+		# An element on its own keeps its own nodes. Element index of a topology is a view into the topology's arrays
+		self.top = top
+		self.index = index
+		if top == None:
+			self.reset()
 
-	def __init__(self):
+	def get_n(self):
+		if self.top == None:
+			return self._n
+		return self.top.get_element_nodes(self.index)
 
-		self.reset()
+	def set_n(self, n):
+		if self.top == None:
+			self._n = n
+		else:
+			self.top.set_element_nodes(self.index, n)
+
+	n = property(get_n, set_n)
+
+	def get_interior(self):
+		if self.top == None:
+			return self._interior
+		interior = self.top.element_interior[self.index]
+		if interior == -1:
+			return None
+		return bool(interior)
+
+	def set_interior(self, interior):
+		if self.top == None:
+			self._interior = interior
+		elif interior == None:
+			self.top.element_interior[self.index] = -1
+		else:
+			self.top.element_interior[self.index] = int(bool(interior))
+
+	interior = property(get_interior, set_interior)
 
 	def set_indices(self, alist):
 		
@@ -774,14 +1032,15 @@ class FFEA_element:
 	def get_linear_face(self, index, obj=True):
 		
 		# Define face i as the face that doesn't have node i in it
+		en = self.n
 		if index == 0:
-			n = [self.n[1], self.n[3], self.n[2]]
+			n = [en[1], en[3], en[2]]
 		elif index == 1:
-			n = [self.n[0], self.n[2], self.n[3]]
+			n = [en[0], en[2], en[3]]
 		elif index == 2:
-			n = [self.n[0], self.n[3], self.n[1]]
+			n = [en[0], en[3], en[1]]
 		elif index == 3:
-			n = [self.n[0], self.n[1], self.n[2]]
+			n = [en[0], en[1], en[2]]
 
 		# Return either a face object, or a node list
 		if obj:
@@ -855,12 +1114,13 @@ class FFEA_element:
 
 		# Smallest length is smalles node to opposite plane normal distance
 		length = float("inf")
+		en = self.n
 		for i in range(4):
 			
 			# Get a face
 			f = self.get_linear_face(i)
-			p = node.pos[self.n[i]]
-			otherp = node.pos[self.n[(i + 1) % 4]] # A point in the plane (anything other than i in this element)
+			p = node.pos[en[i]]
+			otherp = node.pos[en[(i + 1) % 4]] # A point in the plane (anything other than i in this element)
 			n = f.calc_normal(node)
 
 			# Define plane a plane[i]x_i + plane[3]
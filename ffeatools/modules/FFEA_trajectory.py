@@ -25,10 +25,38 @@ from os import path
 import numpy as np
 import FFEA_frame, FFEA_pdb
 import sys
+import struct
+import mmap
+import multiprocessing
+
+# Binary trajectory (.ftjb) layout. Everything is little-endian.
+#
+#	char[8]	magic, "FFEATRJB"
+#	uint32	version
+#	uint32	header size in bytes (the first frame record starts here)
+#	uint32	bytes per float, 4 (single) or 8 (double)
+#	uint32	columns stored per node (3 = positions only, 6 = positions and velocities, 10 = all of the .ftj)
+#	uint32	num_blobs
+#	for each blob:
+#		uint32	num_conformations
+#		uint32	motion state (0 = DYNAMIC, 1 = STATIC)
+#		uint32	num_nodes[num_conformations]
+#
+# The header is zero padded to a multiple of 8 bytes and is followed by one fixed size record per frame:
+#
+#	int64	step[num_blobs]
+#	int32	conformation[num_blobs] (plus 4 bytes of padding if num_blobs is odd)
+#	float	node data[max_nodes][columns], for every DYNAMIC blob, where max_nodes is taken over its conformations
+#
+# The number of frames is (file size - header size) / record size, so frames can be appended as they are converted and
+# an interrupted conversion still leaves a readable file. Records are read through numpy.memmap, so the pos / vel arrays
+# of the loaded frames are views into the file rather than copies.
+BINARY_TRAJ_MAGIC = b"FFEATRJB"
+BINARY_TRAJ_VERSION = 1
 
 class FFEA_trajectory:
 
-	def __init__(self, fname="", surf=None, load_all=1, frame_rate = 1, num_frames_to_read = 1000000, start = 0, onlyNodes = False):
+	def __init__(self, fname="", surf=None, load_all=1, frame_rate = 1, num_frames_to_read = 1000000, start = 0, onlyNodes = False, packed = False, num_procs = 1):
 
 		self.reset()
 
@@ -38,11 +66,11 @@ class FFEA_trajectory:
 			sys.stdout.write("Empty trajectory object initialised.\n")
 			return
 
-		self.load(fname, load_all=load_all, surf=surf, frame_rate = frame_rate, num_frames_to_read = num_frames_to_read, start = start, onlyNodes = onlyNodes)
+		self.load(fname, load_all=load_all, surf=surf, frame_rate = frame_rate, num_frames_to_read = num_frames_to_read, start = start, onlyNodes = onlyNodes, packed = packed, num_procs = num_procs)
 
 		return	
 		
-	def load(self, fname, surf=None, load_all=1, frame_rate = 1, num_frames_to_read = 1000000, start = 0, onlyNodes = False):
+	def load(self, fname, surf=None, load_all=1, frame_rate = 1, num_frames_to_read = 1000000, start = 0, onlyNodes = False, packed = False, num_procs = 1):
 
 		print("Loading FFEA trajectory file...")
 
@@ -53,11 +81,25 @@ class FFEA_trajectory:
 		# Clear everything for beginning
 		self.reset()
 
+		# Packed blobs keep all of their frames in one (frames x nodes x 3) array
+		self.packed = packed
+
+		# Binary trajectories are mapped rather than parsed
+		if is_binary_trajectory(fname):
+			self.load_binary(fname, load_all = load_all, frame_rate = frame_rate, num_frames_to_read = num_frames_to_read, start = start, onlyNodes = onlyNodes)
+			return
+
 		# Header first, for sure
 		self.load_header(fname)
 
-		# Then rest of trajectory.
-		if(load_all == 1):
+		# Then rest of trajectory. Jumping over frames is much cheaper with an index of where they are
+		if(load_all == 1 and num_procs > 1):
+			self.load_parallel(fname, num_procs, frame_rate = frame_rate, num_frames_to_read = num_frames_to_read, start = start, onlyNodes = onlyNodes)
+
+		elif(load_all == 1 and (start > 0 or frame_rate > 1)):
+			self.load_from_index(fname, surf=surf, frame_rate = frame_rate, num_frames_to_read = num_frames_to_read, start = start, onlyNodes = onlyNodes)
+
+		elif(load_all == 1):
 			all_frames = 0
 			while(True):
 
@@ -90,6 +132,7 @@ class FFEA_trajectory:
 	def load_header(self, fname):
 
 		# Get a file object and store it
+		self.fname = fname
 		try:
 			self.traj = open(fname, "r")
 
@@ -143,7 +186,315 @@ class FFEA_trajectory:
 		self.fpos = self.traj.tell()
 		
 		# Finally, build the objects
-		self.blob = [[FFEA_traj_blob(self.num_nodes[i][j]) for j in range(self.num_conformations[i])] for i in range(self.num_blobs)]
+		self.blob = [[FFEA_traj_blob(self.num_nodes[i][j], packed=self.packed) for j in range(self.num_conformations[i])] for i in range(self.num_blobs)]
+
+	def load_from_index(self, fname, surf=None, frame_rate = 1, num_frames_to_read = 1000000, start = 0, onlyNodes = False):
+		"""
+		Load a selection of frames by seeking straight to them, using the
+		frame index of the trajectory (see load_frame_index). The header
+		must already have been read.
+		In: self, the filename, and the same frame selection arguments as load().
+		Out: appends the selected frames to self.blob.
+		"""
+
+		self.index = load_frame_index(fname)
+		stop = min(int(start) + int(num_frames_to_read), len(self.index["frame"]))
+		for i in range(int(start), stop, int(frame_rate)):
+			self.fpos = int(self.index["frame"][i])
+			self.traj.seek(self.fpos)
+			if self.load_frame(surf=surf, onlyNodes=onlyNodes) != 0:
+				break
+
+			sys.stdout.write("\r\tFrames read = %d, Frames skipped = %d" % (self.num_frames, i + 1 - self.num_frames))
+			sys.stdout.flush()
+
+		print("\ndone! Successfully read " + str(self.num_frames) + " frame/s from '" + fname + "'.")
+
+	def load_parallel(self, fname, num_procs, frame_rate = 1, num_frames_to_read = 1000000, start = 0, onlyNodes = False):
+		"""
+		Load a selection of frames with a pool of processes. The frame index
+		splits the file into byte ranges on frame boundaries, each process
+		parses its share of the frames with FFEA_frame.read_node_block, and
+		writes the node data straight into shared memory. The header must
+		already have been read.
+		In: self, the filename, the number of processes, and the same frame
+		selection arguments as load().
+		Out: populates self.blob exactly as the serial loader would, with
+		every blob packed (see FFEA_traj_blob.pack_frame) into the shared
+		arrays.
+		"""
+
+		self.index = load_frame_index(fname)
+		stop = min(int(start) + int(num_frames_to_read), len(self.index["frame"]))
+		selected = np.arange(int(start), stop, int(frame_rate))
+		offsets = self.index["blob"][selected]
+		conf = self.index["conf"][selected]
+		num_frames = len(selected)
+
+		# Velocities are only there if the node blocks have at least 6 columns
+		has_vel = not onlyNodes
+		dynamic = np.argwhere(offsets >= 0)
+		if has_vel and len(dynamic) > 0:
+			self.traj.seek(int(offsets[dynamic[0][0], dynamic[0][1]]))
+			has_vel = len(self.traj.readline().split()) >= 6
+
+		# One shared (frames x nodes x 3) array per blob and conformation
+		pos = {}
+		vel = {}
+		for i in range(self.num_blobs):
+			for j in range(self.num_conformations[i]):
+				size = num_frames * self.num_nodes[i][j] * 3
+				pos[(i, j)] = multiprocessing.RawArray("d", size)
+				if has_vel:
+					vel[(i, j)] = multiprocessing.RawArray("d", size)
+
+		# Several chunks per process, so a slow one doesn't hold everyone up
+		chunks = [list(c) for c in np.array_split(np.arange(num_frames), num_procs * 4) if len(c) > 0]
+		pool = multiprocessing.Pool(num_procs, initializer=_init_parallel_load, initargs=(fname, self.num_nodes, offsets, conf, pos, vel))
+		try:
+			failed = pool.map(_parallel_load_frames, chunks)
+		finally:
+			pool.close()
+			pool.join()
+
+		# Stop at the first frame that couldn't be read, as the serial loader does
+		failed = [f for f in failed if f >= 0]
+		if len(failed) > 0:
+			num_frames = min(failed)
+
+		for i in range(self.num_blobs):
+
+			# A blob can be static in some frames and not others, which have no node block (an offset of -1).
+			# It is only static overall if it is static in every frame
+			static = offsets[:num_frames, i] < 0
+			for j in range(self.num_conformations[i]):
+				b = self.blob[i][j]
+				b.motion_state = "STATIC" if num_frames > 0 and np.all(static) else "DYNAMIC"
+				bpos = _shared_array(pos[(i, j)], self.num_nodes[i][j])
+				bvel = _shared_array(vel[(i, j)], self.num_nodes[i][j]) if has_vel else None
+				for f in range(num_frames):
+					if static[f] or conf[f, i] != j:
+						bpos[f] = np.nan
+						b.frame.append(None)
+						continue
+
+					frame = FFEA_frame.FFEA_frame()
+					frame.conformation = j
+					frame.num_nodes = self.num_nodes[i][j]
+					frame.num_surface_nodes = frame.num_nodes
+					if bvel is not None:
+						frame.vel = bvel[f]
+					elif not onlyNodes:
+						frame.vel = None
+					frame.set_step(int(self.index["step"][selected[f], i]))
+					b.frame.append(frame)
+
+				b.packed = True
+				b.set_packed_pos(bpos, num_frames)
+
+		self.num_frames = num_frames
+
+		# Leave the file after the last frame, so load_frame can carry on
+		if num_frames > 0:
+			self.traj.seek(int(self.index["frame"][selected[num_frames - 1]]))
+			self.skip_frame()
+			self.fpos = self.traj.tell()
+
+		print("\ndone! Successfully read " + str(self.num_frames) + " frame/s from '" + fname + "' with " + str(num_procs) + " processes.")
+
+	def get_num_frames_in_file(self):
+		"""
+		Get the number of complete frames in the trajectory file, loaded or not.
+		"""
+		if self.binary_header is not None:
+			return 0 if self.binary is None else len(self.binary)
+
+		if self.index == None:
+			self.index = load_frame_index(self.fname)
+		return len(self.index["frame"])
+
+	def get_frame(self, index, onlyNodes=False, blobs=None):
+		"""
+		Read a single frame straight from the trajectory file, without
+		loading any of the others. Frames loaded into self.blob are not
+		changed.
+		In: self, the index of the frame in the file, whether to skip
+		the velocities, and optionally the indices of the blobs wanted.
+		Out: a list with the frame of the active conformation of each
+		(wanted) blob, or None for STATIC blobs. The conformation of each
+		frame is stored in frame.conformation.
+		"""
+
+		if blobs == None:
+			blobs = range(self.num_blobs)
+
+		num_frames = self.get_num_frames_in_file()
+		if index < 0:
+			index += num_frames
+		if index < 0 or index >= num_frames:
+			raise IndexError("Error. Frame index %d out of range (num_frames = %d)." % (index, num_frames))
+
+		if self.binary_header is not None:
+			header = self.binary_header
+			record = self.binary[index]
+			frames = []
+			for i in blobs:
+				if header["motion_state"][i] == "STATIC":
+					frames.append(None)
+					continue
+
+				frame = FFEA_frame.FFEA_frame()
+				frame.conformation = int(record["conf"][i])
+				frame.num_nodes = self.num_nodes[i][frame.conformation]
+				frame.num_surface_nodes = frame.num_nodes
+				frame.pos = record["blob%d" % (i)][:frame.num_nodes, 0:3]
+				if not onlyNodes and header["num_columns"] >= 6:
+					frame.vel = record["blob%d" % (i)][:frame.num_nodes, 3:6]
+				elif not onlyNodes:
+					frame.vel = None
+				frame.set_step(int(record["step"][i]))
+				frames.append(frame)
+			return frames
+
+		# Leave the file where it was, so load_frame can carry on afterwards
+		fpos = self.traj.tell()
+		frames = []
+		for i in blobs:
+			if self.index["blob"][index, i] < 0:
+				frames.append(None)
+				continue
+
+			self.traj.seek(int(self.index["blob"][index, i]))
+			frame = FFEA_frame.FFEA_frame()
+			frame.conformation = int(self.index["conf"][index, i])
+			frame.num_nodes = self.num_nodes[i][frame.conformation]
+			if onlyNodes == True:
+				success = frame.load_from_traj_onlynodes_faster(self.traj)
+			else:
+				success = frame.load_from_traj_faster(self.traj)
+
+			if success == 1:
+				self.traj.seek(fpos)
+				raise IOError("\tFailed to read blob " + str(i) + " of frame " + str(index) + " from '" + self.fname + "'. Has the file changed?")
+
+			frame.set_step(int(self.index["step"][index, i]))
+			frames.append(frame)
+
+		self.traj.seek(fpos)
+		return frames
+
+	def iter_frames(self, start = 0, stop = None, step = 1, blobs = None, only_nodes = False, batch_size = None):
+		"""
+		Iterate over the frames of the trajectory file, reading each one only
+		when it is needed, so that trajectories larger than memory can be
+		processed. Nothing is added to self.blob. Works on an object loaded
+		with load_all = 0, which reads just the header.
+		In: self, the range of frame indices to visit (as for range()),
+		the indices of the blobs wanted (all by default), whether to skip
+		the velocities, and optionally a batch size.
+		Out: yields, for each frame, the list that get_frame returns. If
+		batch_size is given, yields lists of up to batch_size of those instead.
+		"""
+
+		num_frames = self.get_num_frames_in_file()
+		if stop == None or stop > num_frames:
+			stop = num_frames
+
+		batch = []
+		for i in range(int(start), int(stop), int(step)):
+			frames = self.get_frame(i, onlyNodes=only_nodes, blobs=blobs)
+			if batch_size == None:
+				yield frames
+				continue
+
+			batch.append(frames)
+			if len(batch) == batch_size:
+				yield batch
+				batch = []
+
+		if len(batch) > 0:
+			yield batch
+
+	def load_binary(self, fname, load_all = 1, frame_rate = 1, num_frames_to_read = 1000000, start = 0, onlyNodes = False):
+		"""
+		Map a binary (.ftjb) trajectory into this object.
+		In: self, the filename, and the same arguments as load(). With
+		load_all = 0, the file is mapped but no frames are built.
+		Out: populates self.blob. The pos (and vel) arrays of every frame are
+		views into a copy-on-write numpy.memmap of the file, so nothing is
+		parsed, and modifying a frame never changes the file on disk.
+		"""
+
+		header = read_binary_header(fname)
+
+		self.fname = fname
+		self.binary_header = header
+		self.num_blobs = header["num_blobs"]
+		self.num_conformations = header["num_conformations"]
+		self.num_nodes = header["num_nodes"]
+		self.blob = [[FFEA_traj_blob(self.num_nodes[i][j], packed=self.packed) for j in range(self.num_conformations[i])] for i in range(self.num_blobs)]
+		for i in range(self.num_blobs):
+			for c in self.blob[i]:
+				c.motion_state = header["motion_state"][i]
+
+		record = binary_record_dtype(header)
+		num_records = (path.getsize(fname) - header["header_size"]) // record.itemsize
+		if num_records == 0:
+			self.valid = True
+			self.empty = False
+			print("\ndone! Successfully read 0 frame/s from '" + fname + "'.")
+			return
+
+		self.binary = np.memmap(fname, dtype=record, mode="c", offset=header["header_size"], shape=(num_records,))
+		if load_all != 1:
+			self.valid = True
+			self.empty = False
+			return
+
+		records = self.binary[int(start):int(start) + int(num_frames_to_read):int(frame_rate)]
+
+		steps = records["step"]
+		confs = records["conf"]
+		for i in range(self.num_blobs):
+			dynamic = header["motion_state"][i] == "DYNAMIC"
+			if dynamic:
+				data = records["blob%d" % (i)]
+
+			for f in range(len(records)):
+				cindex = confs[f, i]
+				for c in range(self.num_conformations[i]):
+					if c != cindex or not dynamic:
+						self.blob[i][c].frame.append(None)
+						continue
+
+					frame = FFEA_frame.FFEA_frame()
+					frame.conformation = c
+					frame.num_nodes = self.num_nodes[i][c]
+					frame.num_surface_nodes = frame.num_nodes
+					frame.pos = data[f, :frame.num_nodes, 0:3]
+					if not onlyNodes and header["num_columns"] >= 6:
+						frame.vel = data[f, :frame.num_nodes, 3:6]
+					elif not onlyNodes:
+						frame.vel = None
+					frame.set_step(int(steps[f, i]))
+					self.blob[i][c].frame.append(frame)
+
+			# The mapped records are already a (frames x nodes x 3) array. With more than one conformation, every
+			# one of them would share it, so each gets its own copy instead, nan where it is not active (as in
+			# pack_frame), and translating or rescaling all the conformations moves each frame only once
+			if dynamic:
+				for c in range(self.num_conformations[i]):
+					pos = data[:, :self.num_nodes[i][c], 0:3]
+					if self.num_conformations[i] > 1:
+						pos = np.where((confs[:, i] == c)[:, np.newaxis, np.newaxis], pos, np.nan)
+
+					self.blob[i][c].packed = True
+					self.blob[i][c].set_packed_pos(pos)
+
+		self.num_frames = len(records)
+		self.valid = True
+		self.empty = False
+		print("\ndone! Successfully read " + str(self.num_frames) + " frame/s from '" + fname + "'.")
 
 	# Manually set header data
 	def set_header(self, num_blobs, num_conformations, num_nodes):
@@ -153,7 +504,7 @@ class FFEA_trajectory:
 		self.num_nodes = num_nodes
 
 		# Still build the objects
-		self.blob = [[FFEA_traj_blob(self.num_nodes[i][j]) for j in range(self.num_conformations[i])] for i in range(self.num_blobs)]
+		self.blob = [[FFEA_traj_blob(self.num_nodes[i][j], packed=self.packed) for j in range(self.num_conformations[i])] for i in range(self.num_blobs)]
 
 	# This function must be run as fast as possible! Error checking will be at a minimum. This function is standalone so it can be threaded
 	def load_frame(self, surf=None, onlyNodes=False):
@@ -171,7 +522,7 @@ class FFEA_trajectory:
 				step = int(sline[5])
 
 			except(IndexError):
-				self.traj.seek(self.fpos)
+				self.unload_partial_frame(bindex)
 				return 1
     
     	# ye who enter here: do not 'fix' this! The script is not handling an
@@ -181,8 +532,7 @@ class FFEA_trajectory:
 
 			except(ValueError):
 
-				# Don't need to reset though!
-				self.traj.seek(self.fpos)
+				self.unload_partial_frame(bindex)
 				print("Unable to read conformation index for blob " + str(bindex) + " at frame " + str(self.num_frames))
 				return 1
 				
@@ -206,6 +556,7 @@ class FFEA_trajectory:
 
 				# Get a frame
 				frame = FFEA_frame.FFEA_frame()
+				frame.conformation = cindex
 				frame.num_nodes = b[cindex].num_nodes
 
 				# Try to read stuff
@@ -227,27 +578,53 @@ class FFEA_trajectory:
 
 
 			# Append frame
-			b[cindex].frame.append(frame)
+			b[cindex].set_frame(frame)
 
 			# Append None to all frames that aren't active
 			for c in range(self.num_conformations[bindex]):
 				if c != cindex:
-					b[c].frame.append(None)
+					b[c].set_frame(None)
 
-		if not eof:
-		
-			# Gloss over kinetics stuff
-			self.traj.readline()
-			while(self.traj.readline().strip() != "*"):
-				pass
+		if eof:
+			self.unload_partial_frame(bindex)
+			return 1
 
-			self.num_frames += 1
-			self.fpos = self.traj.tell()
-			return 0
-		else:
-			self.traj.seek(self.fpos)
+		# Gloss over kinetics stuff. The frame is only complete once its closing '*' is there
+		self.traj.readline()
+		line = self.traj.readline()
+		while(line.strip() != "*" or line[-1] != "\n"):
+			line = self.traj.readline()
+			if line == "":
+				self.unload_partial_frame(self.num_blobs)
+				return 1
 
-	def rescale(self, factor, frame_index):
+		self.num_frames += 1
+		self.fpos = self.traj.tell()
+		return 0
+
+	def unload_partial_frame(self, num_blobs_read):
+		"""
+		Undo a frame that was only partly written when load_frame met it.
+		The blobs already read have their new frame removed, and the file is
+		returned to the end of the last complete frame, so the frame can be
+		read again once the simulation has finished writing it.
+		In: self, the number of blobs whose frame had already been appended.
+		"""
+		for b in self.blob[:num_blobs_read]:
+			for c in b:
+				if len(c.frame) > self.num_frames:
+					c.delete_frame(-1)
+
+		self.traj.seek(self.fpos)
+
+	def rescale(self, factor, frame_index=None):
+
+		# Packed blobs can do every frame at once
+		if frame_index == None:
+			for b in range(self.num_blobs):
+				for c in range(self.num_conformations[b]):
+					self.blob[b][c].rescale(factor)
+			return
 
 		for b in range(self.num_blobs):
 			for c in range(self.num_conformations[b]):
@@ -259,8 +636,7 @@ class FFEA_trajectory:
 	def translate(self, trans):
 		for b in range(self.num_blobs):
 			for c in range(self.num_conformations[b]):
-				for f in range(self.num_frames):
-					self.blob[b][c].frame[f].translate(trans)
+				self.blob[b][c].translate(trans)
 
 	def skip_frame(self):
 
@@ -281,7 +657,7 @@ class FFEA_trajectory:
 		try:
 			for i in range(self.num_blobs):
 				for j in range(self.num_conformations[i]):
-					del self.blob[i][j].frame[index]
+					self.blob[i][j].delete_frame(index)
 				
 			self.num_frames -= 1
 		except:
@@ -350,6 +726,11 @@ class FFEA_trajectory:
 	def reset(self):
 
 		self.traj = None
+		self.fname = None
+		self.index = None
+		self.binary = None
+		self.binary_header = None
+		self.packed = False
 		self.num_frames = 0
 		self.num_blobs = 0
 		self.num_conformations = []
@@ -377,15 +758,117 @@ class FFEA_trajectory:
 
 		fout.close()
 
-	def write_header_to_file(self, fout):
+	def write_binary(self, fname, frames=None, frame_rate = 1, precision = "double"):
+		"""
+		Write this trajectory in the binary (.ftjb) format.
+		In: self, an output filename, an optional [first, last) frame range,
+		a frame rate and the precision ("double" or "single") of the stored
+		node data. Velocities are kept if the frames have them.
+		"""
+
+		print("Writing binary trajectory to file\n\tData will be written to %s\n" % (fname))
+
+		if frames == None:
+			frames = [0,self.num_frames]
+
+		# Store velocities only if every dynamic frame carries them
+		num_columns = 6
+		motion_state = []
+		for b in self.blob:
+			motion_state.append(b[0].motion_state)
+			for c in b:
+				for f in c.frame:
+					if f != None and (f.vel is None or len(f.vel) != len(f.pos)):
+						num_columns = 3
+
+		header = make_binary_header(self.num_conformations, self.num_nodes, motion_state, num_columns, precision)
+		record = binary_record_dtype(header)
+
+		fout = open(fname, "wb")
+		write_binary_header(fout, header)
+		for i in range(frames[0], frames[1], frame_rate):
+			rec = np.zeros(1, dtype=record)
+			for b in range(self.num_blobs):
+				for c in range(self.num_conformations[b]):
+					f = self.blob[b][c].frame[i]
+					if f == None:
+						continue
+
+					rec["conf"][0, b] = c
+					rec["step"][0, b] = f.step
+					data = rec["blob%d" % (b)][0]
+					data[:len(f.pos), 0:3] = f.pos
+					if num_columns == 6:
+						data[:len(f.vel), 3:6] = f.vel
+			rec.tofile(fout)
+
+		fout.close()
+
+	def write_frames_to_file(self, fname, frames, blobs=None):
+		"""
+		Write a trajectory one frame at a time, for instance straight from
+		iter_frames, so that it never has to be held in memory.
+		In: self (for the header), an output filename, an iterable of frames
+		as yielded by iter_frames (not batched), and the blobs they hold
+		(all by default). The blobs are renumbered from 0 in the output.
+		Out: the number of frames written.
+		"""
+
+		print("Writing trajectory to file\n\tData will be written to %s\n" % (fname))
+
+		fout = open(fname, "w")
+		self.write_header_to_file(fout, blobs=blobs)
+
+		# Conformation changes need the next frame, so stay one behind
+		num_frames = 0
+		last = None
+		for f in frames:
+			if last != None:
+				self.write_frame_list_to_file(fout, last, f)
+				num_frames += 1
+			last = f
+
+		if last != None:
+			self.write_frame_list_to_file(fout, last)
+			num_frames += 1
+
+		fout.close()
+		return num_frames
+
+	def write_frame_list_to_file(self, fout, frames, next_frames=None):
+
+		# Traj data
+		for bindex in range(len(frames)):
+			f = frames[bindex]
+			if f == None:
+				fout.write("Blob %d, Conformation %d, step %d\nSTATIC\n" % (bindex, 0, 0))
+			else:
+				fout.write("Blob %d, Conformation %d, step %d\nDYNAMIC\n" % (bindex, f.conformation, f.step))
+				f.write_to_traj(fout)
+
+		# Kinetic Data
+		fout.write("*\nConformation Changes:\n")
+		for bindex in range(len(frames)):
+			cur_conf = 0 if frames[bindex] == None else frames[bindex].conformation
+			next_conf = cur_conf
+			if next_frames != None and next_frames[bindex] != None:
+				next_conf = next_frames[bindex].conformation
+
+			fout.write("Blob %d: Conformation %d -> Conformation %d\n" % (bindex, cur_conf, next_conf))
+		fout.write("*\n")
+
+	def write_header_to_file(self, fout, blobs=None):
 
+		if blobs == None:
+			blobs = range(self.num_blobs)
 		
-		fout.write("FFEA_trajectory_file\n\nInitialisation:\nNumber of Blobs %d\nNumber of Conformations" % (self.num_blobs))
-		for i in self.num_conformations:
-			fout.write(" %d" % (i))
+		fout.write("FFEA_trajectory_file\n\nInitialisation:\nNumber of Blobs %d\nNumber of Conformations" % (len(blobs)))
+		for i in blobs:
+			fout.write(" %d" % (self.num_conformations[i]))
 		fout.write("\n")
-		for i in range(self.num_blobs):
-			fout.write("Blob %d:" % (i))
+		for bindex in range(len(blobs)):
+			i = blobs[bindex]
+			fout.write("Blob %d:" % (bindex))
 			for j in range(self.num_conformations[i]):
 				fout.write(" Conformation %d Nodes %d" % (j, self.num_nodes[i][j]))
 			fout.write("\n")
@@ -439,6 +922,11 @@ class FFEA_trajectory:
 	def reset(self):
 
 		self.traj = None
+		self.fname = None
+		self.index = None
+		self.binary = None
+		self.binary_header = None
+		self.packed = False
 		self.num_frames = 0
 		self.num_blobs = 0
 		self.num_conformations = []
@@ -449,15 +937,128 @@ class FFEA_trajectory:
 
 class FFEA_traj_blob:
 
-	def __init__(self, num_nodes=0):
+	def __init__(self, num_nodes=0, packed=False):
 
 		self.reset()
 		self.num_nodes = num_nodes
+		self.packed = packed
 
 	# Manually set a frame
 	def set_frame(self, frame):
+		if self.packed:
+			self.pack_frame(frame)
 		self.frame.append(frame)
-	
+
+	def pack_frame(self, frame):
+		"""
+		Copy the positions of the next frame into the packed array of this
+		blob, and make the pos of the frame a view into that array. The
+		array grows geometrically, so appending a frame is amortised O(1).
+		In: self, the frame to be appended (or None, if this conformation is
+		not active in that frame).
+		"""
+		index = len(self.frame)
+		if self.packed_buffer is None or index >= len(self.packed_buffer):
+			self.grow_packed(max(16, 2 * index))
+
+		if frame is None:
+			self.packed_buffer[index] = np.nan
+		else:
+			self.packed_buffer[index] = frame.pos
+			frame.pos = self.packed_buffer[index]
+
+		self.pos = self.packed_buffer[:index + 1]
+
+	def grow_packed(self, capacity):
+		"""
+		Reallocate the packed array with room for capacity frames, and point
+		every frame already packed at its new home.
+		"""
+		buf = np.empty([capacity, self.num_nodes, 3])
+		num_packed = len(self.frame)
+		if self.packed_buffer is not None:
+			buf[:num_packed] = self.packed_buffer[:num_packed]
+		else:
+			for i in range(num_packed):
+				buf[i] = np.nan if self.frame[i] == None else self.frame[i].pos
+
+		self.set_packed_pos(buf, num_packed)
+
+	def set_packed_pos(self, pos, num_frames=None):
+		"""
+		Use an existing (frames x nodes x 3) array, for instance a memory
+		mapped one, as the packed array of this blob.
+		In: self, the array, and how many of its frames are in use (all of
+		them by default).
+		"""
+		if num_frames == None:
+			num_frames = len(pos)
+
+		self.packed_buffer = pos
+		self.pos = pos[:num_frames]
+		for i in range(min(num_frames, len(self.frame))):
+			if self.frame[i] != None:
+				self.frame[i].pos = pos[i]
+
+	def get_active_frames(self):
+		"""
+		Get the indices of the frames in which this conformation is active.
+		"""
+		return np.array([i for i in range(len(self.frame)) if self.frame[i] != None], dtype=int)
+
+	def get_pos(self, indices=None):
+		"""
+		Get the positions of every active frame as one array.
+		In: self, and optionally a list of node indices.
+		Out: a (active frames x nodes x 3) array. For a packed blob whose
+		conformation is always active, this is a view, not a copy.
+		"""
+		active = self.get_active_frames()
+		if self.pos is not None and len(active) == len(self.frame):
+			pos = self.pos
+		elif self.pos is not None:
+			pos = self.pos[active]
+		elif len(active) == 0:
+			pos = np.empty([0, self.num_nodes, 3])
+		else:
+			pos = np.array([self.frame[i].pos for i in active])
+
+		if indices is None:
+			return pos
+		return pos[:,indices]
+
+	def delete_frame(self, index=-1):
+		if self.packed and self.pos is not None:
+			num_frames = len(self.frame)
+			if index < 0:
+				index += num_frames
+			if index < 0 or index >= num_frames:
+				raise IndexError("Error. Frame index %d out of range (num_frames = %d)." % (index, num_frames))
+
+			self.packed_buffer[index:num_frames - 1] = self.packed_buffer[index + 1:num_frames]
+			del self.frame[index]
+			self.set_packed_pos(self.packed_buffer, num_frames - 1)
+		else:
+			del self.frame[index]
+
+	def translate(self, trans):
+		if self.pos is not None:
+			self.pos += np.array(trans)
+			return
+
+		for f in self.frame:
+			if f != None:
+				f.translate(trans)
+
+	def rescale(self, factor):
+		if self.pos is not None:
+			self.pos *= factor
+			return
+
+		for f in self.frame:
+			if f != None:
+				f.rescale(factor)
+
 	def set_subblob(self, pin):
 		"""
 		Create a subblob from a pin object.
@@ -471,6 +1072,16 @@ class FFEA_traj_blob:
 		self.subblob.append(pin.index)
 		self.num_subblobs += 1
 		return self.num_subblobs # let the user assign a nice friendly name to their subblob
+
+	def get_subblob_indices(self, subblob_index = -1):
+
+		if subblob_index == -1:
+			return None
+
+		try:
+			return self.subblob[subblob_index]
+		except(IndexError):
+			raise IndexError("Error. Subblob index %d out of range (num_subblobs = %d)." % (subblob_index, self.num_subblobs))
 	
 	def calc_centroid_trajectory(self, subblob_index = -1):
 		"""
@@ -482,29 +1093,38 @@ class FFEA_traj_blob:
 		of nodes in your blob\sub-blob.
 		"""
 		
-		if subblob_index == -1:
-			indices = [i for i in range(self.num_nodes)]
-		else:
-			try:
-				indices = self.subblob[subblob_index]
-			except(IndexError):
-				raise IndexError("Error. Subblob index %d out of range (num_subblobs = %d)." % (subblob_index, self.num_subblobs))
-
-		# Build the trajectory
-		subblob_size = len(indices)		
-		ctraj = []
-		step = []
-		
-		for f in self.frame:
-			centroid = np.array([0.0,0.0,0.0])
-			for i in indices:
-				centroid += f.pos[i]
+		indices = self.get_subblob_indices(subblob_index)
+		active = self.get_active_frames()
 
-			centroid /= subblob_size
-			ctraj.append(centroid)
-			step.append(f.step)
+		step = np.array([self.frame[i].step for i in active])
+		ctraj = np.mean(self.get_pos(indices), axis=1)
 			
-		return np.array(step), np.array(ctraj)
+		return step, ctraj
+
+	def calc_rmsd_trajectory(self, reference_index = 0, remove_translation = False, subblob_index = -1):
+		"""
+		Calculate the RMSD of every active frame from a reference frame, as
+		the FFEA runner does for its measurement files.
+		In: self, the index of the reference frame, whether to remove the
+		translation of the centroid first, and a subblob index.
+		Out: the steps and the RMSD of each active frame, as 1-d arrays.
+		"""
+
+		indices = self.get_subblob_indices(subblob_index)
+		active = self.get_active_frames()
+
+		step = np.array([self.frame[i].step for i in active])
+		pos = self.get_pos(indices)
+		ref = np.array(self.frame[reference_index].pos)
+		if indices is not None:
+			ref = ref[indices]
+
+		diff = pos - ref
+		if remove_translation:
+			diff -= np.mean(diff, axis=1)[:,np.newaxis,:]
+
+		rmsd = np.sqrt(np.mean(np.sum(diff * diff, axis=2), axis=1))
+		return step, rmsd
 
 	def reset(self):
 
@@ -513,21 +1133,394 @@ class FFEA_traj_blob:
 		self.num_subblobs = 0
 		self.frame = []
 		self.subblob = []
+		self.pos = None
+		self.packed_buffer = None
 
 
 # External functions
 def get_num_frames(fname):
 
+	if is_binary_trajectory(fname):
+		header = read_binary_header(fname)
+		return (path.getsize(fname) - header["header_size"]) // binary_record_dtype(header).itemsize
+
 	fin = open(fname, "r")
-	if fin.readline().strip() != "FFEA_trajectory_file":
+	line = fin.readline().strip()
+	fin.close()
+	if line != "FFEA_trajectory_file":
 		print("\tExpected to read 'FFEA_trajectory_file' but read '" + line + "'. This may not be an FFEA trajectory file.")
-		self.reset()
 		return 1
-		
-	num_asterisks = 0	
-	for line in fin:
-		if "*" in line:
-			num_asterisks += 1
-	
-	return (num_asterisks - 1) / 2
 
+	return len(load_frame_index(fname)["frame"])
+
+# State shared with the processes of FFEA_trajectory.load_parallel
+_parallel_load = {}
+
+def _init_parallel_load(fname, num_nodes, offsets, conf, pos, vel):
+	_parallel_load["fname"] = fname
+	_parallel_load["num_nodes"] = num_nodes
+	_parallel_load["offsets"] = offsets
+	_parallel_load["conf"] = conf
+	_parallel_load["pos"] = pos
+	_parallel_load["vel"] = vel
+
+def _parallel_load_frames(frames):
+	"""
+	Read a chunk of frames into the shared arrays (see FFEA_trajectory.load_parallel).
+	In: a list of indices into the selected frames.
+	Out: the first of them that could not be read, or -1.
+	"""
+	state = _parallel_load
+	offsets = state["offsets"]
+	fin = open(state["fname"], "r")
+	for f in frames:
+		for i in range(offsets.shape[1]):
+			if offsets[f, i] < 0:
+				continue
+
+			c = state["conf"][f, i]
+			n = state["num_nodes"][i][c]
+			fin.seek(int(offsets[f, i]))
+			data = FFEA_frame.read_node_block(fin, n)
+			if data is None:
+				fin.close()
+				return f
+
+			_shared_array(state["pos"][(i, c)], n)[f] = data[:,0:3]
+			if (i, c) in state["vel"]:
+				_shared_array(state["vel"][(i, c)], n)[f] = data[:,3:6]
+
+	fin.close()
+	return -1
+
+def _shared_array(raw, num_nodes):
+	if len(raw) == 0:
+		return np.empty([0, num_nodes, 3])
+	return np.frombuffer(raw, dtype=np.float64).reshape(-1, num_nodes, 3)
+
+def get_frame_index_fname(fname):
+	return fname + "idx"
+
+def load_frame_index(fname, rebuild = False):
+	"""
+	Get the frame index of a text trajectory. The index is cached next to
+	the trajectory (see get_frame_index_fname) and is rebuilt whenever the
+	size or modification time of the trajectory no longer match it.
+	In: the .ftj filename, and whether to rebuild the index regardless.
+	Out: an index dictionary (see build_frame_index).
+	"""
+
+	iname = get_frame_index_fname(fname)
+	size = path.getsize(fname)
+	mtime = path.getmtime(fname)
+
+	if not rebuild and path.exists(iname):
+		try:
+			cached = np.load(iname)
+			index = dict((key, cached[key]) for key in cached.files)
+			cached.close()
+			if int(index["size"]) == size and float(index["mtime"]) == mtime:
+				return index
+		except(IOError, ValueError, KeyError):
+			pass
+
+	index = build_frame_index(fname)
+
+	# A read-only directory just means we rebuild next time
+	try:
+		with open(iname, "wb") as fout:
+			np.savez(fout, **index)
+	except(IOError, OSError):
+		pass
+
+	return index
+
+def build_frame_index(fname):
+	"""
+	Scan a text trajectory once and record where each frame is.
+	Only the '*' separators and blob headers are searched for, so the node
+	data itself is never parsed. A partly written final frame is left out.
+	In: the .ftj filename.
+	Out: an index dictionary with
+		size, mtime - of the trajectory when it was indexed,
+		frame - (num_frames) byte offset of the first line of each frame,
+		blob - (num_frames, num_blobs) byte offset of the node block of each blob, -1 if STATIC,
+		conf - (num_frames, num_blobs) active conformation of each blob,
+		step - (num_frames, num_blobs) step of each blob.
+	"""
+
+	traj = FFEA_trajectory()
+	traj.load_header(fname)
+	num_blobs = traj.num_blobs
+	start = traj.fpos
+	traj.traj.close()
+
+	frame = []
+	blob = []
+	conf = []
+	step = []
+
+	fin = open(fname, "rb")
+	size = path.getsize(fname)
+	mtime = path.getmtime(fname)
+	if size > start:
+		mm = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+		while(True):
+
+			# Node data ends at the first '*', conformation changes at the second
+			end = mm.find(b"\n*\n", start)
+			if end == -1:
+				break
+			close = mm.find(b"\n*\n", end + 2)
+			if close == -1:
+				break
+
+			bpos = start
+			boffset = []
+			bconf = []
+			bstep = []
+			try:
+				for i in range(num_blobs):
+					eol = mm.find(b"\n", bpos)
+					sline = mm[bpos:eol].split()
+					if sline[0] != b"Blob":
+						raise ValueError
+					bconf.append(int(sline[3].rstrip(b",")))
+					bstep.append(int(sline[5]))
+
+					# Skip the motion state line
+					mline = mm.find(b"\n", eol + 1)
+					if mm[eol + 1:mline].strip() == b"STATIC":
+						boffset.append(-1)
+						bpos = mline + 1
+					else:
+						boffset.append(mline + 1)
+						bpos = mm.find(b"\nBlob ", mline, end + 1) + 1
+
+			except(IndexError, ValueError):
+				break
+
+			frame.append(start)
+			blob.append(boffset)
+			conf.append(bconf)
+			step.append(bstep)
+			start = close + 3
+
+		mm.close()
+	fin.close()
+
+	return {"size": np.array(size, dtype=np.int64),
+		"mtime": np.array(mtime, dtype=np.float64),
+		"frame": np.array(frame, dtype=np.int64),
+		"blob": np.array(blob, dtype=np.int64).reshape(-1, num_blobs),
+		"conf": np.array(conf, dtype=np.int32).reshape(-1, num_blobs),
+		"step": np.array(step, dtype=np.int64).reshape(-1, num_blobs)}
+
+
+
+def is_binary_trajectory(fname):
+	"""
+	Check whether a file starts with the binary trajectory magic number.
+	"""
+	try:
+		with open(fname, "rb") as fin:
+			return fin.read(len(BINARY_TRAJ_MAGIC)) == BINARY_TRAJ_MAGIC
+	except(IOError):
+		return False
+
+def make_binary_header(num_conformations, num_nodes, motion_state, num_columns, precision = "double"):
+	"""
+	Build the header dictionary used by the binary trajectory functions.
+	In: conformations per blob, nodes per blob per conformation, the motion
+	state of each blob, the node columns to store and the precision, either
+	"double" or "single".
+	Out: a header dictionary, with the header size filled in.
+	"""
+	if precision not in ["double", "single"]:
+		raise ValueError("Precision must be 'double' or 'single', not '" + str(precision) + "'.")
+
+	header = {"version": BINARY_TRAJ_VERSION,
+		"float_size": 8 if precision == "double" else 4,
+		"num_columns": num_columns,
+		"num_blobs": len(num_conformations),
+		"num_conformations": list(num_conformations),
+		"num_nodes": [list(n) for n in num_nodes],
+		"motion_state": list(motion_state)}
+
+	size = 8 + 5 * 4
+	for n in header["num_conformations"]:
+		size += 8 + 4 * n
+	header["header_size"] = size + (-size % 8)
+	return header
+
+def read_binary_header(fname):
+	"""
+	Read the header of a binary (.ftjb) trajectory.
+	In: the filename.
+	Out: a header dictionary (see make_binary_header).
+	"""
+	try:
+		fin = open(fname, "rb")
+	except(IOError):
+		raise IOError("\tFailed to open '" + fname + "' for reading.")
+
+	try:
+		if fin.read(len(BINARY_TRAJ_MAGIC)) != BINARY_TRAJ_MAGIC:
+			raise IOError("\tExpected binary trajectory magic number '" + BINARY_TRAJ_MAGIC.decode() + "' in '" + fname + "'. This may not be a binary FFEA trajectory file.")
+
+		version, header_size, float_size, num_columns, num_blobs = struct.unpack("<5I", fin.read(20))
+		if version != BINARY_TRAJ_VERSION:
+			raise IOError("\tBinary trajectory version " + str(version) + " in '" + fname + "' is not supported.")
+
+		num_conformations = []
+		num_nodes = []
+		motion_state = []
+		for i in range(num_blobs):
+			nconf, static = struct.unpack("<2I", fin.read(8))
+			num_conformations.append(nconf)
+			motion_state.append("STATIC" if static else "DYNAMIC")
+			num_nodes.append(list(struct.unpack("<%dI" % (nconf), fin.read(4 * nconf))))
+
+	except(struct.error):
+		raise IOError("\tBinary trajectory header in '" + fname + "' is truncated.")
+	finally:
+		fin.close()
+
+	header = make_binary_header(num_conformations, num_nodes, motion_state, num_columns, "double" if float_size == 8 else "single")
+	if header["header_size"] != header_size:
+		raise IOError("\tBinary trajectory header in '" + fname + "' is inconsistent (" + str(header_size) + " bytes declared, " + str(header["header_size"]) + " found).")
+
+	return header
+
+def write_binary_header(fout, header):
+	"""
+	Write a header dictionary (see make_binary_header) to an open file.
+	"""
+	data = BINARY_TRAJ_MAGIC
+	data += struct.pack("<5I", header["version"], header["header_size"], header["float_size"], header["num_columns"], header["num_blobs"])
+	for i in range(header["num_blobs"]):
+		data += struct.pack("<2I", header["num_conformations"][i], 1 if header["motion_state"][i] == "STATIC" else 0)
+		data += struct.pack("<%dI" % (header["num_conformations"][i]), *header["num_nodes"][i])
+
+	fout.write(data + b"\0" * (header["header_size"] - len(data)))
+
+def binary_record_dtype(header):
+	"""
+	Get the numpy dtype of a single frame record of a binary trajectory.
+	In: a header dictionary.
+	Out: a structured dtype with the fields 'step', 'conf' and 'blob%d' for
+	every dynamic blob, shaped (max_nodes, num_columns).
+	"""
+	num_blobs = header["num_blobs"]
+	fields = [("step", "<i8", (num_blobs,)), ("conf", "<i4", (num_blobs,))]
+	if num_blobs % 2 == 1:
+		fields.append(("pad", "<i4"))
+
+	ftype = "<f8" if header["float_size"] == 8 else "<f4"
+	for i in range(num_blobs):
+		if header["motion_state"][i] == "DYNAMIC":
+			fields.append(("blob%d" % (i), ftype, (max(header["num_nodes"][i]), header["num_columns"])))
+
+	return np.dtype(fields)
+
+def convert_ftj_to_binary(fname, out_fname, precision = "double"):
+	"""
+	Convert a text (.ftj) trajectory into the binary (.ftjb) format.
+	The .ftj is streamed one frame at a time, so only a single frame is
+	ever held in memory, and every column of the node data is kept, so a
+	double precision conversion is lossless. A partially written final
+	frame is left out.
+	In: the .ftj filename, the output filename and the precision, either
+	"double" or "single".
+	Out: the number of frames converted.
+	"""
+
+	traj = FFEA_trajectory()
+	traj.load_header(fname)
+	fin = traj.traj
+
+	fout = None
+	num_frames = 0
+	while(True):
+		frame = _read_ftj_frame_columns(fin, traj.num_nodes)
+		if frame == None:
+			break
+
+		# The first frame tells us the motion states and the columns present
+		if fout == None:
+			motion_state = [state for conf, step, state, data in frame]
+			num_columns = [data.shape[1] for conf, step, state, data in frame if data is not None]
+			num_columns = num_columns[0] if len(num_columns) > 0 else 3
+			header = make_binary_header(traj.num_conformations, traj.num_nodes, motion_state, num_columns, precision)
+			record = binary_record_dtype(header)
+			fout = open(out_fname, "wb")
+			write_binary_header(fout, header)
+
+		rec = np.zeros(1, dtype=record)
+		for b in range(traj.num_blobs):
+			conf, step, state, data = frame[b]
+			rec["conf"][0, b] = conf
+			rec["step"][0, b] = step
+			if data is not None and header["motion_state"][b] == "DYNAMIC":
+				rec["blob%d" % (b)][0, :data.shape[0], :] = data[:, :num_columns]
+		rec.tofile(fout)
+
+		num_frames += 1
+		sys.stdout.write("\r\tFrames converted = %d" % (num_frames))
+		sys.stdout.flush()
+
+	fin.close()
+
+	# An empty trajectory still gets a valid (frameless) binary file
+	if fout == None:
+		motion_state = ["DYNAMIC" for i in range(traj.num_blobs)]
+		header = make_binary_header(traj.num_conformations, traj.num_nodes, motion_state, 3, precision)
+		fout = open(out_fname, "wb")
+		write_binary_header(fout, header)
+
+	fout.close()
+	print("\ndone! Successfully converted " + str(num_frames) + " frame/s from '" + fname + "' to '" + out_fname + "'.")
+	return num_frames
+
+def _read_ftj_frame_columns(fin, num_nodes):
+	"""
+	Read one complete frame of an .ftj, keeping every node column.
+	In: an open .ftj positioned at the start of a frame, and the header node counts.
+	Out: a list with a (conformation, step, motion state, data) tuple per blob, where data
+	is a (num_nodes, columns) array or None for STATIC blobs. Returns None, with the file
+	rewound to the start of the frame, at eof or if the frame is only partly written.
+	"""
+	start = fin.tell()
+	frame = []
+	for b in range(len(num_nodes)):
+		sline = fin.readline().split()
+		try:
+			conf = int(sline[3].rstrip(","))
+			step = int(sline[5])
+		except(IndexError, ValueError):
+			fin.seek(start)
+			return None
+
+		state = fin.readline().strip()
+		if state == "STATIC":
+			frame.append((conf, step, state, None))
+			continue
+
+		data = FFEA_frame.read_node_block(fin, num_nodes[b][conf])
+		if data is None:
+			fin.seek(start)
+			return None
+
+		frame.append((conf, step, state, data))
+
+	# Conformation changes, up to and including the closing '*'
+	line = fin.readline()
+	while(True):
+		line = fin.readline()
+		if line == "":
+			fin.seek(start)
+			return None
+		if line.strip() == "*":
+			break
+
+	return frame
@@ -49,6 +49,7 @@ Created on Mon Aug 15 12:09:29 2016
 
 from FFEA_binding_sites import FFEA_binding_sites as binding_sites
 from FFEA_frame import FFEA_frame as frame
+from FFEA_follower import FFEA_follower as follower
 from FFEA_kinetic_map import FFEA_kinetic_map as kinetic_map
 from FFEA_kinetic_rates import FFEA_kinetic_rates as kinetic_rates
 from FFEA_kinetic_states import FFEA_kinetic_states as kinetic_states
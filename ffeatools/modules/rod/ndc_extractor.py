@@ -33,6 +33,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import FFEA_rod
+import FFEA_rod_math
 import copy
 import argparse
 
@@ -232,24 +233,6 @@ def get_delta_omega(analysis, fast=False):
     Returns delta_omega and L_i. two 2-d arrays, specifying these values for
     each frame and node.
     """
-    def get_weights(a, b):
-        a_length = analysis.py_rod_math.get_length(a)
-        b_length = analysis.py_rod_math.get_length(b)
-        weight1 = a_length/(a_length+b_length)
-        return weight1
-
-    def get_mutual_frame_inverse(pim1, pi, weights=None):
-        if not weights:
-            weights = get_weights(pim1, pi)
-        mutual_element = (1/weights)*analysis.py_rod_math.normalize(pim1) + (1/(1-weights))*analysis.py_rod_math.normalize(pi)
-        return analysis.py_rod_math.normalize(mutual_element)
-
-    def get_mutual_axes_inverse(mim1, mi, pim1=None, pi=None, weights=None):
-        if not weights:
-            weights = get_weights(pim1, pi)
-        m_mutual = (mim1*(1.0/weights) + mi*(1.0/(1-weights)))/(analysis.py_rod_math.get_length(mi)+analysis.py_rod_math.get_length(mim1))
-        return analysis.py_rod_math.normalize(m_mutual)
-    
     try:
         analysis.p_i
     except AttributeError:
@@ -264,88 +247,20 @@ def get_delta_omega(analysis, fast=False):
     #except ValueError:
     #    import warnings
     #    warnings.warn("EI is not constant. If this is for an equipartition test, it won't work.")
-        
-    delta_omega = np.zeros( [len(analysis.p_i), len(analysis.p_i[0])-1, 2] )
-    L_i = np.zeros( [len(analysis.p_i), len(analysis.p_i[0])-1] )
-
     
-    for frame in range(len(analysis.p_i)):
-        for element in range(len(delta_omega[0])):
-            
-            # NOTE TO SELF: ADD NORMALISATION!
-            
-            #B_j = np.matrix([[self.rod.B_matrix[frame][element][0], self.rod.B_matrix[0][0][1]], [self.rod.B_matrix[0][0][2], self.rod.B_matrix[0][0][3]]])
-            #B= np.matrix([[analysis.rod.B_matrix[frame][element+1][0], analysis.rod.B_matrix[0][0][1]], [analysis.rod.B_matrix[0][0][2], analysis.rod.B_matrix[0][0][3]]])
-            
-            #mutual_l = get_mutual_frame_inverse(analysis.p_i[frame][element], analysis.p_i[frame][element+1])
-            #equil_mutual_l = get_mutual_frame_inverse(analysis.equil_p_i[frame][element], analysis.equil_p_i[frame][element+1])
-            
-            pim1 = analysis.p_i[frame][element]
-            pi = analysis.p_i[frame][element+1]
-            mim1 = analysis.py_rod_math.normalize(analysis.rod.current_m[frame][element])
-#            nim1 = np.cross(mim1, pim1/np.linalg.norm(pim1))
-            mi = analysis.py_rod_math.normalize(analysis.rod.current_m[frame][element+1])
-#            ni = np.cross(mi, pi/np.linalg.norm(pi))
-        
-            equil_pim1 = analysis.equil_p_i[frame][element]
-            equil_pi = analysis.equil_p_i[frame][element+1]
-            equil_mim1 = analysis.py_rod_math.normalize(analysis.rod.equil_m[frame][element])
-#            equil_nim1 = np.cross(equil_mim1, equil_pim1/np.linalg.norm(equil_pim1))
-            equil_mi = analysis.py_rod_math.normalize(analysis.rod.equil_m[frame][element+1])
-#            equil_ni = np.cross(equil_mi, equil_pi/np.linalg.norm(equil_pi))
-            
-            if fast:
-                energy, omega, omega_equil = FFEA_rod.rod_math.get_bend_energy(pim1, pi, equil_pim1, equil_pi, mim1, equil_mim1, mi, equil_mi, np.array([1,0,0,1]), np.array([1,0,0,1]) )
-                delta_omega[frame][element] = omega - omega_equil
-                L_i[frame][element] = (analysis.py_rod_math.get_length(equil_pi)+analysis.py_rod_math.get_length(equil_pim1))/2.0
-                continue
-            
-            #get weighting between elements adjacent to bending node!
-            weight = get_weights(pim1, pi)
-            
-            #get weighted element at that node
-            mutual_l = get_mutual_frame_inverse(pim1, pi, weights=weight)
-
-            # parallel transport our two existing material axes onto our new element
-            mutual_mi = np.array(analysis.py_rod_math.parallel_transport(mi,  analysis.py_rod_math.normalize(pi), mutual_l))[0]
-            mutual_mim1 = np.array(analysis.py_rod_math.parallel_transport(mim1,  analysis.py_rod_math.normalize(pim1), mutual_l))[0]
-            
-            # get the weighted average to create the mutual material axes
-            mutual_m_rotated = get_mutual_axes_inverse(mutual_mim1, mutual_mi, weights=weight)
-            
-            omega, kb = analysis.py_rod_math.omega(pi, pim1, np.cross(mutual_l, mutual_m_rotated), mutual_m_rotated)
-            
-            #get weighting between elements adjacent to bending node!
-            equil_weight = get_weights(equil_pim1, equil_pi)
-            
-            #get weighted element at that node
-            equil_mutual_l = get_mutual_frame_inverse(equil_pim1, equil_pi, weights=equil_weight)
-
-            # parallel transport our two existing material axes onto our new element
-            equil_mutual_mi = np.array(analysis.py_rod_math.parallel_transport(equil_mi, analysis.py_rod_math.normalize(equil_pi), equil_mutual_l))[0]
-            equil_mutual_mim1 = np.array(analysis.py_rod_math.parallel_transport(equil_mim1, analysis.py_rod_math.normalize(equil_pim1), equil_mutual_l))[0]
-            
-            # get the weighted average to create the mutual material axes
-            equil_mutual_m_rotated = get_mutual_axes_inverse(equil_mutual_mim1, equil_mutual_mi, weights=equil_weight)
-            
-            equil_omega, equil_kb = analysis.py_rod_math.omega(equil_pi, equil_pim1, np.cross(equil_mutual_l, equil_mutual_m_rotated), equil_mutual_m_rotated)
-            
-            delta_omega[frame][element] = np.array(omega - equil_omega).transpose()[0]
-            #delta_omega[frame][element] = omega - equil_omega
-            
-            L_i[frame][element] = (analysis.py_rod_math.get_length(equil_pi)+analysis.py_rod_math.get_length(equil_pim1))/2.0
-            
-    # return np.average(delta_omega, 0), np.average(L_i, 0)
+    num_pairs = len(analysis.p_i[0])-1
     
-    return delta_omega, L_i
-            
-            #inner = np.dot(np.transpose(delta_omega), np.dot(B, delta_omega))
-
-            #energy = 0.5*(inner)*(1/((rod_math.get_length(equil_pi)+rod_math.get_length(equil_pim1))))
-            
-            
-            
-            #self.bending_energy[frame][element] = energy
+    if not fast:
+        return FFEA_rod_math.get_mutual_delta_omega(analysis.p_i[:,:-1], analysis.p_i[:,1:], analysis.equil_p_i[:,:-1], analysis.equil_p_i[:,1:], analysis.rod.current_m[:,:num_pairs], analysis.rod.current_m[:,1:num_pairs+1], analysis.rod.equil_m[:,:num_pairs], analysis.rod.equil_m[:,1:num_pairs+1])
+    
+    if not FFEA_rod.rod_math_core_status:
+        raise ImportError("The fast math functions in rod_math_core could not be imported. Use fast=False instead.")
+    
+    n = FFEA_rod_math.normalize
+    equil_pim1, equil_pi = analysis.equil_p_i[:,:-1], analysis.equil_p_i[:,1:]
+    energy, omega, omega_equil = FFEA_rod.rod_math_core.get_bend_batch(analysis.p_i[:,:-1], analysis.p_i[:,1:], equil_pim1, equil_pi, n(analysis.rod.current_m[:,:num_pairs]), n(analysis.rod.equil_m[:,:num_pairs]), n(analysis.rod.current_m[:,1:num_pairs+1]), n(analysis.rod.equil_m[:,1:num_pairs+1]), np.array([1.,0.,0.,1.]), np.array([1.,0.,0.,1.]) )
+    
+    return omega - omega_equil, FFEA_rod_math.get_l_i(equil_pim1, equil_pi)
             
 def get_avg_and_mean_error(rod_energy, half_kBT, per_element = False):
     """
@@ -318,6 +318,113 @@ float get_bend_energy_mutual_parallel_transport(
     return bend_energy;
 }
 
+/*
+ * Batched entry points. Each takes n, the number of elements (or pairs of
+ * elements), and flat, contiguous arrays holding n vectors (3 values), n
+ * B matrices (4 values) or n scalars, one after another. They let a whole
+ * trajectory go through one call instead of one call per element per
+ * frame. The _64 versions take double arrays, so that float64 numpy arrays
+ * don't need to be copied, but the maths is still done in float, the same
+ * as the simulation.
+ */
+
+void get_stretch_energy_batch(int n, float k[], float p_i[], float p_i_equil[], OUT float energy[]){
+    for (int j=0; j<n; j++){
+        energy[j] = get_stretch_energy(k[j], &p_i[3*j], &p_i_equil[3*j]);
+    }
+}
+
+void get_twist_energy_batch(int n, float beta[], float m_i[], float m_im1[], float m_i_equil[], float m_im1_equil[], float p_im1[], float p_i[], float p_im1_equil[], float p_i_equil[], OUT float energy[]){
+    for (int j=0; j<n; j++){
+        energy[j] = get_twist_energy(beta[j], &m_i[3*j], &m_im1[3*j], &m_i_equil[3*j], &m_im1_equil[3*j], &p_im1[3*j], &p_i[3*j], &p_im1_equil[3*j], &p_i_equil[3*j]);
+    }
+}
+
+void get_bend_energy_mutual_parallel_transport_batch(
+        int n,
+        float p_im1[],
+        float p_i[],
+        float p_im1_equil[],
+        float p_i_equil[],
+        float m_im1[],
+        float m_im1_equil[],
+        float m_i[],
+        float m_i_equil[],
+        float B_i_equil[],
+        float B_im1_equil[],
+        OUT float omega[],
+        OUT float omega_equil[],
+        OUT float energy[]){
+    for (int j=0; j<n; j++){
+        energy[j] = get_bend_energy_mutual_parallel_transport(&p_im1[3*j], &p_i[3*j], &p_im1_equil[3*j], &p_i_equil[3*j], &m_im1[3*j], &m_im1_equil[3*j], &m_i[3*j], &m_i_equil[3*j], &B_i_equil[4*j], &B_im1_equil[4*j], &omega[2*j], &omega_equil[2*j]);
+    }
+}
+
+void to_float(double in[], int len, OUT float out[]){
+    for (int j=0; j<len; j++){ out[j] = (float)in[j]; }
+}
+
+void get_stretch_energy_batch_64(int n, double k[], double p_i[], double p_i_equil[], OUT double energy[]){
+    float p[2][3];
+    for (int j=0; j<n; j++){
+        to_float(&p_i[3*j], 3, p[0]);
+        to_float(&p_i_equil[3*j], 3, p[1]);
+        energy[j] = get_stretch_energy((float)k[j], p[0], p[1]);
+    }
+}
+
+void get_twist_energy_batch_64(int n, double beta[], double m_i[], double m_im1[], double m_i_equil[], double m_im1_equil[], double p_im1[], double p_i[], double p_im1_equil[], double p_i_equil[], OUT double energy[]){
+    float v[8][3];
+    for (int j=0; j<n; j++){
+        to_float(&m_i[3*j], 3, v[0]);
+        to_float(&m_im1[3*j], 3, v[1]);
+        to_float(&m_i_equil[3*j], 3, v[2]);
+        to_float(&m_im1_equil[3*j], 3, v[3]);
+        to_float(&p_im1[3*j], 3, v[4]);
+        to_float(&p_i[3*j], 3, v[5]);
+        to_float(&p_im1_equil[3*j], 3, v[6]);
+        to_float(&p_i_equil[3*j], 3, v[7]);
+        energy[j] = get_twist_energy((float)beta[j], v[0], v[1], v[2], v[3], v[4], v[5], v[6], v[7]);
+    }
+}
+
+void get_bend_energy_mutual_parallel_transport_batch_64(
+        int n,
+        double p_im1[],
+        double p_i[],
+        double p_im1_equil[],
+        double p_i_equil[],
+        double m_im1[],
+        double m_im1_equil[],
+        double m_i[],
+        double m_i_equil[],
+        double B_i_equil[],
+        double B_im1_equil[],
+        OUT double omega[],
+        OUT double omega_equil[],
+        OUT double energy[]){
+    float v[8][3];
+    float B[2][4];
+    float o[2][2];
+    for (int j=0; j<n; j++){
+        to_float(&p_im1[3*j], 3, v[0]);
+        to_float(&p_i[3*j], 3, v[1]);
+        to_float(&p_im1_equil[3*j], 3, v[2]);
+        to_float(&p_i_equil[3*j], 3, v[3]);
+        to_float(&m_im1[3*j], 3, v[4]);
+        to_float(&m_im1_equil[3*j], 3, v[5]);
+        to_float(&m_i[3*j], 3, v[6]);
+        to_float(&m_i_equil[3*j], 3, v[7]);
+        to_float(&B_i_equil[4*j], 4, B[0]);
+        to_float(&B_im1_equil[4*j], 4, B[1]);
+        energy[j] = get_bend_energy_mutual_parallel_transport(v[0], v[1], v[2], v[3], v[4], v[5], v[6], v[7], B[0], B[1], o[0], o[1]);
+        for (int k=0; k<2; k++){
+            omega[2*j+k] = o[0][k];
+            omega_equil[2*j+k] = o[1][k];
+        }
+    }
+}
+
 int main(){
  return 0;  
 }
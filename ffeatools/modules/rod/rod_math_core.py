@@ -87,4 +87,95 @@ def get_bend_32(
         B_im1_equil):
     omega = np.empty(2, dtype="float32")
     omega_equil = np.empty(2, dtype="float32")
-    return get_bend_energy(p_im1.astype("float32"), p_i.astype("float32"), p_im1_equil.astype("float32"), p_i_equil.astype("float32"), m_im1.astype("float32"), m_im1_equil.astype("float32"), m_i.astype("float32"), m_i_equil.astype("float32"), B_i_equil.astype("float32"), B_im1_equil.astype("float32"), omega, omega_equil), omega, omega_equil
\ No newline at end of file
+    return get_bend_energy(p_im1.astype("float32"), p_i.astype("float32"), p_im1_equil.astype("float32"), p_i_equil.astype("float32"), m_im1.astype("float32"), m_im1_equil.astype("float32"), m_i.astype("float32"), m_i_equil.astype("float32"), B_i_equil.astype("float32"), B_im1_equil.astype("float32"), omega, omega_equil), omega, omega_equil
+
+# Batched versions, one call for any number of elements. The float32 ones work
+# on float32 arrays and the _64 ones on float64 arrays, so that whichever the
+# caller has, it goes to C without a copy.
+
+def batch_argtypes(dtype, num_arrays):
+    return [cint] + [ndpointer(dtype, flags="C_CONTIGUOUS")]*num_arrays
+
+for suffix, dtype in [("", np.float32), ("_64", np.float64)]:
+    getattr(rod_math_c, "get_stretch_energy_batch"+suffix).restype = None
+    getattr(rod_math_c, "get_stretch_energy_batch"+suffix).argtypes = batch_argtypes(dtype, 4)
+    getattr(rod_math_c, "get_twist_energy_batch"+suffix).restype = None
+    getattr(rod_math_c, "get_twist_energy_batch"+suffix).argtypes = batch_argtypes(dtype, 10)
+    getattr(rod_math_c, "get_bend_energy_mutual_parallel_transport_batch"+suffix).restype = None
+    getattr(rod_math_c, "get_bend_energy_mutual_parallel_transport_batch"+suffix).argtypes = batch_argtypes(dtype, 13)
+
+def get_batch_layout(vectors):
+    """
+    Get the dtype and shape (without the last dimension) that a batch of
+    vectors will be computed in. Everything is done in float32 if all the
+    vectors are float32, and in float64 otherwise.
+    """
+    vectors = [np.asarray(vec) for vec in vectors]
+    if all(vec.dtype == np.float32 for vec in vectors):
+        dtype = np.float32
+    else:
+        dtype = np.float64
+    return dtype, np.broadcast(*[vec[...,0] for vec in vectors]).shape
+
+def as_batch(a, dtype, shape):
+    """
+    Get a as a contiguous array of the given dtype and shape, broadcasting
+    it if need be. Arrays that are already like that are not copied.
+    """
+    a = np.asarray(a)
+    if a.shape != shape:
+        a = np.broadcast_to(a, shape)
+    return np.ascontiguousarray(a, dtype=dtype)
+
+def get_batch_function(name, dtype):
+    if dtype == np.float64:
+        return getattr(rod_math_c, name+"_batch_64")
+    return getattr(rod_math_c, name+"_batch")
+
+def get_stretch_batch(k, p_i, p_i_equil):
+    """
+    Same as get_stretch_32, but p_i and p_i_equil can be arrays of vectors of
+    any shape, e.g. [frame][element][x,y,z], and k can be a float or an array.
+    Returns: an array of stretch energies, the shape of p_i without the last
+    dimension.
+    """
+    dtype, shape = get_batch_layout([p_i, p_i_equil])
+    energy = np.empty(shape, dtype=dtype)
+    get_batch_function("get_stretch_energy", dtype)(energy.size, as_batch(k, dtype, shape), as_batch(p_i, dtype, shape+(3,)), as_batch(p_i_equil, dtype, shape+(3,)), energy)
+    return energy
+
+def get_twist_batch(m_im1, m_im1_equil, m_i, m_i_equil, p_im1, p_im1_equil, p_i, p_i_equil, beta):
+    """
+    Same as get_twist_32, for arrays of vectors of any shape.
+    Returns: an array of twist energies.
+    """
+    vectors = [m_i, m_im1, m_i_equil, m_im1_equil, p_im1, p_i, p_im1_equil, p_i_equil]
+    dtype, shape = get_batch_layout(vectors)
+    energy = np.empty(shape, dtype=dtype)
+    get_batch_function("get_twist_energy", dtype)(energy.size, as_batch(beta, dtype, shape), *([as_batch(vec, dtype, shape+(3,)) for vec in vectors]+[energy]))
+    return energy
+
+def get_bend_batch(
+        p_im1,
+        p_i,
+        p_im1_equil,
+        p_i_equil,
+        m_im1,
+        m_im1_equil,
+        m_i,
+        m_i_equil,
+        B_i_equil,
+        B_im1_equil):
+    """
+    Same as get_bend_32, for arrays of vectors of any shape. The B matrices
+    are flattened (4 values) and can be given once for all the elements.
+    Returns: arrays of bend energies, omega and omega_equil.
+    """
+    vectors = [p_im1, p_i, p_im1_equil, p_i_equil, m_im1, m_im1_equil, m_i, m_i_equil]
+    dtype, shape = get_batch_layout(vectors)
+    omega = np.empty(shape+(2,), dtype=dtype)
+    omega_equil = np.empty(shape+(2,), dtype=dtype)
+    energy = np.empty(shape, dtype=dtype)
+    arrays = [as_batch(vec, dtype, shape+(3,)) for vec in vectors] + [as_batch(B_i_equil, dtype, shape+(4,)), as_batch(B_im1_equil, dtype, shape+(4,))]
+    get_batch_function("get_bend_energy_mutual_parallel_transport", dtype)(energy.size, *(arrays+[omega, omega_equil, energy]))
+    return energy, omega, omega_equil
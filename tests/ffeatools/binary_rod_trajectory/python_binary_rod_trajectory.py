@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+"""
+Convert a rod trajectory to the binary format and back, and check that
+nothing changes on the way, whichever frames and rows are loaded.
+"""
+
+import sys
+import numpy as np
+
+try:
+    import FFEA_rod
+except ImportError:
+    print("Failure to import FFEA_rod")
+    sys.exit(1) # failure to import
+
+try:
+    text = FFEA_rod.FFEA_rod("bend.rodtraj")
+    FFEA_rod.convert_rodtraj_to_binary("bend.rodtraj", "bend.rodtrajb")
+    binary = FFEA_rod.FFEA_rod("bend.rodtrajb")
+    FFEA_rod.convert_binary_to_rodtraj("bend.rodtrajb", "bend_back.rodtraj")
+    back = FFEA_rod.FFEA_rod("bend_back.rodtraj")
+    some = FFEA_rod.FFEA_rod("bend.rodtrajb", start = 1, stride = 2, rows = ["current_r"])
+except Exception as e:
+    print(e)
+    sys.exit(1)
+
+for row in FFEA_rod.rod_row_names:
+    if not np.array_equal(getattr(text, row), getattr(binary, row)) or not np.array_equal(getattr(text, row), getattr(back, row)):
+        print("Row %s changed in conversion" % (row))
+        sys.exit(1)
+
+if some.current_m is not None or not np.array_equal(some.current_r, text.current_r[1::2]):
+    print("Loading some of the frames and rows of a binary rod trajectory failed")
+    sys.exit(1)
+
+# Only the loaded rows can be written, and only in the binary format
+try:
+    some.write_rod("some.rodtraj")
+    print("Rod trajectory with rows missing was written as text")
+    sys.exit(1)
+except ValueError:
+    pass
+
+try:
+    some.write_rod_binary("some.rodtrajb")
+    some_back = FFEA_rod.FFEA_rod("some.rodtrajb")
+except Exception as e:
+    print(e)
+    sys.exit(1)
+
+if some_back.current_m is not None or not np.array_equal(some_back.current_r, some.current_r):
+    print("Rod trajectory with rows missing changed when written to the binary format")
+    sys.exit(1)
+
+sys.exit(0)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+"""
+Round trip a text trajectory through the binary (.ftjb) format.
+"""
+
+import sys
+import numpy as np
+
+try:
+    import FFEA_trajectory
+except ImportError:
+    print("Failure to import FFEA_trajectory")
+    sys.exit(1) # failure to import
+
+try:
+    text = FFEA_trajectory.FFEA_trajectory("unit_test_traj.ftj")
+    FFEA_trajectory.convert_ftj_to_binary("unit_test_traj.ftj", "unit_test_traj.ftjb")
+    binary = FFEA_trajectory.FFEA_trajectory("unit_test_traj.ftjb")
+except Exception as e:
+    print(e)
+    sys.exit(1)
+
+if binary.num_frames != text.num_frames or FFEA_trajectory.get_num_frames("unit_test_traj.ftjb") != text.num_frames:
+    print("Binary trajectory has %d frames, text trajectory has %d" % (binary.num_frames, text.num_frames))
+    sys.exit(1)
+
+for i in range(text.num_frames):
+    a = text.blob[0][0].frame[i]
+    b = binary.blob[0][0].frame[i]
+    if a.step != b.step or not np.array_equal(a.pos, b.pos) or not np.array_equal(a.vel, b.vel):
+        print("Frame %d differs between the text and binary trajectories" % (i))
+        sys.exit(1)
+
+# A blob that switches between two conformations. Translating and rescaling must move each frame once, as in the text trajectory
+confs = [0, 1, 1, 0]
+fout = open("two_conformations.ftj", "w")
+fout.write("FFEA_trajectory_file\n\nInitialisation:\nNumber of Blobs 1\nNumber of Conformations 2\nBlob 0: Conformation 0 Nodes 3 Conformation 1 Nodes 3\n\n*\n")
+for f in range(len(confs)):
+    fout.write("Blob 0, Conformation %d, step %d\nDYNAMIC\n" % (confs[f], 10 * f))
+    for n in range(3):
+        fout.write(" ".join(["%e" % (x) for x in [f + 0.5, n, 1.0 + confs[f]] + [0.0] * 7]) + "\n")
+    fout.write("*\nConformation Changes:\nBlob 0: Conformation %d -> Conformation %d\n*\n" % (confs[f], confs[min(f + 1, len(confs) - 1)]))
+fout.close()
+
+try:
+    text = FFEA_trajectory.FFEA_trajectory("two_conformations.ftj", packed = True)
+    FFEA_trajectory.convert_ftj_to_binary("two_conformations.ftj", "two_conformations.ftjb")
+    binary = FFEA_trajectory.FFEA_trajectory("two_conformations.ftjb")
+except Exception as e:
+    print(e)
+    sys.exit(1)
+
+for traj in [text, binary]:
+    traj.translate([1.0, 0.0, 0.0])
+    traj.rescale(2.0)
+
+for c in range(2):
+    a = text.blob[0][c]
+    b = binary.blob[0][c]
+    if not np.array_equal(a.get_active_frames(), b.get_active_frames()) or not np.allclose(a.get_pos(), b.get_pos()) or \
+       not np.allclose(a.calc_centroid_trajectory()[1], b.calc_centroid_trajectory()[1]):
+        print("Conformation %d differs between the text and binary trajectories once translated and rescaled" % (c))
+        sys.exit(1)
+
+    for i in a.get_active_frames():
+        if not np.allclose(b.frame[i].pos[:,0], 2.0 * (i + 1.5)):
+            print("Frame %d of conformation %d was not translated and rescaled exactly once" % (i, c))
+            sys.exit(1)
+
+sys.exit(0)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+"""
+Write a trajectory out a few bytes at a time, as a running simulation would,
+and check that following it picks up exactly the frames of the whole file.
+"""
+
+import sys
+import numpy as np
+
+try:
+    import FFEA_trajectory, FFEA_follower
+except ImportError:
+    print("Failure to import FFEA_follower")
+    sys.exit(1) # failure to import
+
+num_frames = 10
+chunk_size = 97
+
+try:
+    header = FFEA_trajectory.FFEA_trajectory("unit_test_traj.ftj", load_all = 0)
+    frame = header.get_frame(0)
+    header.write_frames_to_file("unit_test_traj_long.ftj", [frame for i in range(num_frames)])
+    whole = FFEA_trajectory.FFEA_trajectory("unit_test_traj_long.ftj", onlyNodes = True)
+
+    with open("unit_test_traj_long.ftj", "rb") as fin:
+        text = fin.read()
+    open("unit_test_traj_live.ftj", "wb").close()
+
+    follower = FFEA_follower.FFEA_follower("unit_test_traj_live.ftj")
+    new_frames = []
+    follower.add_callback(lambda f, start, stop: new_frames.extend(range(start, stop)))
+
+    for i in range(0, len(text), chunk_size):
+        with open("unit_test_traj_live.ftj", "ab") as fout:
+            fout.write(text[i:i + chunk_size])
+        follower.update()
+except Exception as e:
+    print(e)
+    sys.exit(1)
+
+if follower.traj.num_frames != num_frames or new_frames != list(range(num_frames)):
+    print("Expected %d frames, followed %d (callbacks saw %s)" % (num_frames, follower.traj.num_frames, str(new_frames)))
+    sys.exit(1)
+
+for b in range(whole.num_blobs):
+    if not np.array_equal(whole.blob[b][0].get_pos(), follower.traj.blob[b][0].get_pos()):
+        print("Blob %d differs between the followed and the whole trajectory" % (b))
+        sys.exit(1)
+
+sys.exit(0)
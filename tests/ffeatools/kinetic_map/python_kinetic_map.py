@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+"""
+Build kinetic maps between two conformations of a mesh, and round trip one
+through the dense, sparse and binary sparse map formats.
+"""
+
+import sys
+import numpy as np
+
+try:
+    import FFEA_node, FFEA_frame, FFEA_topology, FFEA_kinetic_map
+except ImportError:
+    print("Failure to import FFEA_kinetic_map")
+    sys.exit(1) # failure to import
+
+node = FFEA_node.FFEA_node("veryFine.node")
+top = FFEA_topology.FFEA_topology("veryFine.top")
+tets = FFEA_kinetic_map.get_tetrahedra(top)
+
+# Target nodes at random points inside random elements, so the map must reproduce them exactly
+rng = np.random.RandomState(0)
+weights = rng.dirichlet(np.ones(4), 200)
+target = np.einsum("ij,ijk->ik", weights, node.pos[tets[rng.randint(len(tets), size = 200)]])
+
+kmap = FFEA_kinetic_map.build_kinetic_map(node, top, target, limit = 0.0)
+if not np.allclose(kmap.apply(node.pos), target, atol = 1e-10) or not np.allclose(kmap.matrix.sum(axis = 1), 1.0):
+    print("Map does not reproduce the target nodes")
+    sys.exit(1)
+
+if np.any(kmap.entry < -1e-10):
+    print("Map has negative weights for nodes inside the structure")
+    sys.exit(1)
+
+# Nodes and frames go through apply_sparse as well as plain arrays
+frame = FFEA_frame.FFEA_frame()
+frame.pos = node.pos.copy()
+for base in [node, frame]:
+    try:
+        mapped = kmap.apply_sparse(base)
+    except Exception as e:
+        print(e)
+        sys.exit(1)
+    if mapped is None or not np.allclose(mapped, target, atol = 1e-10):
+        print("Map does not apply to a %s" % type(base).__name__)
+        sys.exit(1)
+
+# STATIC blobs give None frames, which map to None
+frame.set_step(7)
+mapped = kmap.apply_to_frames([frame, None, frame])
+if mapped[1] != None or [f.step for f in (mapped[0], mapped[2])] != [7, 7] or not np.allclose(mapped[2].pos, target, atol = 1e-10):
+    print("Map does not pass None frames through")
+    sys.exit(1)
+
+if kmap.apply_to_frames([None, None]) != [None, None] or kmap.apply_to_frames([]) != []:
+    print("Map does not pass None frames through")
+    sys.exit(1)
+
+# Both directions, in parallel and not, between the mesh and a sheared copy of it
+sheared = node.pos + np.outer(node.pos[:,2], [0.3, 0.0, 0.0])
+serial = FFEA_kinetic_map.build_kinetic_maps(node, top, sheared, top, num_procs = 1)
+parallel = FFEA_kinetic_map.build_kinetic_maps(node, top, sheared, top, num_procs = 2)
+for a, b in zip(serial, parallel):
+    if abs(a.matrix - b.matrix).max() != 0:
+        print("Parallel and serial maps differ")
+        sys.exit(1)
+
+if not np.allclose(serial[0].apply(node.pos), sheared, atol = 1e-3) or not np.allclose(serial[1].apply(sheared), node.pos, atol = 1e-3):
+    print("Maps between the conformations do not reproduce them")
+    sys.exit(1)
+
+# Dense -> sparse -> binary sparse
+dense = kmap.matrix.toarray()
+fout = open("dense.map", "w")
+fout.write("FFEA Kinetic Conformation Mapping File (Dense)\nnum_nodes_from %d\nnum_nodes_to %d\nnum_entries %d\nmap:\n" % (kmap.num_columns, kmap.num_rows, kmap.num_entries))
+for row in dense:
+    fout.write(" ".join(["0" if x == 0 else repr(x) for x in row.tolist()]) + "\n")
+fout.close()
+
+try:
+    FFEA_kinetic_map.convert_dense_to_sparse("dense.map", "sparse.map", chunk_size = 7)
+    FFEA_kinetic_map.FFEA_kinetic_map("sparse.map").write_to_file("sparse.mapb")
+    sparse = FFEA_kinetic_map.FFEA_kinetic_map("sparse.mapb")
+except Exception as e:
+    print(e)
+    sys.exit(1)
+
+if not np.array_equal(sparse.matrix.toarray(), dense):
+    print("Map changed when converted to sparse and binary")
+    sys.exit(1)
+
+sys.exit(0)
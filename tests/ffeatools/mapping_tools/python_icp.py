@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+"""
+Check that the k-d tree search in icp finds the same neighbours as a brute
+force search, and that running ICP from several poses at once with
+icp_multi gives the same results as separate icp runs.
+"""
+
+import sys
+import numpy as np
+
+try:
+    import icp
+except ImportError:
+    print("Failure to import icp")
+    sys.exit(1) # failure to import
+
+def fail(message):
+    print(message)
+    sys.exit(1)
+
+def rotation(angle, axis):
+    axis = axis / np.linalg.norm(axis)
+    K = np.cross(np.identity(3), axis)
+    return np.identity(3) + np.sin(angle) * K + (1 - np.cos(angle)) * np.dot(K, K)
+
+# An elongated cloud, and a rotated, shifted and noisy copy of part of it
+rng = np.random.RandomState(0)
+B = rng.normal(size = [400, 3]) * [3.0, 1.5, 0.5]
+A = np.dot(B[:250] - [0.2, -0.1, 0.3], rotation(0.3, [1.0, 2.0, 0.5]).T) + rng.normal(scale = 0.01, size = [250, 3])
+
+# Nearest neighbours, from the tree (built here and by nearest_neighbor) and by brute force
+brute = np.linalg.norm(A[:,np.newaxis] - B[np.newaxis], axis = 2)
+tree = icp.build_tree(B)
+for distances, indices in [icp.nearest_neighbor(A, B), icp.nearest_neighbor(A, tree), icp.nearest_neighbor(A, tree, num_threads = 2)]:
+    if not np.array_equal(indices, np.argmin(brute, axis = 1)) or not np.allclose(distances, np.min(brute, axis = 1), rtol = 0, atol = 1e-12):
+        fail("k-d tree neighbours differ from brute force")
+
+# The batched best fit is the single one, for each set of points
+R, t = icp.best_fit_transform_batch(np.array([A, A[::-1]]), np.array([B[:250], B[:250][::-1]]))
+T = icp.best_fit_transform(A, B[:250])[0]
+for i in range(2):
+    if not np.allclose(R[i], T[0:3,0:3], atol = 1e-12) or not np.allclose(t[i], T[0:3,3], atol = 1e-12):
+        fail("Batched best fit transform differs")
+
+# icp_multi from several poses, against separate runs. Poses far off converge at different iterations,
+# so runs drop out of the batch at different times. Check against a target error too
+poses = [np.identity(4)]
+for angle, axis in [(0.5, [0.0, 0.0, 1.0]), (2.0, [1.0, 0.0, 0.0]), (3.0, [1.0, 1.0, 1.0]), (1.0, [0.0, 1.0, 1.0])]:
+    T = np.identity(4)
+    T[0:3,0:3] = rotation(angle, axis)
+    T[0:3,3] = rng.normal(size = 3)
+    poses.append(T)
+
+for kwargs in [dict(max_iterations = 50, tolerance = 1e-6), dict(max_iterations = 50, tolerance = 1e-6, target_error = 0.05), dict(max_iterations = 3, tolerance = 1e-6)]:
+    multi_T, multi_distances = icp.icp_multi(A, B, poses, tree = tree, **kwargs)
+    for i, pose in enumerate(poses):
+        single_T, single_distances = icp.icp(A, B, init_pose = pose, **kwargs)
+        if not np.allclose(multi_T[i], single_T, rtol = 0, atol = 1e-9) or not np.allclose(multi_distances[i], single_distances, rtol = 0, atol = 1e-9):
+            fail("icp_multi differs from icp for pose %d with %s" % (i, kwargs))
+
+# Starting near the answer finds it
+T, distances = icp.icp(A, B, max_iterations = 50, tolerance = 1e-8)
+if np.mean(distances) > 0.05:
+    fail("ICP did not find the transformation back (mean error %f)" % (np.mean(distances)))
+
+sys.exit(0)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+"""
+Run the node_pdb_align candidates with a fixed seed, and check that they
+give the same results in one process and in several, that the best top_k
+come back in order, and that a target RMSD stops the run early.
+"""
+
+import sys
+import numpy as np
+
+try:
+    import node_pdb_align
+except ImportError:
+    print("Failure to import node_pdb_align")
+    sys.exit(1) # failure to import
+
+def fail(message):
+    print(message)
+    sys.exit(1)
+
+# An elongated cloud of atoms, and nodes on a rotated part of it, centred on the atoms
+rng = np.random.RandomState(0)
+pdb_array = rng.normal(size = [300, 3]) * [3.0, 1.5, 0.5]
+R = node_pdb_align.euler_to_4x4([0.4, 1.1, -0.3])[0:3,0:3]
+node_array = np.dot(pdb_array[:150], R.T)
+node_array += pdb_array.mean(axis = 0) - node_array.mean(axis = 0)
+
+num_candidates = 12
+args = (node_array, pdb_array, 30, 1e-6, num_candidates)
+
+def run(**kwargs):
+    return node_pdb_align.find_candidates(*args, **kwargs)
+
+def same(a, b):
+    return len(a) == len(b) and all(np.isclose(x[0], y[0], rtol = 0, atol = 1e-12) and np.allclose(x[1][0], y[1][0], rtol = 0, atol = 1e-12) and np.allclose(x[1][1], y[1][1], rtol = 0, atol = 0) for x, y in zip(a, b))
+
+# The same seed gives the same candidates, whatever the number of processes and batches
+serial = run(seed = 3, top_k = num_candidates)
+if not same(serial, run(seed = 3, top_k = num_candidates)) or not same(serial, run(seed = 3, top_k = num_candidates, num_procs = 2)) or not same(serial, run(seed = 3, top_k = num_candidates, num_procs = 3, batch_size = 1)):
+    fail("Seeded candidates differ between runs")
+
+if same(serial, run(seed = 4, top_k = num_candidates)):
+    fail("Different seeds gave the same candidates")
+
+# All of them come back, best first, starting from the seeded rotations
+if len(serial) != num_candidates or [r[0] for r in serial] != sorted([r[0] for r in serial]):
+    fail("Candidates are not sorted by RMSD")
+
+rotations = node_pdb_align.get_candidate_rotations(num_candidates, 3)
+if sorted(map(tuple, [r[1][1] for r in serial])) != sorted(map(tuple, rotations.tolist())):
+    fail("Candidates did not start from the seeded rotations")
+
+# top_k is the first k of them, and the default is the best one
+for k in [1, 5]:
+    if not same(run(seed = 3, top_k = k), serial[:k]):
+        fail("top_k = %d is not the best %d candidates" % (k, k))
+
+if not same(run(seed = 3), serial[:1]) or not same([node_pdb_align.fit_from_candidates(*args, seed = 3)], serial[:1]):
+    fail("The best candidate is not returned by default")
+
+# A target RMSD every candidate reaches stops after the first batch, in one process or several
+for kwargs in [dict(), dict(num_procs = 2)]:
+    early = run(seed = 3, top_k = num_candidates, target_rmsd = serial[-1][0] + 1.0, batch_size = 4, **kwargs)
+    if len(early) == num_candidates or len(early) < 4 or early[0][0] > serial[-1][0] + 1.0:
+        fail("Target RMSD did not stop the candidates early (%d of %d run)" % (len(early), num_candidates))
+
+# One that no candidate reaches runs them all
+if not same(run(seed = 3, top_k = num_candidates, target_rmsd = -1.0), serial):
+    fail("Unreachable target RMSD changed the candidates")
+
+sys.exit(0)
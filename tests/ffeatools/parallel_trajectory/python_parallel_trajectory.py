@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+"""
+Check that the parallel trajectory loader gives exactly what the serial
+one does, and time the two against each other.
+"""
+
+import sys, time
+import numpy as np
+
+try:
+    import FFEA_trajectory
+except ImportError:
+    print("Failure to import FFEA_trajectory")
+    sys.exit(1) # failure to import
+
+num_frames = 50
+num_procs = 4
+
+try:
+    # Build a longer trajectory out of the single frame we ship with
+    header = FFEA_trajectory.FFEA_trajectory("unit_test_traj.ftj", load_all = 0)
+    frame = header.get_frame(0)
+    header.write_frames_to_file("unit_test_traj_long.ftj", [frame for i in range(num_frames)])
+
+    start = time.time()
+    serial = FFEA_trajectory.FFEA_trajectory("unit_test_traj_long.ftj")
+    serial_time = time.time() - start
+
+    start = time.time()
+    parallel = FFEA_trajectory.FFEA_trajectory("unit_test_traj_long.ftj", num_procs = num_procs)
+    parallel_time = time.time() - start
+except Exception as e:
+    print(e)
+    sys.exit(1)
+
+print("\nSerial load: %fs, parallel load (%d processes): %fs" % (serial_time, num_procs, parallel_time))
+
+if serial.num_frames != num_frames or parallel.num_frames != num_frames:
+    print("Expected %d frames, serial loader read %d, parallel loader read %d" % (num_frames, serial.num_frames, parallel.num_frames))
+    sys.exit(1)
+
+for i in range(num_frames):
+    a = serial.blob[0][0].frame[i]
+    b = parallel.blob[0][0].frame[i]
+    if a.step != b.step or not np.array_equal(a.pos, b.pos) or not np.array_equal(a.vel, b.vel):
+        print("Frame %d differs between the serial and parallel loaders" % (i))
+        sys.exit(1)
+
+# A blob that is static in its first frames only, and one that is static in its last frames only
+states = [["STATIC", "DYNAMIC"], ["STATIC", "DYNAMIC"], ["DYNAMIC", "STATIC"], ["DYNAMIC", "STATIC"]]
+fout = open("static_frames.ftj", "w")
+fout.write("FFEA_trajectory_file\n\nInitialisation:\nNumber of Blobs 2\nNumber of Conformations 1 1\nBlob 0: Conformation 0 Nodes 3\nBlob 1: Conformation 0 Nodes 3\n\n*\n")
+for f in range(len(states)):
+    for i in range(2):
+        fout.write("Blob %d, Conformation 0, step %d\n%s\n" % (i, 10 * f, states[f][i]))
+        if states[f][i] == "DYNAMIC":
+            for n in range(3):
+                fout.write(" ".join(["%e" % (x) for x in [f, n, i] + [0.0] * 7]) + "\n")
+    fout.write("*\nConformation Changes:\nBlob 0: Conformation 0 -> Conformation 0\nBlob 1: Conformation 0 -> Conformation 0\n*\n")
+fout.close()
+
+try:
+    serial = FFEA_trajectory.FFEA_trajectory("static_frames.ftj")
+    parallel = FFEA_trajectory.FFEA_trajectory("static_frames.ftj", num_procs = 2)
+except Exception as e:
+    print(e)
+    sys.exit(1)
+
+for i in range(2):
+    a = serial.blob[i][0]
+    b = parallel.blob[i][0]
+    if b.motion_state != "DYNAMIC" or not np.array_equal(a.get_active_frames(), b.get_active_frames()) or not np.array_equal(a.get_pos(), b.get_pos()):
+        print("Blob %d, static in some frames only, differs between the serial and parallel loaders" % (i))
+        sys.exit(1)
+
+# Node blocks of positions only have no velocities
+fout = open("positions_only.ftj", "w")
+fout.write("FFEA_trajectory_file\n\nInitialisation:\nNumber of Blobs 1\nNumber of Conformations 1\nBlob 0: Conformation 0 Nodes 3\n\n*\n")
+for f in range(4):
+    fout.write("Blob 0, Conformation 0, step %d\nDYNAMIC\n" % (10 * f))
+    for n in range(3):
+        fout.write("%e %e %e\n" % (f, n, 0.0))
+    fout.write("*\nConformation Changes:\nBlob 0: Conformation 0 -> Conformation 0\n*\n")
+fout.close()
+
+try:
+    serial = FFEA_trajectory.FFEA_trajectory("positions_only.ftj")
+    parallel = FFEA_trajectory.FFEA_trajectory("positions_only.ftj", num_procs = 2)
+    serial.write_binary("positions_only.ftjb")
+    binary = FFEA_trajectory.FFEA_trajectory("positions_only.ftjb")
+    lazy = FFEA_trajectory.FFEA_trajectory("positions_only.ftjb", load_all = 0)
+except Exception as e:
+    print(e)
+    sys.exit(1)
+
+if lazy.get_frame(0)[0].vel is not None:
+    print("Positions only binary frame read with velocities")
+    sys.exit(1)
+
+for traj in [serial, parallel, binary]:
+    if traj.num_frames != 4 or any([f.vel is not None for f in traj.blob[0][0].frame]) or traj.get_frame(0)[0].vel is not None:
+        print("Positions only trajectory read with velocities")
+        sys.exit(1)
+
+sys.exit(0)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+"""
+Check the batched rod math functions against the ones that work on a single
+pair of elements at a time, for every pair of elements in a rod trajectory.
+"""
+
+import sys
+import numpy as np
+
+try:
+    import FFEA_rod
+    import FFEA_rod_math
+except ImportError:
+    print("Failure to import FFEA_rod_math")
+    sys.exit(1) # failure to import
+
+rod = FFEA_rod.FFEA_rod("bend.rodtraj")
+rod_math = FFEA_rod.py_rod_math()
+
+# Give the material axes something to do
+np.random.seed(0)
+rod.current_m += np.random.normal(scale = 0.2, size = rod.current_m.shape)
+
+p_i = FFEA_rod_math.get_p_i(rod.current_r)
+equil_p_i = FFEA_rod_math.get_p_i(rod.equil_r)
+pim1, pi = p_i[:,:-1], p_i[:,1:]
+mim1, mi = rod.current_m[:,:len(pi[0])], rod.current_m[:,1:len(pi[0])+1]
+
+kb_i = FFEA_rod_math.get_kb_i(pim1, pi)
+stretch = FFEA_rod_math.get_stretch_energy(2.0, p_i, equil_p_i)
+transported = FFEA_rod_math.parallel_transport(FFEA_rod_math.normalize(mim1), FFEA_rod_math.normalize(pim1), FFEA_rod_math.normalize(pi))
+delta_theta = FFEA_rod_math.get_delta_theta(mim1, mi, pim1, pi)
+
+for frame in range(len(pi)):
+    for element in range(len(pi[frame])):
+        p_im1_n, p_i_n = rod_math.normalize(pim1[frame][element]), rod_math.normalize(pi[frame][element])
+        m_im1_t = np.asarray(rod_math.parallel_transport(rod_math.normalize(mim1[frame][element]), p_im1_n, p_i_n)).flatten()
+        expected = [
+            ("p_i", p_i[frame][element], rod.current_r[frame][element+1] - rod.current_r[frame][element]),
+            ("kb_i", kb_i[frame][element], rod_math.kb_i(pi[frame][element], pim1[frame][element])),
+            ("stretch energy", stretch[frame][element], rod_math.get_stretch_energy(2.0, p_i[frame][element], equil_p_i[frame][element])),
+            ("parallel transport", transported[frame][element], m_im1_t),
+            ("twist angle", delta_theta[frame][element], rod_math.get_signed_angle(m_im1_t, rod_math.normalize(mi[frame][element]), p_i_n)),
+        ]
+        for name, batched, single in expected:
+            if not np.allclose(batched, single, rtol = 1e-10, atol = 1e-12):
+                print("Batched %s doesn't match for frame %d, element %d" % (name, frame, element))
+                sys.exit(1)
+
+# The energies, and the omega and mutual frames they are built from, against the single pair functions and the
+# mutual material axis loop that anal_rod used to run. B has off diagonal terms, so a flipped omega changes the energy
+rod.equil_m += np.random.normal(scale = 0.1, size = rod.equil_m.shape)
+rod.B_matrix[...] = [2.0, 0.3, 0.3, 1.0]
+rod.B_matrix[...,0] += np.random.uniform(size = rod.B_matrix.shape[:2])
+rod.material_params[...,1] = np.random.uniform(1.0, 2.0, size = rod.material_params.shape[:2])
+
+equil_pim1, equil_pi = equil_p_i[:,:-1], equil_p_i[:,1:]
+equil_mim1, equil_mi = rod.equil_m[:,:len(pi[0])], rod.equil_m[:,1:len(pi[0])+1]
+beta = rod.material_params[:,:len(pi[0]),1]
+B = rod.B_matrix[:,1:len(pi[0])+1]
+rotate = 0.3
+
+omega_im1, omega_i = FFEA_rod_math.get_element_omega(pim1, pi, mim1, mi)
+twist = FFEA_rod_math.get_twist_energy(mim1, equil_mim1, mi, equil_mi, pim1, equil_pim1, pi, equil_pi, beta)
+mutual_l, mutual_m = FFEA_rod_math.get_mutual_frame(pim1, pi, mim1, mi, rotate)
+mutual_omega = FFEA_rod_math.get_mutual_omega(pim1, pi, mim1, mi, rotate)
+delta_omega, L_i = FFEA_rod_math.get_mutual_delta_omega(pim1, pi, equil_pim1, equil_pi, mim1, mi, equil_mim1, equil_mi)
+bend = FFEA_rod_math.get_bend_energy_mutual(pim1, pi, equil_pim1, equil_pi, mim1, mi, equil_mim1, equil_mi, B)
+
+analysis = FFEA_rod.anal_rod(rod)
+analysis.get_bending_response_mutual()
+analysis.get_twist_amount(set_twist_amount = True)
+
+def element_omega(p_im1, p_i, m, p):
+    m = rod_math.normalize(m)
+    return np.asarray(rod_math.omega(p_i, p_im1, np.cross(m, rod_math.normalize(p)), m)[0]).flatten()
+
+def mutual_frame_loop(p_im1, p_i, m_im1, m_i, rotate = None):
+    # The mutual frame, and omega in it (with n = m x l), as anal_rod.get_bending_response_mutual used to work them out
+    m_im1, m_i = rod_math.normalize(m_im1), rod_math.normalize(m_i)
+    weight = rod_math.get_length(p_im1)/(rod_math.get_length(p_im1) + rod_math.get_length(p_i))
+    l = rod_math.normalize((1/weight)*rod_math.normalize(p_im1) + (1/(1-weight))*rod_math.normalize(p_i))
+    mutual_m_i = np.array(rod_math.parallel_transport(m_i, rod_math.normalize(p_i), l))[0]
+    mutual_m_im1 = np.array(rod_math.parallel_transport(m_im1, rod_math.normalize(p_im1), l))[0]
+    m = rod_math.normalize((mutual_m_im1*(1.0/weight) + mutual_m_i*(1.0/(1-weight)))/(rod_math.get_length(mutual_m_i)+rod_math.get_length(mutual_m_im1)))
+    if rotate:
+        m = rod_math.rodrigues(m, l, rotate)
+    return l, m, np.asarray(rod_math.omega(p_i, p_im1, np.cross(m, l), m)[0]).flatten()
+
+def bend_energy_loop(delta, B, equil_p_im1, equil_p_i):
+    return 0.5*np.dot(delta, np.dot(np.reshape(B, [2, 2]), delta))/((rod_math.get_length(equil_p_i)+rod_math.get_length(equil_p_im1))/2.0)
+
+flip = np.array([-1.0, 1.0])
+for frame in range(len(pi)):
+    for element in range(len(pi[frame])):
+        args = [pim1[frame][element], pi[frame][element], mim1[frame][element], mi[frame][element]]
+        equil_args = [equil_pim1[frame][element], equil_pi[frame][element], equil_mim1[frame][element], equil_mi[frame][element]]
+        loop_l, loop_m, loop_omega = mutual_frame_loop(*(args + [rotate]))
+        loop_delta = mutual_frame_loop(*args)[2] - mutual_frame_loop(*equil_args)[2]
+        loop_twist = rod_math.get_twist_energy(mim1[frame][element], equil_mim1[frame][element], mi[frame][element], equil_mi[frame][element], pim1[frame][element], equil_pim1[frame][element], pi[frame][element], equil_pi[frame][element], beta[frame][element])
+
+        # FFEA_rod_math uses n = l x m for the mutual frame, as rod_math_core does, which flips the first half of omega
+        expected = [
+            ("omega_im1", omega_im1[frame][element], element_omega(pim1[frame][element], pi[frame][element], mim1[frame][element], pim1[frame][element])),
+            ("omega_i", omega_i[frame][element], element_omega(pim1[frame][element], pi[frame][element], mi[frame][element], pi[frame][element])),
+            ("get_omega", FFEA_rod_math.get_omega(kb_i[frame][element], np.cross(loop_m, loop_l), loop_m), loop_omega),
+            ("twist energy", twist[frame][element], loop_twist),
+            ("mutual l", mutual_l[frame][element], loop_l),
+            ("mutual m", mutual_m[frame][element], loop_m),
+            ("mutual omega", mutual_omega[frame][element]*flip, loop_omega),
+            ("mutual delta omega", delta_omega[frame][element]*flip, loop_delta),
+            ("L_i", L_i[frame][element], (rod_math.get_length(equil_pim1[frame][element]) + rod_math.get_length(equil_pi[frame][element]))/2.0),
+            ("mutual bend energy", bend[frame][element], bend_energy_loop(loop_delta*flip, B[frame][element], equil_pim1[frame][element], equil_pi[frame][element])),
+            ("anal_rod mutual bend energy", analysis.bending_energy[frame][element], bend_energy_loop(loop_delta, B[frame][element], equil_pim1[frame][element], equil_pi[frame][element])),
+            ("anal_rod twist energy", analysis.twist_energy[frame][element], loop_twist),
+            ("anal_rod twist amount", analysis.twist_amount[frame][element], delta_theta[frame][element]),
+        ]
+        for name, batched, single in expected:
+            if not np.allclose(batched, single, rtol = 1e-10, atol = 1e-12):
+                print("Batched %s doesn't match for frame %d, element %d" % (name, frame, element))
+                sys.exit(1)
+
+# A rotated and translated copy of every frame should be fitted back exactly
+theta = np.linspace(0, np.pi, len(rod.current_r))
+R = np.zeros([len(theta), 3, 3])
+R[:,0,0], R[:,0,1], R[:,1,0], R[:,1,1], R[:,2,2] = np.cos(theta), -np.sin(theta), np.sin(theta), np.cos(theta), 1
+moved = FFEA_rod_math.apply_transformation(rod.current_r, R, [1.0, 2.0, 3.0])
+fit_R, fit_t = FFEA_rod_math.get_best_fit_transformation(moved, rod.current_r, weights = np.arange(1, len(rod.current_r[0])+1))
+if not np.allclose(FFEA_rod_math.apply_transformation(moved, fit_R, fit_t), rod.current_r) or not np.allclose(np.linalg.det(fit_R), 1):
+    print("Best fit superposition failed")
+    sys.exit(1)
+
+sys.exit(0)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+"""
+Build librodmath and check the batched C rod energies, for float32 and
+float64 input, against the *_32 wrappers called one element at a time.
+"""
+
+import os
+import sys
+import numpy as np
+
+try:
+    import rod_math_core # compiles librodmath.so on import
+except Exception as e:
+    print("Failure to build or load librodmath: " + str(e))
+    sys.exit(1)
+
+if not os.path.exists(os.path.join(rod_math_core.dir_path, "librodmath.so")):
+    print("librodmath.so is missing")
+    sys.exit(1)
+
+# A few frames of a rod with material axes perpendicular to the elements
+np.random.seed(0)
+num_frames, num_elements = 3, 10
+
+def get_rod(scale):
+    p = np.array([1.0, 0.0, 0.0]) + np.random.normal(scale = scale, size = (num_frames, num_elements, 3))
+    m = np.cross(p, np.random.normal(size = p.shape))
+    return p, m/np.linalg.norm(m, axis = -1)[...,np.newaxis]
+
+p, m = get_rod(0.2)
+p_equil, m_equil = get_rod(0.05)
+p_im1, p_i, m_im1, m_i = p[:,:-1], p[:,1:], m[:,:-1], m[:,1:]
+p_im1_equil, p_i_equil, m_im1_equil, m_i_equil = p_equil[:,:-1], p_equil[:,1:], m_equil[:,:-1], m_equil[:,1:]
+k = np.random.uniform(1.0, 2.0, size = p_i.shape[:2])
+beta = 1.5
+B_i_equil, B_im1_equil = np.array([2.0, 0.3, 0.3, 1.0]), np.array([1.5, 0.2, 0.2, 1.0])
+
+def check(name, dtype, batched, single, frame, element):
+    if not np.allclose(batched, single, rtol = 1e-6, atol = 1e-9):
+        print("Batched %s (%s) doesn't match for frame %d, element %d" % (name, dtype.__name__, frame, element))
+        sys.exit(1)
+
+for dtype in [np.float32, np.float64]:
+    vecs = [a.astype(dtype) for a in [p_im1, p_i, p_im1_equil, p_i_equil, m_im1, m_im1_equil, m_i, m_i_equil]]
+    B = [B_i_equil.astype(dtype), B_im1_equil.astype(dtype)]
+    _p_im1, _p_i, _p_im1_equil, _p_i_equil, _m_im1, _m_im1_equil, _m_i, _m_i_equil = vecs
+
+    # k per element, beta and B once for everything
+    stretch = rod_math_core.get_stretch_batch(k, _p_i, _p_i_equil)
+    twist = rod_math_core.get_twist_batch(_m_im1, _m_im1_equil, _m_i, _m_i_equil, _p_im1, _p_im1_equil, _p_i, _p_i_equil, beta)
+    bend, omega, omega_equil = rod_math_core.get_bend_batch(*(vecs + B))
+
+    for result in [stretch, twist, bend, omega, omega_equil]:
+        if result.dtype != dtype or result.shape[:2] != p_i.shape[:2]:
+            print("Batched result is %s %s, expected %s %s" % (result.dtype, result.shape, dtype.__name__, p_i.shape[:2]))
+            sys.exit(1)
+
+    for frame in range(num_frames):
+        for element in range(num_elements - 1):
+            single = [vec[frame][element] for vec in vecs]
+            check("stretch energy", dtype, stretch[frame][element], rod_math_core.get_stretch_32(k[frame][element], single[1], single[3]), frame, element)
+            check("twist energy", dtype, twist[frame][element], rod_math_core.get_twist_32(single[4], single[5], single[6], single[7], single[0], single[2], single[1], single[3], beta), frame, element)
+            single_bend, single_omega, single_omega_equil = rod_math_core.get_bend_32(*(single + B))
+            check("bend energy", dtype, bend[frame][element], single_bend, frame, element)
+            check("omega", dtype, omega[frame][element], single_omega, frame, element)
+            check("omega_equil", dtype, omega_equil[frame][element], single_omega_equil, frame, element)
+
+sys.exit(0)
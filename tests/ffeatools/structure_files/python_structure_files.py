@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+"""
+Round trip the structure files (.node, .top, .surf, .mat, .stokes, .pin)
+through the bulk loaders and writers, and check that badly formatted files
+are still reported at the right line.
+"""
+
+import sys
+import numpy as np
+
+try:
+    import FFEA_node, FFEA_topology, FFEA_surface, FFEA_material, FFEA_stokes, FFEA_pin
+    from FFEA_exceptions import FFEAFormatError
+except ImportError:
+    print("Failure to import FFEA modules")
+    sys.exit(1) # failure to import
+
+node = FFEA_node.FFEA_node("veryFine.node")
+top = FFEA_topology.FFEA_topology("veryFine.top")
+surf = FFEA_surface.FFEA_surface("veryFine.surf")
+mat = FFEA_material.FFEA_material("veryFine.mat")
+stokes = FFEA_stokes.FFEA_stokes("veryFine.stokes")
+pin = FFEA_pin.FFEA_pin()
+pin.add_pinned_node(3)
+pin.add_pinned_node(14)
+
+# Write each one out, read it back in and write it again: the two writes must match
+structures = [(node, FFEA_node.FFEA_node, "node"), (top, FFEA_topology.FFEA_topology, "top"), (surf, FFEA_surface.FFEA_surface, "surf"),
+              (mat, FFEA_material.FFEA_material, "mat"), (stokes, FFEA_stokes.FFEA_stokes, "stokes"), (pin, FFEA_pin.FFEA_pin, "pin")]
+for structure, cls, ext in structures:
+    structure.write_to_file("out." + ext)
+    cls("out." + ext).write_to_file("out2." + ext)
+    if open("out." + ext).read() != open("out2." + ext).read():
+        print("Writing and reading a ." + ext + " file changed it")
+        sys.exit(1)
+
+if not np.allclose(FFEA_node.FFEA_node("out.node").pos, node.pos, atol = 1e-6) or \
+   not np.array_equal(FFEA_topology.FFEA_topology("out.top").element_nodes, top.element_nodes) or \
+   not np.array_equal(FFEA_surface.FFEA_surface("out.surf").face_elindex, surf.face_elindex) or \
+   FFEA_pin.FFEA_pin("out.pin").index != [3, 14]:
+    print("Structure changed when written and read back in")
+    sys.exit(1)
+
+# A topology mixing linear and second order elements
+mixed = FFEA_topology.FFEA_topology()
+mixed.add_elements([[0, 1, 2, 3], [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]], interior = [0, 1])
+mixed.write_to_file("mixed.top")
+if FFEA_topology.FFEA_topology("mixed.top").get_element_node_lists() != mixed.get_element_node_lists():
+    print("Mixed order topology changed when written and read back in")
+    sys.exit(1)
+
+# The second surface node is missing a coordinate
+fout = open("bad.node", "w")
+fout.write("ffea node file\nnum_nodes 3\nnum_surface_nodes 2\nnum_interior_nodes 1\nsurface nodes:\n0.0 0.0 0.0\n1.0 1.0\ninterior nodes:\n2.0 2.0 2.0\n")
+fout.close()
+try:
+    FFEA_node.FFEA_node("bad.node")
+    print("Badly formatted node file was read")
+    sys.exit(1)
+except FFEAFormatError as e:
+    if e.lin != "7":
+        print("Badly formatted node file reported at line " + e.lin + ", not 7")
+        sys.exit(1)
+
+# Lines of 3, 2 and 4 numbers add up to 3 nodes, but the second one is still missing a coordinate
+fout = open("shifted.node", "w")
+fout.write("ffea node file\nnum_nodes 4\nnum_surface_nodes 3\nnum_interior_nodes 1\nsurface nodes:\n0.0 0.0 0.0\n1.0 1.0\n2.0 2.0 2.0 2.0\ninterior nodes:\n3.0 3.0 3.0\n")
+fout.close()
+try:
+    FFEA_node.FFEA_node("shifted.node")
+    print("Node file with shifted lines was read")
+    sys.exit(1)
+except FFEAFormatError as e:
+    if e.lin != "7":
+        print("Node file with shifted lines reported at line " + e.lin + ", not 7")
+        sys.exit(1)
+
+sys.exit(0)
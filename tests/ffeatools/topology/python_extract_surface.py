@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+"""
+Extract the surfaces of a linear and a second order mesh, and check them
+against the surfaces the meshes came with: the same faces, each with the
+right element, wound as get_linear_face winds the faces of that element.
+"""
+
+import sys
+import numpy as np
+
+try:
+    import FFEA_node, FFEA_topology, FFEA_surface
+except ImportError:
+    print("Failure to import FFEA_topology")
+    sys.exit(1) # failure to import
+
+def get_face_set(faces, elindex):
+    return set(zip(np.asarray(elindex).tolist(), [tuple(f) for f in np.sort(faces, axis = 1).tolist()]))
+
+def check_winding(pos, top, surf):
+    # get_linear_face winds faces outwards for elements with a negative Jacobian, inwards otherwise
+    faces = surf.face_nodes[:,:3]
+    n = top.element_nodes[surf.face_elindex,:4]
+    out = pos[faces].mean(axis = 1) - pos[n].mean(axis = 1)
+    normal = np.cross(pos[faces[:,1]] - pos[faces[:,0]], pos[faces[:,2]] - pos[faces[:,0]])
+    det = np.linalg.det(pos[n[:,1:]] - pos[n[:,:1]])
+    return np.all(np.einsum("ij,ij->i", out, normal) * det < 0)
+
+# Linear: the netgen mesh, whose surface faces don't know their elements. Find them the slow way
+top = FFEA_topology.FFEA_topology("veryFine.vol")
+node = FFEA_node.FFEA_node("veryFine.vol")
+surf = FFEA_surface.FFEA_surface("veryFine.vol")
+elements = [set(n) for n in top.element_nodes.tolist()]
+elindex = [[i for i in range(len(elements)) if set(f) <= elements[i]] for f in surf.face_nodes.tolist()]
+if any(len(i) != 1 for i in elindex):
+    print("Surface of veryFine.vol has faces that are not on exactly one element")
+    sys.exit(1)
+
+extracted = top.extract_surface()
+if extracted.face_nodes.shape[1] != 3 or extracted.num_faces != surf.num_faces:
+    print("Linear surface has %d faces of %d nodes, expected %d of 3" % (extracted.num_faces, extracted.face_nodes.shape[1], surf.num_faces))
+    sys.exit(1)
+
+if get_face_set(extracted.face_nodes, extracted.face_elindex) != get_face_set(surf.face_nodes, [i[0] for i in elindex]):
+    print("Linear surface does not match veryFine.vol")
+    sys.exit(1)
+
+if not check_winding(np.asarray(node.pos), top, extracted):
+    print("Linear surface has faces wound differently to their elements")
+    sys.exit(1)
+
+# Second order: the .surf is the 2nd order surface with each face split into 4 linear ones
+top = FFEA_topology.FFEA_topology("cyl_160_fine.top")
+node = FFEA_node.FFEA_node("cyl_160_fine.node")
+surf = FFEA_surface.FFEA_surface("cyl_160_fine.surf")
+
+extracted = top.extract_surface()
+if extracted.face_nodes.shape[1] != 6 or 4 * extracted.num_faces != surf.num_faces:
+    print("Second order surface has %d faces of %d nodes, expected %d of 6" % (extracted.num_faces, extracted.face_nodes.shape[1], surf.num_faces // 4))
+    sys.exit(1)
+
+# The midpoints must be those of the face's own edges (01, 02, 12)
+n = extracted.face_nodes
+for e in range(len(n)):
+    el = top.element_nodes[extracted.face_elindex[e]]
+    midpoint = dict(((min(el[j], el[k]), max(el[j], el[k])), el[4 + i]) for i, (j, k) in enumerate(FFEA_topology.edge_local_nodes))
+    if [midpoint[tuple(sorted([n[e][j], n[e][k]]))] for j, k in [[0,1], [0,2], [1,2]]] != n[e][3:].tolist():
+        print("Second order face %d has the wrong midpoints" % (e))
+        sys.exit(1)
+
+split = n[:,FFEA_topology.split_face_local_nodes].reshape(-1, 3)
+if get_face_set(split, np.repeat(extracted.face_elindex, 4)) != get_face_set(surf.face_nodes, surf.face_elindex):
+    print("Split second order surface does not match cyl_160_fine.surf")
+    sys.exit(1)
+
+if not check_winding(np.asarray(node.pos), top, extracted):
+    print("Second order surface has faces wound differently to their elements")
+    sys.exit(1)
+
+sys.exit(0)
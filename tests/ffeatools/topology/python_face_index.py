@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+"""
+Find the elements of surface faces with the face index of a topology,
+including faces it does not know, and sort the elements into interior and
+surface ones with a surface, keeping the surface pointing at the right
+elements.
+"""
+
+import sys
+import numpy as np
+
+try:
+    import FFEA_topology, FFEA_surface
+except ImportError:
+    print("Failure to import FFEA_topology")
+    sys.exit(1) # failure to import
+
+def fail(message):
+    print(message)
+    sys.exit(1)
+
+def on_element(top, surf):
+    # Whether the nodes of each face with a known element are nodes of that element
+    return all(e == -1 or set(f) <= set(top.element_nodes[e].tolist()) for f, e in zip(surf.face_nodes.tolist(), surf.face_elindex.tolist()))
+
+# veryFine is a second order mesh, and its surface the 2nd order faces split into 4
+top = FFEA_topology.FFEA_topology("veryFine.top")
+surf = FFEA_surface.FFEA_surface("veryFine.surf")
+index = top.get_face_index()
+known = surf.face_elindex.copy()
+
+# Faces are found whatever their winding and whichever node they start at. Shared ones are
+# given to the lower of their two elements, so never to a higher one than the element asked about
+faces = top.element_nodes[:,FFEA_topology.face_local_nodes[0]]
+for f in [faces, faces[:,::-1], np.roll(faces, 1, axis = 1)]:
+    elements = index.get_elements(f)
+    on_elements = [set(a) <= set(b) for a, b in zip(f.tolist(), top.element_nodes[elements,:4].tolist())]
+    if np.any(elements > np.arange(top.num_elements)) or not all(on_elements):
+        fail("Element faces are not found in their elements")
+
+shared = np.flatnonzero(index.counts == 2)[0]
+a, b = index.order[index.first[shared]] // 4, index.order[index.first[shared] + 1] // 4
+if index.get_elements([index.keys[shared]])[0] != min(a, b):
+    fail("Shared face is not given to the lower element")
+
+# A face of mesh nodes that no element has
+n0, n1 = top.element_nodes[0,0], top.element_nodes[0,1]
+neighbours = set(top.element_nodes[np.any(top.element_nodes[:,:4] == n0, axis = 1) & np.any(top.element_nodes[:,:4] == n1, axis = 1),:4].flatten().tolist())
+missing = [[n0, n1, [i for i in top.element_nodes[:,:4].flatten().tolist() if i not in neighbours][0]]]
+if index.find(missing)[0] != -1 or index.get_elements(missing)[0] != -1:
+    fail("A face that isn't in the mesh was found")
+
+# Surface faces whose element is unknown are found, split 2nd order faces included
+surf.face_elindex[::3] = -1
+if surf.get_element_indices(top) == -1 or not np.array_equal(surf.face_elindex, known):
+    fail("Unknown surface face elements are not found")
+
+# A face that isn't in the mesh means the surface doesn't belong to it, and no element is known
+surf.add_faces(missing, elindex = [0])
+if surf.get_element_indices(top) != -1 or np.any(surf.face_elindex != -1):
+    fail("A surface with a face not in the mesh was given elements")
+
+# Sort out the interior elements from the surface, without and with a surface
+surf = FFEA_surface.FFEA_surface("veryFine.surf")
+num_interior = top.num_interior_elements
+element_nodes = top.element_nodes.copy()
+top.element_interior[:] = -1
+top.calculateInterior()
+if top.num_interior_elements != num_interior or not np.all(top.element_interior[:num_interior] == 1) or not np.all(top.element_interior[num_interior:] == 0):
+    fail("Interior elements without a surface are wrong")
+
+# Shuffle the elements first, so that they need reordering
+order = np.random.RandomState(0).permutation(top.num_elements)
+top.set_elements(element_nodes[order])
+surf.face_elindex[:] = np.argsort(order)[surf.face_elindex]
+surf.face_elindex[::5] = -1
+if not on_element(top, surf):
+    fail("Shuffled surface does not match its elements")
+
+unknown = surf.face_elindex == -1
+top.calculateInterior(surf = surf)
+if top.num_interior_elements != num_interior or top.num_surface_elements != top.num_elements - num_interior:
+    fail("Interior elements with a surface are wrong")
+
+# Interior elements come first, and the surface still points at the elements its faces are on
+if not np.all(top.element_interior[:num_interior] == 1) or not np.all(top.element_interior[num_interior:] == 0):
+    fail("Interior elements are not first")
+
+if sorted(map(tuple, top.element_nodes.tolist())) != sorted(map(tuple, element_nodes.tolist())):
+    fail("Reordering the elements changed them")
+
+if np.any(surf.face_elindex[unknown] != -1) or not on_element(top, surf):
+    fail("Surface elements were not remapped with the elements")
+
+if not np.all(top.element_interior[surf.face_elindex[~unknown]] == 0):
+    fail("Surface faces are on interior elements")
+
+sys.exit(0)
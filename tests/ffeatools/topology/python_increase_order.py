@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+"""
+Raise a linear mesh, its nodes and its surface to second order, and check
+them against the element by element loop that increase_order used to be.
+That loop numbered the new midpoint nodes in no particular order, so the
+midpoints are compared by the edge they are on.
+"""
+
+import sys
+import numpy as np
+
+try:
+    import FFEA_node, FFEA_topology, FFEA_surface
+except ImportError:
+    print("Failure to import FFEA_topology")
+    sys.exit(1) # failure to import
+
+def fail(message):
+    print(message)
+    sys.exit(1)
+
+def increase_order_loop(elements, faces, pos):
+    # One midpoint per unique edge, then the 6 edges of each element and the 3 of each face appended in order
+    edges = sorted(set((min(n[j], n[k]), max(n[j], n[k])) for n in elements for j in range(3) for k in range(j + 1, 4)))
+    midpoint = dict((e, len(pos) + i) for i, e in enumerate(edges))
+    pos = pos + [0.5 * (pos[e[0]] + pos[e[1]]) for e in edges]
+    get = lambda a, b: midpoint[(min(a, b), max(a, b))]
+    elements = [list(n) + [get(n[j], n[k]) for j in range(3) for k in range(j + 1, 4)] for n in elements]
+
+    # Each face split as FFEA_surface.split_face does: 034, 153, 245, 354
+    split = []
+    for n in faces:
+        n = list(n) + [get(n[0], n[1]), get(n[0], n[2]), get(n[1], n[2])]
+        split += [[n[0], n[3], n[4]], [n[1], n[5], n[3]], [n[2], n[4], n[5]], [n[3], n[5], n[4]]]
+    return elements, split, pos, dict((i, e) for e, i in midpoint.items())
+
+def get_edges(n, num_linear_nodes, edge):
+    # Name every midpoint node by its edge, so that numberings can be compared
+    return [[i if i < num_linear_nodes else edge[i] for i in row] for row in np.asarray(n).tolist()]
+
+top = FFEA_topology.FFEA_topology("veryFine.vol")
+node = FFEA_node.FFEA_node("veryFine.vol")
+surf = FFEA_surface.FFEA_surface("veryFine.vol")
+surf.face_elindex[:] = np.arange(surf.num_faces)
+num_nodes = node.num_nodes
+elements, faces, pos, edge_loop = increase_order_loop(top.element_nodes.tolist(), surf.face_nodes.tolist(), list(np.asarray(node.pos)))
+
+top.increase_order(node = node, surf = surf)
+if top.get_order() != 2 or node.num_nodes != len(pos) or len(node.pos) != len(pos):
+    fail("Expected %d nodes in a second order mesh, found %d" % (len(pos), node.num_nodes))
+
+# Each new node is on an edge of the mesh, and every edge has one
+edge = {}
+for n in top.element_nodes.tolist():
+    for i, (j, k) in enumerate(FFEA_topology.edge_local_nodes):
+        e = (min(n[j], n[k]), max(n[j], n[k]))
+        if edge.setdefault(n[4 + i], e) != e:
+            fail("Node %d is the midpoint of two edges" % (n[4 + i]))
+
+if sorted(edge.keys()) != list(range(num_nodes, len(pos))):
+    fail("The new nodes are not all midpoints of edges")
+
+for i, e in edge.items():
+    if not np.allclose(node.pos[i], 0.5 * (node.pos[e[0]] + node.pos[e[1]]), rtol = 0, atol = 1e-12):
+        fail("Node %d is not at the midpoint of its edge" % (i))
+
+if get_edges(top.element_nodes, num_nodes, edge) != get_edges(elements, num_nodes, edge_loop):
+    fail("Element nodes are not laid out as corners then midpoints of edges 01, 02, 03, 12, 13, 23")
+
+if get_edges(surf.face_nodes, num_nodes, edge) != get_edges(faces, num_nodes, edge_loop):
+    fail("Split surface differs")
+
+if not np.array_equal(surf.face_elindex, np.repeat(np.arange(surf.num_faces // 4), 4)):
+    fail("Split faces lost their elements")
+
+# Raising the order again does nothing
+top.increase_order(node = node, surf = surf)
+if node.num_nodes != len(pos) or top.element_nodes.shape[1] != 10:
+    fail("Raised the order of a second order mesh")
+
+# A surface face with an edge that isn't in the mesh
+top = FFEA_topology.FFEA_topology("veryFine.vol")
+surf = FFEA_surface.FFEA_surface("veryFine.vol")
+surf.add_faces([[top.element_nodes[0,0], top.element_nodes[0,1], top.element_nodes[:,:4].max() + 1]])
+try:
+    top.increase_order(surf = surf)
+    fail("Surface with an edge that isn't in the mesh was raised")
+except KeyError:
+    pass
+
+sys.exit(0)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# 
+#  This file is part of the FFEA simulation package
+#  
+#  Copyright (c) by the Theory and Development FFEA teams,
+#  as they appear in the README.md file. 
+# 
+#  FFEA is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+# 
+#  FFEA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+# 
+#  You should have received a copy of the GNU General Public License
+#  along with FFEA.  If not, see <http://www.gnu.org/licenses/>.
+# 
+#  To help us fund FFEA development, we humbly ask that you cite 
+#  the research papers on the package.
+#
+
+"""
+Elements, faces and nodes are kept in arrays, and the FFEA_element and
+FFEA_face objects are views of their rows. Check that reading and writing
+through the views goes to the arrays, and that views held while the arrays
+grow stay attached.
+"""
+
+import sys
+import numpy as np
+
+try:
+    import FFEA_node, FFEA_topology, FFEA_surface
+except ImportError:
+    print("Failure to import FFEA_topology")
+    sys.exit(1) # failure to import
+
+def fail(message):
+    print(message)
+    sys.exit(1)
+
+# Two tetrahedra sharing the face 1 2 3
+node = FFEA_node.FFEA_node()
+node.add_nodes([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0], [1.0, 1.0, 1.0]])
+top = FFEA_topology.FFEA_topology()
+top.add_elements([[0, 1, 2, 3], [4, 1, 3, 2]])
+
+# Reading and writing through element views
+e = top.element[1]
+if list(e.n) != [4, 1, 3, 2] or e.interior != None or not isinstance(e, FFEA_topology.FFEA_element_tet_lin):
+    fail("Element view does not read its row")
+
+e.n[0] = 4
+e.n = [4, 1, 2, 3]
+e.interior = False
+if top.element_nodes[1].tolist() != [4, 1, 2, 3] or top.element_interior[1] != 0:
+    fail("Element view does not write to its row")
+
+el = FFEA_topology.FFEA_element_tet_lin()
+el.n = [4, 2, 1, 3]
+el.interior = True
+top.element[1] = el
+if top.element_nodes[1].tolist() != [4, 2, 1, 3] or top.element_interior[1] != 1 or el.top != None:
+    fail("Assigning an element does not copy it into the arrays")
+
+# A view held while elements are added, past the size of the buffer, and while they become second order
+held = top.element[0]
+for i in range(100):
+    top.add_element(FFEA_topology.FFEA_element_tet_lin())
+top.set_element_nodes(0, list(range(10)))
+if top.num_elements != 102 or list(held.n) != list(range(10)) or not isinstance(top.element[0], FFEA_topology.FFEA_element_tet_sec):
+    fail("Element view lost its row when the arrays grew")
+
+held.n[9] = 42
+if top.element_nodes[0,9] != 42 or len(top.element[1].n) != 4 or len(top.element[-1].n) != 4:
+    fail("Element views of a mixed topology are wrong")
+
+if len(top.element) != 102 or len(list(top.element)) != 102 or len(top.element[1:3]) != 2 or top.element[-1].index != 101:
+    fail("Element list does not match the arrays")
+
+try:
+    top.element[102]
+    fail("Element past the end was found")
+except IndexError:
+    pass
+
+# Faces, the same
+surf = FFEA_surface.FFEA_surface()
+surf.add_faces([[0, 2, 1], [0, 1, 3]], elindex = [0, -1])
+f = surf.face[1]
+if list(f.n) != [0, 1, 3] or f.elindex != None or surf.face[0].elindex != 0:
+    fail("Face view does not read its row")
+
+f.n[2] = 4
+f.elindex = 1
+if surf.face_nodes[1].tolist() != [0, 1, 4] or surf.face_elindex[1] != 1:
+    fail("Face view does not write to its row")
+
+held = surf.face[0]
+surf.add_faces([[0, 3, 2]] * 50)
+surf.set_face_nodes(0, [0, 2, 1, 5, 6, 7])
+if list(held.n) != [0, 2, 1, 5, 6, 7] or not isinstance(surf.face[0], FFEA_surface.FFEA_face_tri_sec) or list(surf.face[1].n) != [0, 1, 4]:
+    fail("Face view lost its row when the arrays grew")
+
+surf.split_face(0)
+if surf.num_faces != 55 or [list(f.n) for f in surf.face[-4:]] != [[0, 5, 6], [2, 7, 5], [1, 6, 7], [5, 7, 6]] or not np.all(surf.face_elindex[-4:] == 0):
+    fail("Splitting a face went wrong")
+
+# Nodes: rows of pos taken before it grows keep the values, and the grown pos has both old and new
+pos = node.pos
+row = node.pos[1]
+node.pos[1] = [2.0, 0.0, 0.0]
+for i in range(20):
+    node.add_node([float(i), 0.0, 0.0])
+if node.num_nodes != 25 or len(node.pos) != 25 or not np.array_equal(node.pos[1], [2.0, 0.0, 0.0]) or not np.array_equal(row, [2.0, 0.0, 0.0]) or not np.array_equal(node.pos[-1], [19.0, 0.0, 0.0]) or len(pos) != 5:
+    fail("Node positions went wrong as they grew")
+
+# pos replaced by a plain list is taken back into the buffer
+node.pos = node.pos.tolist()
+node.add_node([0.0, 0.0, 0.0])
+if not isinstance(node.pos, np.ndarray) or node.pos.shape != (26, 3) or not np.array_equal(node.pos[1], [2.0, 0.0, 0.0]):
+    fail("Node positions set to a list were not taken back")
+
+# The first face points into its element, so it and the element swap nodes 1 and 2. A face without an element can't be checked
+node.pos[1] = [1.0, 0.0, 0.0]
+top = FFEA_topology.FFEA_topology()
+top.add_elements([[0, 1, 2, 3], [4, 1, 3, 2]])
+surf = FFEA_surface.FFEA_surface()
+surf.add_faces([[0, 1, 2], [4, 3, 1]], elindex = [0, 1])
+surf.check_normals(node, top)
+if surf.face_nodes.tolist() != [[0, 2, 1], [4, 3, 1]] or top.element_nodes.tolist() != [[0, 2, 1, 3], [4, 1, 3, 2]]:
+    fail("Normals were not turned out of their elements")
+
+surf.add_faces([[0, 1, 3]])
+try:
+    surf.check_normals(node, top)
+    fail("Normal of a face without an element was checked")
+except ValueError:
+    pass
+
+sys.exit(0)